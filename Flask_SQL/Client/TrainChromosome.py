@@ -2,12 +2,12 @@ import argparse
 import json
 import numpy as np
 import os
-import requests
 import socket
 
 from vaelstmpredictor.vae_dense_predictor.GeneticAlgorithm import *
+from vaelstmpredictor.utils.ga_client import WorkQueue, Heartbeat, submit_results
 
-from time import time, sleep
+from time import time
 
 import warnings
 with warnings.catch_warnings():
@@ -29,6 +29,13 @@ def info_message(message): print('[INFO] {}'.format(message))
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
+    parser.add_argument('--sql_server',
+                        default='philippesaade11.pythonanywhere.com',
+                        help='The URL or IP of the SQL server')
+    parser.add_argument('--prefetch', type=int, default=1,
+                        help='Number of chromosomes to claim per request to the server')
+    parser.add_argument('--heartbeat', type=float, default=60,
+                        help='Seconds between lease renewals while training')
     clargs = parser.parse_args()
 
     for key, val in clargs.__dict__.items():
@@ -41,18 +48,17 @@ if __name__ == '__main__':
     hostname = s.getsockname()[0]
     s.close()
 
+    base_url = clargs.sql_server
+
+    work_queue = WorkQueue(base_url, worker=hostname, prefetch=clargs.prefetch)
+
     while True:
-        try:
-            chromosome = requests.get(
-                url="http://philippesaade11.pythonanywhere.com/GetUnTrainedChrom")
-        except:
-            chromosome = None
-        if(chromosome != None and chromosome.text == "0"):
-            info_message("No more Chromosomes to train")
-            sleep(30)
-        elif(chromosome != None):
-            params = chromosome.json()
+        info_message('Grabbing Untrained Chromosome')
+        params = work_queue.get()
 
+        if(params == None):
+            info_message("No more Chromosomes to train")
+        else:
             clargs.batch_size = params["batch_size"]
             clargs.chromosomeID = params["chromosomeID"]
             clargs.cross_prob = params["cross_prob"]
@@ -138,13 +144,23 @@ if __name__ == '__main__':
             try:
                 chromosome = Chromosome(**chrom_params)
                 chromosome.verbose = True
-                chromosome.train(verbose=True)
+                # Renews the lease, without which the chromosome would be handed to another worker
+                heartbeat = Heartbeat(base_url, params['claim_id'], params['id'], interval=clargs.heartbeat)
+                heartbeat.start()
+                try:
+                    chromosome.train(verbose=True)
+                finally:
+                    heartbeat.stop()
             except Exception as e:
                 warning_message("Error has occured while training")
                 print(e)
                 chromosome = None
                 continue
 
+            if heartbeat.lost:
+                info_message('Lost the lease on the chromosome while training; its result would be ignored')
+                continue
+
             info_message('\n')
             print('Result: ', end=" ")
             print('GenerationID: {}'.format(chromosome.generationID), end=" ")
@@ -156,12 +172,5 @@ if __name__ == '__main__':
             params["hostname"] = clargs.hostname
             params["time_stamp"] = clargs.time_stamp
 
-            sent = False
-            while(not sent):
-                try:
-                    resp = requests.get(
-                        url="http://philippesaade11.pythonanywhere.com/AddChrom", params=params)
-                    info_message("Response: " + resp.text)
-                    sent = (resp.text == "1")
-                except:
-                    sent = False
+            resp = submit_results(base_url, [params])
+            info_message("Response: " + json.dumps(resp))
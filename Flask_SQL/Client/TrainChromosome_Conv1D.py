@@ -2,12 +2,12 @@ import argparse
 import json
 import numpy as np
 import os
-import requests
 import socket
 
 from vaelstmpredictor.vae_conv1d_predictor.GeneticAlgorithm import *
+from vaelstmpredictor.utils.ga_client import WorkQueue, Heartbeat, submit_results
 
-from time import time, sleep
+from time import time
 
 import warnings
 with warnings.catch_warnings():
@@ -36,6 +36,10 @@ if __name__ == '__main__':
     parser.add_argument('--sql_server',
                         default='LAUDeepGenerativeGenetics.pythonanywhere.com',
                         help='The URL or IP of the SQL server')
+    parser.add_argument('--prefetch', type=int, default=1,
+                        help='Number of chromosomes to claim per request to the server')
+    parser.add_argument('--heartbeat', type=float, default=60,
+                        help='Seconds between lease renewals while training')
     clargs = parser.parse_args()
 
     for key, val in clargs.__dict__.items():
@@ -50,24 +54,15 @@ if __name__ == '__main__':
     hostname = s.getsockname()[0]
     s.close()
 
+    work_queue = WorkQueue(base_url, worker=hostname, prefetch=clargs.prefetch)
+
     while True:
-        try:
-            info_message('Grabbing Untrained Chromosome')
-            chromosome = requests.get(
-                url="http://{}/GetUnTrainedChrom".format(base_url))
-        except:
-            chromosome = None
-
-        if(chromosome != None and chromosome.text == "0"):
-            info_message("No more Chromosomes to train")
-            sleep(30)
-        elif(chromosome != None):
-            try:
-                info_message('Accessing Params from Untrained Chromosome')
-                params = chromosome.json()
-            except:
-                continue
+        info_message('Grabbing Untrained Chromosome')
+        params = work_queue.get()
 
+        if(params == None):
+            info_message("No more Chromosomes to train")
+        else:
             clargs.batch_size = params["batch_size"]
             clargs.chromosomeID = params["chromosomeID"]
             clargs.cross_prob = params["cross_prob"]
@@ -182,7 +177,13 @@ if __name__ == '__main__':
 
                 chromosome.model.summary()
                 # break
-                chromosome.train(verbose=True)
+                # Renews the lease, without which the chromosome would be handed to another worker
+                heartbeat = Heartbeat(base_url, params['claim_id'], params['id'], interval=clargs.heartbeat)
+                heartbeat.start()
+                try:
+                    chromosome.train(verbose=True)
+                finally:
+                    heartbeat.stop()
                 K.clear_session()
 
                 end_time = time()
@@ -198,6 +199,10 @@ if __name__ == '__main__':
                 chromosome = None
                 continue
 
+            if heartbeat.lost:
+                info_message('Lost the lease on the chromosome while training; its result would be ignored')
+                continue
+
             info_message('\n')
             print('Result: ', end=" ")
             print('GenerationID: {}'.format(chromosome.generationID), end=" ")
@@ -220,13 +225,5 @@ if __name__ == '__main__':
             params["end_time"] = end_time
             params["run_time"] = run_time
 
-            sent = False
-            while(not sent):
-                try:
-                    resp = requests.get(
-                        url="http://{}/AddChrom".format(base_url),
-                        params=params)
-                    info_message("Response: " + resp.text)
-                    sent = (resp.text == "1")
-                except:
-                    sent = False
+            resp = submit_results(base_url, [params])
+            info_message("Response: " + json.dumps(resp))
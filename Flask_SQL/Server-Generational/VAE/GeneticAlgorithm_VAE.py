@@ -1,13 +1,16 @@
 import sys, os.path
 sys.path.append(os.path.abspath('../'))
 
-from database import db, Chromosome
+from database import Chromosome, split_arrays, unpack_arrays
+from storage import storage
+from population import mutation_rows, mutate_values, mutate_layers, mutate_elements, mark_mutated
+from population import cross_over as cross_over_population
+from selection import select_parents
 import numpy as np
 import pandas as pd
 from numpy import random
-from time import sleep
-from flask import json
 import os
+from time import time
 
 import warnings
 with warnings.catch_warnings():
@@ -31,6 +34,12 @@ def warning_message(message, end = '\n'):
 def info_message(message, end = '\n'):
     print('[INFO] {}'.format(message), end = end)
 
+# Array genes, by the layer count column that sizes them
+LAYERS = {'num_conv_layers': ['size_kernel', 'size_pool', 'size_filter']}
+# Columns of a trained chromosome's result, which a child with the same genes takes over
+RESULT_COLUMNS = ['fitness', 'hostname', 'start_time', 'end_time', 'run_time', 'info',
+                  'val_vae_reconstruction_loss', 'val_vae_latent_args_loss', 'val_dnn_latent_args_loss', 'val_dnn_predictor_layer_loss']
+
 def create_blank_dataframe(generationID, population_size):
 
     generation = pd.DataFrame()
@@ -69,6 +78,13 @@ def create_blank_dataframe(generationID, population_size):
     generation['vae_weight'] = np.float32(zeros)
     generation['w_kl_anneal'] = zeros
     generation['info'] = ['']*population_size
+    # Lineage recorded while breeding (-1: no parent), saved to the Lineage table
+    generation['parent1'] = zeros - 1
+    generation['parent2'] = zeros - 1
+    generation['parent1_generation'] = zeros - 1
+    generation['parent2_generation'] = zeros - 1
+    generation['operation'] = ['']*population_size
+    generation['mutated'] = zeros
     generation['val_vae_reconstruction_loss'] = np.float32(zeros)
     generation['val_vae_latent_args_loss'] = np.float32(zeros)
     generation['val_dnn_latent_args_loss'] = np.float32(zeros)
@@ -164,434 +180,184 @@ def generate_random_chromosomes(population_size, clargs, geneationID = 0,
     generation['dropout_rate'] = loguniform(low=min_dropout, high=max_dropout,
                                                         size = population_size, dtype=float)
 
-    for i in range(population_size):
-        generation.set_value(i, "size_kernel",  loguniform(low=min_kernel_size, high=max_kernel_size, size = (generation.loc[i, 'num_conv_layers'])))
-        generation.set_value(i, "size_pool",  loguniform(low=min_pool_size, high=max_pool_size, size = (generation.loc[i, 'num_conv_layers'])))
-        generation.set_value(i, "size_filter",  loguniform(low=min_filter_size, high=max_filter_size, size = (generation.loc[i, 'num_conv_layers'])))
+    # Array genes drawn for the whole population at once, then cut to each num_conv_layers
+    num_conv_layers = generation['num_conv_layers'].values
+    shape = (population_size, num_conv_layers.max(initial=0))
+    generation['size_kernel'] = split_arrays(loguniform(low=min_kernel_size, high=max_kernel_size, size=shape), num_conv_layers)
+    generation['size_pool'] = split_arrays(loguniform(low=min_pool_size, high=max_pool_size, size=shape), num_conv_layers)
+    generation['size_filter'] = split_arrays(loguniform(low=min_filter_size, high=max_filter_size, size=shape), num_conv_layers)
 
     return generation
 
 def loguniform(low=0, high=1, size=None, dtype=int):
     return np.exp(np.random.uniform(np.log(low+1), np.log(high+1), size)).astype(dtype) -1
 
-def train_generation(generation, clargs, verbose=False, sleep_time=30, save_DB=True):
-    generationID = generation['generationID'][0]
+def train_generation(generation, clargs, verbose=False, sleep_time=30, save_DB=True, deadline=None):
+    generationID = int(generation['generationID'][0])
     print("Generation has "+str(len(generation))+" Chromosome")
 
     if(save_DB):
-        for chromosome in generation.itertuples():
-            print("Chromosome ID: "+str(chromosome.chromosomeID))
-            chromosomeID = chromosome.chromosomeID
-            generationID = chromosome.generationID #Get Global Generation ID
-            fitness = chromosome.fitness
-            run_name = clargs.run_name
-            predictor_type = clargs.predictor_type
-            batch_size = clargs.batch_size
-            optimizer = clargs.optimizer
-            num_epochs = clargs.num_epochs
-            dnn_weight = chromosome.dnn_weight
-            vae_weight = chromosome.vae_weight
-            vae_kl_weight = chromosome.vae_kl_weight
-            dnn_kl_weight = chromosome.dnn_kl_weight
-            prediction_log_var_prior = clargs.prediction_log_var_prior
-            patience = clargs.patience
-            kl_anneal = clargs.kl_anneal
-            w_kl_anneal = clargs.w_kl_anneal
-            dnn_log_var_prior = clargs.dnn_log_var_prior
-            log_dir = clargs.log_dir
-            model_dir = clargs.model_dir
-            table_dir = clargs.table_dir
-            train_file = clargs.train_file
-            cross_prob = clargs.cross_prob
-            mutate_prob = clargs.mutate_prob
-            population_size = clargs.population_size
-            num_generations = clargs.num_generations
-            start_time = chromosome.start_time
-            end_time = chromosome.end_time
-            run_time = chromosome.end_time - chromosome.start_time
-            hostname = clargs.hostname
-            val_vae_reconstruction_loss = chromosome.val_vae_reconstruction_loss
-            val_vae_latent_args_loss = chromosome.val_vae_latent_args_loss
-            val_dnn_latent_args_loss = chromosome.val_dnn_latent_args_loss
-            val_dnn_predictor_layer_loss = chromosome.val_dnn_predictor_layer_loss
-            num_vae_layers = chromosome.num_vae_layers
-            num_dnn_layers = chromosome.num_dnn_layers
-            size_vae_latent = chromosome.size_vae_latent
-            size_vae_hidden = chromosome.size_vae_hidden
-            size_dnn_hidden = chromosome.size_dnn_hidden
-            num_conv_layers = chromosome.num_conv_layers
-            size_kernel = json.dumps(chromosome.size_kernel.tolist())
-            size_pool = json.dumps(chromosome.size_pool.tolist())
-            size_filter = json.dumps(chromosome.size_filter.tolist())
-            l1_coef = chromosome.l1_coef
-            l2_coef = chromosome.l2_coef
-            dropout_rate = chromosome.dropout_rate
-            info = chromosome.info
-
-            c = db.session.query(Chromosome).filter(Chromosome.chromosomeID == chromosomeID, Chromosome.generationID == generationID).first()
-            if(c == None):
-                chrom = Chromosome(chromosomeID = chromosomeID,
-                                    generationID = generationID,
-                                    fitness = fitness,
-                                    run_name = run_name,
-                                    predictor_type = predictor_type,
-                                    batch_size = batch_size,
-                                    optimizer = optimizer,
-                                    num_epochs = num_epochs,
-                                    dnn_weight = dnn_weight,
-                                    vae_weight = vae_weight,
-                                    vae_kl_weight = vae_kl_weight,
-                                    dnn_kl_weight = dnn_kl_weight,
-                                    prediction_log_var_prior = prediction_log_var_prior,
-                                    patience = patience,
-                                    kl_anneal = kl_anneal,
-                                    w_kl_anneal = w_kl_anneal,
-                                    dnn_log_var_prior = dnn_log_var_prior,
-                                    log_dir = log_dir,
-                                    model_dir = model_dir,
-                                    table_dir = table_dir,
-                                    train_file = train_file,
-                                    cross_prob = cross_prob,
-                                    mutate_prob = mutate_prob,
-                                    population_size = population_size,
-                                    num_generations = num_generations,
-                                    start_time = start_time,
-                                    end_time = end_time,
-                                    run_time = run_time,
-                                    hostname = hostname,
-                                    val_vae_reconstruction_loss = val_vae_reconstruction_loss,
-                                    val_vae_latent_args_loss = val_vae_latent_args_loss,
-                                    val_dnn_latent_args_loss = val_dnn_latent_args_loss,
-                                    val_dnn_predictor_layer_loss = val_dnn_predictor_layer_loss,
-                                    num_vae_layers = num_vae_layers,
-                                    num_dnn_layers = num_dnn_layers,
-                                    size_vae_latent = size_vae_latent,
-                                    size_vae_hidden = size_vae_hidden,
-                                    size_dnn_hidden = size_dnn_hidden,
-                                    num_conv_layers = num_conv_layers,
-                                    size_kernel = size_kernel,
-                                    size_pool = size_pool,
-                                    size_filter = size_filter,
-                                    info = info,
-                                    l1_coef = l1_coef,
-                                    l2_coef = l2_coef,
-                                    dropout_rate = dropout_rate)
-                db.session.add(chrom)
-            else :
-                c.fitness = fitness
-                c.run_name = run_name
-                c.predictor_type = predictor_type
-                c.batch_size = batch_size
-                c.optimizer = optimizer
-                c.num_epochs = num_epochs
-                c.dnn_weight = dnn_weight
-                c.vae_weight = vae_weight
-                c.vae_kl_weight = vae_kl_weight
-                c.dnn_kl_weight = dnn_kl_weight
-                c.prediction_log_var_prior = prediction_log_var_prior
-                c.patience = patience
-                c.kl_anneal = kl_anneal
-                c.w_kl_anneal = w_kl_anneal
-                c.dnn_log_var_prior = dnn_log_var_prior
-                c.log_dir = log_dir
-                c.model_dir = model_dir
-                c.table_dir = table_dir
-                c.train_file = train_file
-                c.cross_prob = cross_prob
-                c.mutate_prob = mutate_prob
-                c.population_size = population_size
-                c.num_generations = num_generations
-                c.start_time = start_time
-                c.end_time = end_time
-                c.run_time = run_time
-                c.hostname = hostname
-                c.val_vae_reconstruction_loss = val_vae_reconstruction_loss
-                c.val_vae_latent_args_loss = val_vae_latent_args_loss
-                c.val_dnn_latent_args_loss = val_dnn_latent_args_loss
-                c.val_dnn_predictor_layer_loss = val_dnn_predictor_layer_loss
-                c.num_vae_layers = num_vae_layers
-                c.num_dnn_layers = num_dnn_layers
-                c.size_vae_latent = size_vae_latent
-                c.size_vae_hidden = size_vae_hidden
-                c.size_dnn_hidden = size_dnn_hidden
-                c.num_conv_layers = num_conv_layers
-                c.size_kernel = size_kernel
-                c.size_pool = size_pool
-                c.size_filter = size_filter
-                c.l1_coef = l1_coef
-                c.l2_coef = l2_coef
-                c.dropout_rate = dropout_rate
-                c.info = info
-            db.session.commit()
-
-    while True:
-        print("Waiting for Chromosomes to be Trained in Generation "+str(generationID))
-        sleep(sleep_time)
-        c = db.session.query(Chromosome).filter(Chromosome.generationID == generationID, Chromosome.isTrained != 2).first()
-        db.session.commit()
-        print(c)
-        if c == None:
-            print("All Chromosomes for Generation {} have been Trained".format(generationID))
-            break
+        # Run settings are the same for every row
+        constants = dict(run_name = clargs.run_name,
+                         predictor_type = clargs.predictor_type,
+                         batch_size = clargs.batch_size,
+                         optimizer = clargs.optimizer,
+                         num_epochs = clargs.num_epochs,
+                         prediction_log_var_prior = clargs.prediction_log_var_prior,
+                         patience = clargs.patience,
+                         kl_anneal = clargs.kl_anneal,
+                         w_kl_anneal = clargs.w_kl_anneal,
+                         dnn_log_var_prior = clargs.dnn_log_var_prior,
+                         log_dir = clargs.log_dir,
+                         model_dir = clargs.model_dir,
+                         table_dir = clargs.table_dir,
+                         train_file = clargs.train_file,
+                         cross_prob = clargs.cross_prob,
+                         mutate_prob = clargs.mutate_prob,
+                         population_size = clargs.population_size,
+                         num_generations = clargs.num_generations,
+                         hostname = clargs.hostname)
+        # The rest comes from the generation, written in one upsert
+        columns = ['chromosomeID', 'generationID', 'isTrained', 'fitness', 'dnn_weight', 'vae_weight', 'vae_kl_weight', 'dnn_kl_weight',
+                   'start_time', 'end_time', 'val_vae_reconstruction_loss', 'val_vae_latent_args_loss',
+                   'val_dnn_latent_args_loss', 'val_dnn_predictor_layer_loss', 'num_vae_layers', 'num_dnn_layers',
+                   'size_vae_latent', 'size_vae_hidden', 'size_dnn_hidden', 'num_conv_layers', 'size_kernel',
+                   'size_pool', 'size_filter', 'info', 'l1_coef', 'l2_coef', 'dropout_rate']
+        rows = generation[columns].assign(run_time = generation.end_time - generation.start_time)
+        storage.save_generation(rows.to_dict('records'), constants)
+        print("Saved {} Chromosomes of Generation {}".format(len(rows), generationID))
+
+        # Parent edges of a bred generation; the random first generation has none
+        edges = [dict(chromosomeID=int(chromosome.chromosomeID), parent_generationID=int(parent_generationID),
+                      parent_chromosomeID=int(parentID), operation=chromosome.operation, mutated=int(chromosome.mutated))
+                 for chromosome in generation.itertuples()
+                 for parent_generationID, parentID in sorted(set([(chromosome.parent1_generation, chromosome.parent1),
+                                                                  (chromosome.parent2_generation, chromosome.parent2)]))
+                 if parentID >= 0]
+        if(len(edges) > 0):
+            storage.replace_lineage(clargs.run_name, int(generationID), edges)
+
+    # Wakes as soon as the share `clargs.quorum` of the generation is trained (all of it by default);
+    # `sleep_time` only paces the progress messages. Rows still out at `deadline` are failed.
+    this_generation = [Chromosome.run_name == clargs.run_name, Chromosome.generationID == generationID]
+    pending = this_generation + [Chromosome.isTrained.in_([0, 1])]
+    remaining = len(generation) - int(np.ceil(clargs.quorum*len(generation)))
+    while not storage.wait_for_results(*pending, timeout=sleep_time, remaining=remaining):
+        stats = storage.generation_stats(*this_generation)[0]
+        print("Waiting for Chromosomes to be Trained in Generation {}: {trained}/{count} trained, {taken} taken".format(generationID, **stats))
+        if(deadline is not None and time() >= deadline):
+            print("Failed {} Chromosomes of Generation {} past the straggler timeout".format(storage.fail_chromosomes(*pending), generationID))
+
+    trained = read_generation(clargs.run_name, generationID, generation['chromosomeID'])
+    assert(trained['isTrained'].isin([0, 1]).sum() <= remaining), "Finished training yet too many chromosomes are not trained"
+    if(trained['isTrained'].isin([0, 1]).any()):
+        print("{} of {} Chromosomes for Generation {} have been Trained; the rest finish in the background".format(
+            (trained['isTrained'] == 2).sum(), len(trained), generationID))
+    else:
+        print("All Chromosomes for Generation {} have been Trained".format(generationID))
     print("Create Generation "+str(generationID +1))
 
-    for chrom in generation.itertuples():
-        sql_chrom = db.session.query(Chromosome).filter(Chromosome.chromosomeID == chrom.chromosomeID, Chromosome.generationID == generationID).first()
-        assert(sql_chrom.isTrained == 2), "Finished training yet there's a chromosome with isTrained != 2"
-        generation.set_value(chrom.chromosomeID, "isTrained", sql_chrom.isTrained)
-        generation.set_value(chrom.chromosomeID, "fitness", sql_chrom.fitness)
-        generation.set_value(chrom.chromosomeID, "val_dnn_latent_args_loss", sql_chrom.val_dnn_latent_args_loss)
-        generation.set_value(chrom.chromosomeID, "val_dnn_predictor_layer_loss", sql_chrom.val_dnn_predictor_layer_loss)
-        generation.set_value(chrom.chromosomeID, "val_vae_latent_args_loss", sql_chrom.val_vae_latent_args_loss)
-        generation.set_value(chrom.chromosomeID, "val_vae_reconstruction_loss", sql_chrom.val_vae_reconstruction_loss)
+    for name in ['isTrained'] + RESULT_COLUMNS:
+        generation[name] = trained[name].to_numpy()
     return generation
 
 def refactor_weights(new_generation, generation):
-    dnn_weights = []
-    dnn_kl_weights = []
-    vae_weights = []
-    vae_kl_weights = []
-    for chrom in generation.itertuples():
-        if(chrom.val_vae_reconstruction_loss > 0 and chrom.val_vae_latent_args_loss > 0 and chrom.val_dnn_latent_args_loss > 0 and chrom.val_dnn_predictor_layer_loss  > 0):
-            val_loss = chrom.val_vae_reconstruction_loss + chrom.val_vae_latent_args_loss + chrom.val_dnn_latent_args_loss + chrom.val_dnn_predictor_layer_loss
-            dnn_weight_ = val_loss / chrom.val_dnn_predictor_layer_loss
-            dnn_kl_weight_ = val_loss / chrom.val_dnn_latent_args_loss
-            vae_weight_ = val_loss / chrom.val_vae_reconstruction_loss
-            vae_kl_weight_ = val_loss / chrom.val_vae_latent_args_loss
-            dnn_weights.append(dnn_weight_)
-            dnn_kl_weights.append(dnn_kl_weight_)
-            vae_weights.append(vae_weight_)
-            vae_kl_weights.append(vae_kl_weight_)
-    dnn_weight_new = np.median(dnn_weights)
-    dnn_kl_weight_new = np.median(dnn_kl_weights)
-    vae_weight_new = np.median(vae_weights)
-    vae_kl_weight_new = np.median(vae_kl_weights)
+    # Loss weights of the children: medians over the parents that reported every loss
+    losses = np.array([generation['val_vae_reconstruction_loss'], generation['val_vae_latent_args_loss'],
+                       generation['val_dnn_latent_args_loss'], generation['val_dnn_predictor_layer_loss']], dtype=float)
+    losses = losses[:, (losses > 0).all(axis=0)]
+    val_loss = losses.sum(axis=0)
+    vae_weight_new, vae_kl_weight_new, dnn_kl_weight_new, dnn_weight_new = np.median(val_loss/losses, axis=1)
     print("Weights", dnn_weight_new, dnn_kl_weight_new, vae_weight_new, vae_kl_weight_new)
-    for chrom in new_generation.itertuples():
-        new_generation.set_value(chrom.chromosomeID, "dnn_weight", dnn_weight_new)
-        new_generation.set_value(chrom.chromosomeID, "dnn_kl_weight", dnn_kl_weight_new)
-        new_generation.set_value(chrom.chromosomeID, "vae_weight", vae_weight_new)
-        new_generation.set_value(chrom.chromosomeID, "vae_kl_weight", vae_kl_weight_new)
-
-def load_generation_from_sql(generationID, population_size):
+    new_generation['dnn_weight'][:] = dnn_weight_new
+    new_generation['dnn_kl_weight'][:] = dnn_kl_weight_new
+    new_generation['vae_weight'][:] = vae_weight_new
+    new_generation['vae_kl_weight'][:] = vae_kl_weight_new
+
+def read_generation(run_name, generationID, chromosomeIDs):
+    '''Rows `chromosomeIDs` of a generation of run `run_name`, in that
+        order, read in one query; array genes are left packed. A chromosome
+        stored more than once reads as its first row, as get_chromosome
+        would return it.'''
+    rows = storage.read_frame(Chromosome.run_name == run_name, Chromosome.generationID == generationID,
+                              order_by=[Chromosome.id])
+    return rows.drop_duplicates('chromosomeID').set_index('chromosomeID').loc[chromosomeIDs]
+
+def load_generation_from_sql(run_name, generationID, population_size):
     generation = create_blank_dataframe(generationID, population_size)
-    for chrom in generation.itertuples():
-        sql_chrom = db.session.query(Chromosome).filter(Chromosome.chromosomeID == chrom.chromosomeID, Chromosome.generationID == generationID).first()
-        generation.set_value(chrom.chromosomeID, "info", sql_chrom.info)
-        generation.set_value(chrom.chromosomeID, "l1_coef", sql_chrom.l1_coef)
-        generation.set_value(chrom.chromosomeID, "l2_coef", sql_chrom.l2_coef)
-        generation.set_value(chrom.chromosomeID, "dropout_rate", sql_chrom.dropout_rate)
-        generation.set_value(chrom.chromosomeID, "size_pool", np.array(json.loads(sql_chrom.size_pool)))
-        generation.set_value(chrom.chromosomeID, "size_filter", np.array(json.loads(sql_chrom.size_filter)))
-        generation.set_value(chrom.chromosomeID, "size_kernel", np.array(json.loads(sql_chrom.size_kernel)))
-        generation.set_value(chrom.chromosomeID, "num_conv_layers", sql_chrom.num_conv_layers)
-        generation.set_value(chrom.chromosomeID, "size_dnn_hidden", sql_chrom.size_dnn_hidden)
-        generation.set_value(chrom.chromosomeID, "size_vae_hidden", sql_chrom.size_vae_hidden)
-        generation.set_value(chrom.chromosomeID, "size_vae_latent", sql_chrom.size_vae_latent)
-        generation.set_value(chrom.chromosomeID, "num_dnn_layers", sql_chrom.num_dnn_layers)
-        generation.set_value(chrom.chromosomeID, "num_vae_layers", sql_chrom.num_vae_layers)
-        generation.set_value(chrom.chromosomeID, "val_vae_reconstruction_loss", sql_chrom.val_vae_reconstruction_loss)
-        generation.set_value(chrom.chromosomeID, "val_vae_latent_args_loss", sql_chrom.val_vae_latent_args_loss)
-        generation.set_value(chrom.chromosomeID, "val_dnn_latent_args_loss", sql_chrom.val_dnn_latent_args_loss)
-        generation.set_value(chrom.chromosomeID, "val_dnn_predictor_layer_loss", sql_chrom.val_dnn_predictor_layer_loss)
-        generation.set_value(chrom.chromosomeID, "hostname", sql_chrom.hostname)
-        generation.set_value(chrom.chromosomeID, "start_time", sql_chrom.start_time)
-        generation.set_value(chrom.chromosomeID, "end_time", sql_chrom.end_time)
-        generation.set_value(chrom.chromosomeID, "run_time", sql_chrom.run_time)
-        generation.set_value(chrom.chromosomeID, "num_generations", sql_chrom.num_generations)
-        generation.set_value(chrom.chromosomeID, "population_size", sql_chrom.population_size)
-        generation.set_value(chrom.chromosomeID, "mutate_prob", sql_chrom.mutate_prob)
-        generation.set_value(chrom.chromosomeID, "cross_prob", sql_chrom.cross_prob)
-        generation.set_value(chrom.chromosomeID, "train_file", sql_chrom.train_file)
-        generation.set_value(chrom.chromosomeID, "table_dir", sql_chrom.table_dir)
-        generation.set_value(chrom.chromosomeID, "model_dir", sql_chrom.model_dir)
-        generation.set_value(chrom.chromosomeID, "log_dir", sql_chrom.log_dir)
-        generation.set_value(chrom.chromosomeID, "dnn_log_var_prior", sql_chrom.dnn_log_var_prior)
-        generation.set_value(chrom.chromosomeID, "w_kl_anneal", sql_chrom.w_kl_anneal)
-        generation.set_value(chrom.chromosomeID, "kl_anneal", sql_chrom.kl_anneal)
-        generation.set_value(chrom.chromosomeID, "patience", sql_chrom.patience)
-        generation.set_value(chrom.chromosomeID, "prediction_log_var_prior", sql_chrom.prediction_log_var_prior)
-        generation.set_value(chrom.chromosomeID, "dnn_kl_weight", sql_chrom.dnn_kl_weight)
-        generation.set_value(chrom.chromosomeID, "vae_kl_weight", sql_chrom.vae_kl_weight)
-        generation.set_value(chrom.chromosomeID, "vae_weight", sql_chrom.vae_weight)
-        generation.set_value(chrom.chromosomeID, "dnn_weight", sql_chrom.dnn_weight)
-        generation.set_value(chrom.chromosomeID, "num_epochs", sql_chrom.num_epochs)
-        generation.set_value(chrom.chromosomeID, "optimizer", sql_chrom.optimizer)
-        generation.set_value(chrom.chromosomeID, "batch_size", sql_chrom.batch_size)
-        generation.set_value(chrom.chromosomeID, "predictor_type", sql_chrom.predictor_type)
-        generation.set_value(chrom.chromosomeID, "run_name", sql_chrom.run_name)
-        generation.set_value(chrom.chromosomeID, "isTrained", sql_chrom.isTrained)
-        generation.set_value(chrom.chromosomeID, "fitness", sql_chrom.fitness)
-
+    loaded = read_generation(run_name, generationID, generation['chromosomeID'])
+    columns = ['info', 'l1_coef', 'l2_coef', 'dropout_rate', 'num_conv_layers', 'size_dnn_hidden',
+               'size_vae_hidden', 'size_vae_latent', 'num_dnn_layers', 'num_vae_layers',
+               'val_vae_reconstruction_loss', 'val_vae_latent_args_loss', 'val_dnn_latent_args_loss',
+               'val_dnn_predictor_layer_loss', 'hostname', 'start_time', 'end_time', 'run_time',
+               'num_generations', 'population_size', 'mutate_prob', 'cross_prob', 'train_file', 'table_dir',
+               'model_dir', 'log_dir', 'dnn_log_var_prior', 'w_kl_anneal', 'kl_anneal', 'patience',
+               'prediction_log_var_prior', 'dnn_kl_weight', 'vae_kl_weight', 'vae_weight', 'dnn_weight',
+               'num_epochs', 'optimizer', 'batch_size', 'predictor_type', 'run_name', 'isTrained', 'fitness']
+    for name in columns:
+        generation[name] = loaded[name].to_numpy()
+
+    # Array genes of the whole generation, decoded together
+    for name in LAYERS['num_conv_layers']:
+        matrix, lengths = unpack_arrays(loaded[name])
+        generation[name] = split_arrays(matrix, lengths)
     return generation
 
-def select_parents(generation):
-    '''Generate two random numbers between 0 and total_fitness
-        not including total_fitness'''
-
-    min_val = np.min(generation.fitness)
-    max_val = np.max(generation.fitness)
-    total_fitness = sum(normal_fitness(generation.fitness, min_val, max_val))
-    assert(total_fitness >= 0), '`total_fitness` should not be negative'
-
-    rand_parent1 = random.random()*total_fitness
-    rand_parent2 = random.random()*total_fitness
-
-    parent1 = None
-    parent2 = None
-
-    fitness_count = 0
-    for chromosome in generation.itertuples():
-        #fitness_count += chromosome.fitness
-        fitness_count += normal_fitness(chromosome.fitness, min_val, max_val)
-
-        if(parent1 is None and fitness_count >= rand_parent1):
-            parent1 = chromosome
-        if(parent2 is None and fitness_count >= rand_parent2):
-            parent2 = chromosome
-        if(parent1 is not None and parent2 is not None):
-            break
-
-    assert(None not in [parent1, parent2]),\
-        'parent1 and parent2 must not be None:'\
-        'Currently parent1:{}\tparent2:{}'.format(parent1, parent2)
-
-    return parent1, parent2
-
-def normal_fitness(fitness, min_val, max_val):
-    normal_f = (fitness - min_val)/(max_val - min_val)
-    return normal_f*5 +1
+def collect_stragglers(run_name, stragglers, population_size):
+    '''Check on chromosomes that were still training when their generation
+        was bred from. `stragglers` lists (generationID, chromosomeIDs,
+        deadline); returns the frames of the rows trained since, to join
+        the parent pool, and the stragglers still out. Rows past their
+        deadline are marked failed.'''
+    arrived, still_out = [], []
+    for generationID, chromosomeIDs, deadline in stragglers:
+        if(deadline is not None and time() >= deadline):
+            storage.fail_chromosomes(Chromosome.run_name == run_name, Chromosome.generationID == generationID,
+                                     Chromosome.chromosomeID.in_(chromosomeIDs))
+        generation = load_generation_from_sql(run_name, generationID, population_size)
+        generation = generation[generation['chromosomeID'].isin(chromosomeIDs)]
+        if((generation['isTrained'] == 2).any()):
+            arrived.append(generation[generation['isTrained'] == 2])
+        left = generation['chromosomeID'][generation['isTrained'].isin([0, 1])].tolist()
+        if(len(left) > 0):
+            still_out.append((generationID, left, deadline))
+    return arrived, still_out
 
 def cross_over(new_generation, generation, parent1, parent2,
-                chromosomeID, param_choices, cross_prob, verbose=False):
+                param_choices, cross_prob, verbose=False):
+    '''Breed every child of `new_generation` (a Population) from the rows
+        `parent1` and `parent2` of `generation`; children that do not cross
+        over copy parent1, results included. Returns the mask of crossed
+        over children.'''
     if verbose: info_message('Crossing over with probability: {}'.format(cross_prob))
 
-    idx_parent1 = parent1.Index
-    idx_parent2 = parent2.Index
-
-    if random.random() <= cross_prob:
-        crossover_happened = True
-
-        for param in param_choices:
-            if(param in ["size_kernel", "size_pool", "size_filter"]):
-                continue
-            p1_param = generation.ix[idx_parent1, param]
-            p2_param = generation.ix[idx_parent2, param]
-
-            child_gene = random.choice([p1_param, p2_param])
-            new_generation.set_value(chromosomeID, param, child_gene)
-
-        #Merge Kernel sizes, Max Pooling layers and Filter sizes
-        num_conv_layers = new_generation.ix[chromosomeID, "num_conv_layers"]
-        parent_choises = np.random.choice([True, False], size = num_conv_layers) #Boolean array to decide whether to choose from parent1 or parent2
-
-        for array_param in ["size_kernel", "size_pool", "size_filter"]:
-            new_array = np.array([0]*num_conv_layers, dtype=int)
-            for i in range(num_conv_layers):
-                array_p1 = generation.ix[idx_parent1, array_param]
-                array_p2 = generation.ix[idx_parent2, array_param]
-                if(len(array_p1) <= i):
-                    new_array[i] = array_p2[i]
-                elif(len(array_p2) <= i):
-                    new_array[i] = array_p1[i]
-                else:
-                    new_array[i] = array_p1[i] if parent_choises[i] else array_p2[i]
-            new_generation.set_value(chromosomeID, array_param, new_array)
-
-        new_generation.set_value(chromosomeID, 'info', 'Child of '+str(parent1.chromosomeID)+' and '+str(parent2.chromosomeID))
-    else:
-        crossover_happened = False
-
-        p1_fitness = generation.ix[idx_parent1, 'fitness']
-        p2_fitness = generation.ix[idx_parent2, 'fitness']
-
-        idx_child = idx_parent1 if p1_fitness > p2_fitness else idx_parent1
-        params_copy = param_choices + ['fitness', 'hostname', 'start_time', 'end_time', 'run_time', 'isTrained',
-                                       'val_vae_reconstruction_loss', 'val_vae_latent_args_loss', 'val_dnn_latent_args_loss', 'val_dnn_predictor_layer_loss']
-        parent_p = generation.loc[idx_child, params_copy]
-        new_generation.set_value(chromosomeID, params_copy, parent_p)
-        new_generation.set_value(chromosomeID, 'info', 'Descendant of '+str(generation.loc[idx_child, 'chromosomeID']))
-
-    return crossover_happened
-
-def mutate(new_generation, chromosomeID,
-            prob, param_choices, verbose = False):
+    params_copy = RESULT_COLUMNS + ['isTrained']
+    return cross_over_population(new_generation, generation, parent1, parent2,
+                                 param_choices, cross_prob, params_copy)
 
+def mutate(new_generation, prob, param_choices, verbose = False):
+    '''Mutate the children of `new_generation` (a Population) in place:
+        each gene of `param_choices` changes with probability `prob` per
+        child. Returns the mask of mutated children.'''
+    mutated = np.zeros(len(new_generation), dtype=bool)
+    for param, (range_change, min_val) in param_choices.items():
+        rows = mutation_rows(new_generation, prob)
+        mutated[rows] = True
+
+        if(param == "num_conv_layers"):
+            # Add or remove 1 Convolution layer
+            mutate_layers(new_generation, param, rows, int(min_val))
+        elif(param in ["size_kernel", "size_pool", "size_filter"]):
+            # Choose a random index and mutate it
+            mutate_elements(new_generation, param, rows, range_change, int(min_val))
+        else:
+            mutate_values(new_generation, param, rows, range_change, int(min_val))
+
+    mark_mutated(new_generation, mutated)
     if verbose:
-        print('Mutating Child {}'.format(chromosomeID))
+        print('Mutated {} of {} Children'.format(mutated.sum(), len(mutated)))
 
-    mutation_happened = False
-    for param, (range_change, min_val) in param_choices.items():
-        if(random.random() <= prob):
-            mutation_happened = True
-
-            if(param not in ["num_conv_layers", "size_kernel", "size_pool", "size_filter"]):
-                # Compute delta_param step
-                change_p = np.random.uniform(-range_change, range_change)
-
-                # Add delta_param to param
-                current_p = new_generation.loc[chromosomeID, param] + change_p
-
-                # If param less than `min_val`, then set param to `min_val`
-                current_p = np.max([current_p, int(min_val)])
-                current_p = type(min_val)(current_p)
-
-                # All params must be integer sized: round and convert
-                new_generation.set_value(chromosomeID, param, current_p)
-            elif param == "num_conv_layers":
-                # Add or remove 1 Convolution layer
-
-                num_conv_layers = new_generation.loc[chromosomeID, "num_conv_layers"]
-                size_kernel = new_generation.loc[chromosomeID, "size_kernel"]
-                size_pool = new_generation.loc[chromosomeID, "size_pool"]
-                size_filter = new_generation.loc[chromosomeID, "size_filter"]
-
-                change_p = np.int(np.round(np.random.uniform(-1, 1)))
-                if(change_p == -1):
-                    if(num_conv_layers > 0):
-                        del_index = random.choice(range(num_conv_layers))
-                        size_kernel = np.delete(size_kernel, del_index)
-                        size_pool = np.delete(size_pool, del_index)
-                        size_filter = np.delete(size_filter, del_index)
-                        num_conv_layers -= 1
-                elif(change_p == 1):
-                    if(num_conv_layers > 0):
-                        dup_index = random.choice(range(num_conv_layers))
-                        size_kernel = np.append(size_kernel, size_kernel[dup_index])
-                        size_pool = np.append(size_pool, size_pool[dup_index])
-                        size_filter = np.append(size_filter, size_filter[dup_index])
-                    else:
-                        size_kernel = np.append(size_kernel, int(min_val))
-                        size_pool = np.append(size_pool, int(min_val))
-                        size_filter = np.append(size_filter, int(min_val))
-                    num_conv_layers += 1
-
-                new_generation.set_value(chromosomeID, "num_conv_layers", num_conv_layers)
-                new_generation.set_value(chromosomeID, "size_kernel", size_kernel)
-                new_generation.set_value(chromosomeID, "size_pool", size_pool)
-                new_generation.set_value(chromosomeID, "size_filter", size_filter)
-
-            elif param in ["size_kernel", "size_pool", "size_filter"]:
-                # Choose a random index and mutate it
-
-                num_conv_layers = new_generation.loc[chromosomeID, "num_conv_layers"]
-                array_p = new_generation.loc[chromosomeID, param]
-                if(num_conv_layers > 0):
-                    change_index = random.choice(range(num_conv_layers))
-
-                    change_p = np.random.uniform(-range_change, range_change)
-                    current_p = array_p[change_index] + change_p
-                    current_p = np.max([current_p, int(min_val)])
-                    current_p = type(min_val)(current_p)
-
-                    array_p[change_index] = current_p
-                    new_generation.set_value(chromosomeID, param, array_p)
-
-
-    if(mutation_happened):
-        new_generation.set_value(chromosomeID, 'info', new_generation.loc[chromosomeID, 'info']+" [Mutated]")
-
-    return mutation_happened
+    return mutated
 
 def activate_workers(logdir = 'train_logs',
                     git_dir = 'vaelstmpredictor',
@@ -3,13 +3,19 @@ import os.path
 sys.path.append(os.path.abspath('../'))
 
 import numpy as np
+import pandas as pd
 import socket
 from time import time
-from tqdm import tqdm
 import argparse
-from database import Variables, Chromosome, db
+from database import Chromosome
+from storage import storage
+from population import Population, find_duplicates
+from selection import nsga2_order
+from islands import emigrate, immigrate
+from surrogate import Surrogate
+from snapshot import save_snapshot, load_snapshot
 
-from GeneticAlgorithm_VAE import generate_random_chromosomes, train_generation, create_blank_dataframe, select_parents, cross_over, mutate, load_generation_from_sql, refactor_weights
+from GeneticAlgorithm_VAE import generate_random_chromosomes, train_generation, create_blank_dataframe, select_parents, cross_over, mutate, load_generation_from_sql, collect_stragglers, refactor_weights, LAYERS, RESULT_COLUMNS
 
 
 def debuge_message(message): print('[DEBUG] {}'.format(message))
@@ -107,6 +113,12 @@ if __name__ == '__main__':
                         help='Probability of crossover between generations')
     parser.add_argument('--mutate_prob', type=float, default=0.01,
                         help='Probability of mutation for each member')
+    parser.add_argument('--selection', type=str, default='roulette',
+                        choices=['roulette', 'rank', 'tournament', 'nsga2'],
+                        help='How parents are chosen by fitness; nsga2 trades fitness against '
+                        'training time, and keeps the best of the parents and their children')
+    parser.add_argument('--tournament_size', type=int, default=2,
+                        help='Chromosomes per tournament with --selection tournament or nsga2')
     parser.add_argument('--population_size', type=int, default=10,
                         help='size of the population to evolve; '
                         'preferably divisible by 2')
@@ -117,14 +129,52 @@ if __name__ == '__main__':
     parser.add_argument('--sshport', type=int, default=22,
                         help='IP port over which to ssh')
     parser.add_argument('--sleep_time', type=float, default=10,
-                        help='Time to pause in between repetitive sql queries')
+                        help='Seconds between progress messages while waiting for results')
+    parser.add_argument('--quorum', type=float, default=1.0,
+                        help='Share of a generation that must be trained before the next one '
+                        'is bred; the rest join a later parent pool as they finish')
+    parser.add_argument('--straggler_timeout', type=float, default=0,
+                        help='Seconds after which chromosomes of a generation still training '
+                        'are marked failed (0: never)')
+    parser.add_argument('--island_dir', type=str, default='',
+                        help='Directory shared by the islands of an island-model GA, each a RunGA '
+                        'with its own server and database (default: a single population)')
+    parser.add_argument('--island', type=str, default='',
+                        help='Name of this island (default: the run name)')
+    parser.add_argument('--migration_interval', type=int, default=5,
+                        help='Generations between migrations to and from the other islands')
+    parser.add_argument('--num_migrants', type=int, default=2,
+                        help='Fittest chromosomes sent to the other islands per migration')
+    parser.add_argument('--surrogate_oversample', type=int, default=1,
+                        help='Children bred per chromosome trained; a fitness model of the genomes '
+                        'trained so far picks the ones to train (1: no screening)')
+    parser.add_argument('--surrogate_kappa', type=float, default=1.0,
+                        help='Weight of the fitness model\'s uncertainty when picking children')
+    parser.add_argument('--surrogate_min_rows', type=int, default=50,
+                        help='Chromosomes trained before the fitness model is used')
+    parser.add_argument('--resample_duplicates', type=int, default=3,
+                        help='Times children with the same genes as another child are bred '
+                        'again from new parents before they are trained as they are')
+    parser.add_argument('--snapshot', type=str, default='',
+                        help='File the state of the GA is written to after every breed '
+                        '(default: snapshot_<run_name>.npz)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Carry on from the --snapshot of a stopped run, under its run name and '
+                        'with its RNG state, instead of reading the run back from the database')
     parser.add_argument('--send_back', action='store_true',
                         help='Toggle whether to send the ckpt file + population local csv')
     parser.add_argument('--save_model', action='store_true',
                         help='Save model ckpt.s and other stored values')
+    parser.add_argument('--serve_port', type=int, default=0,
+                        help='Serve the Flask app from this process on this port '
+                        '(needed with GA_STORAGE=memory)')
 
     clargs = parser.parse_args()
 
+    if clargs.serve_port:
+        from flask_app import serve_in_background
+        serve_in_background(clargs.serve_port)
+
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     s.connect(("8.8.8.8", 80))
     hostname = s.getsockname()[0]
@@ -141,6 +191,7 @@ if __name__ == '__main__':
     verbose = clargs.verbose
     sleep_time = clargs.sleep_time
 
+    snapshot = clargs.snapshot if(clargs.snapshot != '') else 'snapshot_{}.npz'.format(clargs.run_name)
     clargs.time_stamp = int(time())
     clargs.run_name = '{}_{}'.format(clargs.run_name, clargs.time_stamp)
 
@@ -148,61 +199,64 @@ if __name__ == '__main__':
         print('\n\n[INFO] Run Base Name: {}\n'.format(clargs.run_name))
 
     # Save is Done in the database
-    isDone = db.session.query(Variables).filter(
-        Variables.name == "isDone").first()
-    if isDone == None:
-        var = Variables(name="isDone", value=0)
-        db.session.add(var)
-        db.session.commit()
-    else:
-        isDone.value = 0
-        db.session.commit()
-
-    # Save Generation ID in the database
-    CurrentGen = db.session.query(Variables).filter(
-        Variables.name == "CurrentGen").first()
-    if CurrentGen == None:
-        CurrentGen = Variables(name="CurrentGen", value=0)
-        db.session.add(CurrentGen)
-        db.session.commit()
-
-    check = db.session.query(Chromosome).filter(
-        Chromosome.generationID == CurrentGen.value).first()
-    if(check == None):
-        generation = generate_random_chromosomes(population_size=population_size,
-                                                 clargs=clargs,
-                                                 min_vae_hidden_layers=clargs.min_vae_hidden_layers,
-                                                 min_dnn_hidden_layers=clargs.min_dnn_hidden_layers,
-                                                 max_vae_hidden_layers=clargs.max_vae_hidden_layers,
-                                                 max_dnn_hidden_layers=clargs.max_dnn_hidden_layers,
-                                                 min_vae_hidden=clargs.min_vae_hidden,
-                                                 max_vae_hidden=clargs.max_vae_hidden,
-                                                 min_dnn_hidden=clargs.min_dnn_hidden,
-                                                 max_dnn_hidden=clargs.max_dnn_hidden,
-                                                 min_vae_latent=clargs.min_vae_latent,
-                                                 max_vae_latent=clargs.max_vae_latent,
-                                                 min_conv_layers=clargs.min_conv_layers,
-                                                 max_conv_layers=clargs.max_conv_layers,
-                                                 min_kernel_size=clargs.min_kernel_size,
-                                                 max_kernel_size=clargs.max_kernel_size,
-                                                 max_filter_size=clargs.max_filter_size,
-                                                 min_filter_size=clargs.min_filter_size,
-                                                 min_coef=clargs.min_coef,
-                                                 max_coef=clargs.max_coef,
-                                                 min_dropout=clargs.min_dropout,
-                                                 max_dropout=clargs.max_dropout,
-                                                 verbose=clargs.verbose)
-        CurrentGen.value = 0
+    storage.set_variable("isDone", 0)
+
+    if(clargs.resume):
+        frames, state = load_snapshot(snapshot)
+        clargs.run_name, clargs.time_stamp = state['config']['run_name'], state['config']['time_stamp']
+        generation, CurrentGen = frames['generation'], state['generationID']
+        # Rows stored trained when they were bred have the genes of rows the fitness model has seen
+        carried = generation['isTrained'].to_numpy() == 2
+        storage.set_variable("CurrentGen", CurrentGen)
+        # The one query of a resume: whether the generation was stored before the stop
+        check = storage.get_chromosome(Chromosome.run_name == clargs.run_name, Chromosome.generationID == CurrentGen)
+        info_message("Resumed Generation {} of {} from {}".format(CurrentGen, clargs.run_name, snapshot))
     else:
-        info_message("Loaded Generation From DB")
-        generation = load_generation_from_sql(
-            CurrentGen.value, population_size)
-
-    generationID = CurrentGen.value
+        # Save Generation ID in the database
+        CurrentGen = storage.get_variable("CurrentGen")
+        if CurrentGen == None:
+            CurrentGen = 0
+            storage.set_variable("CurrentGen", CurrentGen)
+
+        check = storage.get_chromosome(Chromosome.run_name == clargs.run_name, Chromosome.generationID == CurrentGen)
+        if(check == None):
+            generation = generate_random_chromosomes(population_size=population_size,
+                                                     clargs=clargs,
+                                                     min_vae_hidden_layers=clargs.min_vae_hidden_layers,
+                                                     min_dnn_hidden_layers=clargs.min_dnn_hidden_layers,
+                                                     max_vae_hidden_layers=clargs.max_vae_hidden_layers,
+                                                     max_dnn_hidden_layers=clargs.max_dnn_hidden_layers,
+                                                     min_vae_hidden=clargs.min_vae_hidden,
+                                                     max_vae_hidden=clargs.max_vae_hidden,
+                                                     min_dnn_hidden=clargs.min_dnn_hidden,
+                                                     max_dnn_hidden=clargs.max_dnn_hidden,
+                                                     min_vae_latent=clargs.min_vae_latent,
+                                                     max_vae_latent=clargs.max_vae_latent,
+                                                     min_conv_layers=clargs.min_conv_layers,
+                                                     max_conv_layers=clargs.max_conv_layers,
+                                                     min_kernel_size=clargs.min_kernel_size,
+                                                     max_kernel_size=clargs.max_kernel_size,
+                                                     max_filter_size=clargs.max_filter_size,
+                                                     min_filter_size=clargs.min_filter_size,
+                                                     min_coef=clargs.min_coef,
+                                                     max_coef=clargs.max_coef,
+                                                     min_dropout=clargs.min_dropout,
+                                                     max_dropout=clargs.max_dropout,
+                                                     verbose=clargs.verbose)
+            CurrentGen = 0
+        else:
+            info_message("Loaded Generation From DB")
+            generation = load_generation_from_sql(
+                clargs.run_name, CurrentGen, population_size)
+
+    generationID = CurrentGen
+    deadline = time() + clargs.straggler_timeout if(clargs.straggler_timeout > 0) else None
+    if(clargs.resume):
+        deadline = state['deadline']
     generation = train_generation(
-        generation, clargs, verbose=verbose, sleep_time=sleep_time, save_DB=(check == None))
+        generation, clargs, verbose=verbose, sleep_time=sleep_time, save_DB=(check == None), deadline=deadline)
 
-    best_fitness = []
+    best_fitness = state['best_fitness'] if(clargs.resume) else []
     fitnesses = generation.fitness.values
     new_best_fitness = generation.fitness.values.max()
 
@@ -225,58 +279,121 @@ if __name__ == '__main__':
                      'l2_coef': (0.1, 0.0),
                      'dropout_rate': (0.1, 0.20)}
 
+    # Fitness model of the genomes trained so far, which screens oversampled children
+    surrogate = Surrogate(list(param_choices.keys()), LAYERS, clargs.surrogate_min_rows, clargs.surrogate_kappa)
+    if(clargs.resume):
+        surrogate.frames = [frames['history']]
+        surrogate.add(generation[~carried])
+    else:
+        surrogate.add(generation)
+    genes = list(param_choices.keys())
+
+    # (generationID, chromosomeIDs, deadline) of rows left training when their generation reached its quorum
+    stragglers = state['stragglers'] if(clargs.resume) else []
+    # Last epoch taken from each of the other islands
+    island = clargs.island if(clargs.island != '') else clargs.run_name
+    seen = state['seen'] if(clargs.resume) else {}
+    # Parent pool of the last generation, which NSGA-II breeds from again along with the children
+    elite = frames['elite'] if(clargs.resume and len(frames.get('elite', [])) > 0) else None
+    if(clargs.island_dir != ''):
+        os.makedirs(clargs.island_dir, exist_ok=True)
     start = time()
     # while gen_num < num_generations:
     for generationID in range(generationID + 1, num_generations):
 
         # Save Generation ID in the database
-        CurrentGen = db.session.query(Variables).filter(
-            Variables.name == "CurrentGen").first()
-        if CurrentGen == None:
-            var = Variables(name="CurrentGen", value=generationID)
-            db.session.add(var)
-            db.session.commit()
-        else:
-            CurrentGen.value = generationID
-            db.session.commit()
+        storage.set_variable("CurrentGen", generationID)
 
         start_while = time()
-        # Create new generation
-        new_generation = create_blank_dataframe(generationID, population_size)
-
-        for chromosomeID in tqdm(range(population_size)):
-            parent1, parent2 = select_parents(generation)
-            crossover_happened = cross_over(new_generation, generation,
-                                            parent1, parent2, chromosomeID,
-                                            list(param_choices.keys()
-                                                 ), cross_prob,
-                                            verbose=verbose)
-
-            mutation_happened = mutate(new_generation, chromosomeID, mutate_prob,
-                                       param_choices, verbose=verbose)
-
-            isTrained = not (mutation_happened or crossover_happened)
-            if not isTrained:
-                new_generation.set_value(chromosomeID, 'fitness', -1.0)
-
-            isTrained = 2 if isTrained else 0
-
-            new_generation.set_value(chromosomeID, 'isTrained', isTrained)
-            new_generation.set_value(
-                chromosomeID, 'generationID', generationID)
-            new_generation.set_value(
-                chromosomeID, 'chromosomeID', chromosomeID)
-
-            info_message('Adding Chromosome:\n{}'.format(
-                new_generation.iloc[chromosomeID]))
-
-        # Re-sort by chromosomeID
-        new_generation = new_generation.sort_values('chromosomeID')
-        new_generation.index = np.arange(population_size)
-
+        # Breed from the rows trained so far, joined by the stragglers of earlier generations that finished since
+        late, stragglers = collect_stragglers(clargs.run_name, stragglers, population_size)
+        left = generation['chromosomeID'][generation['isTrained'].isin([0, 1])].tolist()
+        if(len(left) > 0):
+            stragglers.append((generationID - 1, left, deadline))
+        if(len(late) > 0):
+            info_message('{} late results join the parent pool'.format(sum(len(frame) for frame in late)))
+        for frame in late:
+            surrogate.add(frame)
+        generation = pd.concat([generation[generation['isTrained'] == 2]] + late, ignore_index=True)
+        if(clargs.island_dir != '' and generationID % clargs.migration_interval == 0):
+            emigrate(clargs.island_dir, island, generationID - 1, generation, clargs.num_migrants)
+            migrants = immigrate(clargs.island_dir, island, seen)
+            if(len(migrants) > 0):
+                info_message('{} migrants from other islands replace the least fit of the parent pool'.format(len(migrants)))
+                # Their rows live in another island's database; Lineage records them as generation -1
+                migrants['generationID'] = -1
+                generation = generation.sort_values('fitness', ascending=False).head(max(len(generation) - len(migrants), 0))
+                generation = pd.concat([generation, migrants[generation.columns]], ignore_index=True)
+
+        if(clargs.selection == 'nsga2'):
+            if(elite is not None):
+                generation = pd.concat([elite, generation], ignore_index=True)
+            generation = generation.iloc[nsga2_order(generation['fitness'], generation['run_time'])[:population_size]]
+            elite = generation = generation.reset_index(drop=True)
+
+        # Breed the whole new generation at once, or `surrogate_oversample` times as many children to screen
+        screen = clargs.surrogate_oversample > 1 and surrogate.fit()
+        candidates = population_size*clargs.surrogate_oversample if(screen) else population_size
+        generation = Population.from_frame(generation, LAYERS)
+        new_generation = Population.from_frame(create_blank_dataframe(generationID, candidates), LAYERS)
+        parent1, parent2 = select_parents(generation['fitness'], candidates, clargs.selection,
+                                          tournament_size=clargs.tournament_size, cost=generation['run_time'])
+        crossover_happened = cross_over(new_generation, generation,
+                                        parent1, parent2,
+                                        list(param_choices.keys()), cross_prob,
+                                        verbose=verbose)
+        mutation_happened = mutate(new_generation, mutate_prob,
+                                   param_choices, verbose=verbose)
+
+        # Children with the same genes as another child are bred again from new parents
+        for attempt in range(clargs.resample_duplicates + 1):
+            match, repeat = find_duplicates(new_generation, generation, genes)
+            if(attempt == clargs.resample_duplicates or not repeat.any()):
+                break
+            rows = np.flatnonzero(repeat)
+            brood = Population.from_frame(create_blank_dataframe(generationID, len(rows)), LAYERS)
+            brood['chromosomeID'] = new_generation['chromosomeID'][rows]
+            parent1, parent2 = select_parents(generation['fitness'], len(rows), clargs.selection,
+                                              tournament_size=clargs.tournament_size, cost=generation['run_time'])
+            crossover_happened[rows] = cross_over(brood, generation, parent1, parent2,
+                                                  list(param_choices.keys()), cross_prob, verbose=verbose)
+            mutation_happened[rows] = mutate(brood, mutate_prob, param_choices, verbose=verbose)
+            new_generation.put(rows, brood)
+
+        # Unchanged copies keep their parent's fitness and need no training, and so do
+        # children with the same genes as a chromosome of the parent pool, which take its fitness
+        linked = (match >= 0) & (mutation_happened | crossover_happened)
+        for name in RESULT_COLUMNS:
+            new_generation[name][linked] = generation[name][match[linked]]
+        isTrained = ~(mutation_happened | crossover_happened) | linked
+        new_generation['fitness'][~isTrained] = -1.0
+        if(linked.any() or repeat.any()):
+            info_message('{} children take the result of a parent with the same genes, {} still repeat another child'.format(
+                linked.sum(), repeat.sum()))
+        new_generation['isTrained'] = np.where(isTrained, 2, 0)
+
+        if(screen):
+            keep = surrogate.screen(new_generation, isTrained, population_size)
+            new_generation = new_generation.take(keep)
+            new_generation['chromosomeID'] = np.arange(population_size)
+            crossover_happened, mutation_happened, isTrained = crossover_happened[keep], mutation_happened[keep], isTrained[keep]
+
+        info_message('Bred {} Chromosomes: {} crossed over, {} mutated'.format(
+            population_size, crossover_happened.sum(), mutation_happened.sum()))
         refactor_weights(new_generation, generation)
+        new_generation = new_generation.to_frame()
+
+        deadline = time() + clargs.straggler_timeout if(clargs.straggler_timeout > 0) else None
+        # All a --resume needs to carry on from this generation
+        save_snapshot(snapshot, {'generation': new_generation, 'history': surrogate.history(),
+                                 'elite': elite if(elite is not None) else pd.DataFrame()},
+                      dict(generationID=generationID, deadline=deadline, best_fitness=best_fitness,
+                           stragglers=stragglers, seen=seen, config=vars(clargs)))
         generation = train_generation(
-            new_generation, clargs, verbose=verbose, sleep_time=sleep_time)
+            new_generation, clargs, verbose=verbose, sleep_time=sleep_time, deadline=deadline)
+        surrogate.add(generation[~isTrained])
+        if(screen):
+            info_message(surrogate.report(generation))
 
         info_message('Time for Generation{}: {} minutes'.format(generationID,
                                                                 (time() - start_while) // 60))
@@ -290,15 +407,7 @@ if __name__ == '__main__':
 
         best_fitness.append(new_best_fitness)
 
-    isDone = db.session.query(Variables).filter(
-        Variables.name == "isDone").first()
-    if isDone == None:
-        var = Variables(name="isDone", value=1)
-        db.session.add(var)
-        db.session.commit()
-    else:
-        isDone.value = 1
-        db.session.commit()
+    storage.set_variable("isDone", 1)
 
     if verbose:
         print("Done.")
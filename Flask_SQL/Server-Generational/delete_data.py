@@ -1,11 +1,6 @@
-from database import db, Chromosome
+from storage import storage
 
 a = input("Are you sure? y/[n]")
 if a == 'y':
-    Chromosome.query.delete()
-    db.session.commit()
-    db.engine.execute("drop table Chromosome")
-    db.engine.execute("drop table Variables")
-    db.create_all()
-    db.session.close()
-    print("Deleted all Data")
\ No newline at end of file
+    storage.drop_all()
+    print("Deleted all Data")
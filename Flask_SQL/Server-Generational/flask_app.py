@@ -2,9 +2,19 @@
 # A very simple Flask Hello World app for you to get started with...
 
 from flask import request, jsonify, render_template
-from database import Chromosome, Variables, db, app
-from sqlalchemy import func
-import numpy as np
+from database import Chromosome, Lineage, app
+from storage import storage
+from export import MIMETYPES, export_response, plain_value
+from visuals import VisualsCache, pareto_fronts
+import json
+import threading
+
+def serve_in_background(port):
+    # Lets a GA driver host the endpoints itself (required with GA_STORAGE=memory)
+    server = threading.Thread(target=app.run, kwargs={'host': '0.0.0.0', 'port': port, 'threaded': True})
+    server.daemon = True
+    server.start()
+    return server
 
 @app.route('/')
 def index():
@@ -14,31 +24,38 @@ def index():
 def AddChrom():
     if request.method == 'GET':
 
-        c = db.session.query(Chromosome).filter(Chromosome.chromosomeID == request.args.get('chromosomeID'),
-                                                Chromosome.generationID == request.args.get('generationID'),
-                                                Chromosome.num_vae_layers == request.args.get('num_vae_layers'),
-                                                Chromosome.num_dnn_layers == request.args.get('num_dnn_layers'),
-                                                Chromosome.size_vae_latent == request.args.get('size_vae_latent'),
-                                                Chromosome.size_vae_hidden == request.args.get('size_vae_hidden'),
-                                                Chromosome.size_dnn_hidden == request.args.get('size_dnn_hidden'),
-                                                Chromosome.size_kernel == request.args.get('size_kernel'),
-                                                Chromosome.size_pool == request.args.get('size_pool'),
-                                                Chromosome.size_filter == request.args.get('size_filter')).first()
+        # By primary key or claim id; older workers that send neither are matched on the unique key
+        claim_id = request.args.get('claim_id') or None
+        if('id' in request.args):
+            if(result_id(request.args) is None):
+                return 'id must be an integer', 400
+            c = storage.get_chromosome(Chromosome.id == result_id(request.args))
+        elif('claim_id' in request.args):
+            # A row still held under the claim, first or as a backup; a batch claim covers several rows
+            held = storage.get_chromosomes(storage.holds(claim_id), storage.held()) if(claim_id is not None) else []
+            if(len(held) > 1):
+                return 'claim_id {} holds {} chromosomes; send the id of the one trained'.format(claim_id, len(held)), 400
+            c = held[0] if(len(held) == 1) else None
+        else:
+            c = storage.get_chromosome(Chromosome.generationID == request.args.get('generationID'),
+                                       Chromosome.chromosomeID == request.args.get('chromosomeID'),
+                                       Chromosome.run_name == request.args.get('run_name', 'dummy'))
         if(c == None):
             return '1'
 
-        for key in request.args.keys():
-            setattr(c, key, request.args.get(key))
-
-        db.session.commit()
+        # Through the same claim check as /Results, so a late result cannot overwrite a row
+        # that was reissued, trained by someone else or given up on; only a worker matched on
+        # the unique key, which does not know its claim, may report for whichever claim holds it
+        legacy = 'id' not in request.args and claim_id is None
+        storage.record_results([dict(request.args.to_dict(), id=c.id, claim_id=claim_id)], any_claim=legacy)
         return "1"
     return '0'
 
 @app.route('/GetGeneration')
 def GetGeneration():
     if request.method == 'GET':
-        generationID = db.session.query(Variables).filter(Variables.name == "CurrentGen").first().value
-        chroms = db.session.query(Chromosome).filter(Chromosome.generationID == generationID).all()
+        generationID = storage.get_variable("CurrentGen")
+        chroms = storage.get_chromosomes(Chromosome.generationID == generationID)
         resp = []
         trained = 0
         taken = 0
@@ -55,9 +72,9 @@ def GetGeneration():
             			'size_vae_hidden': c.size_vae_hidden,
             			'size_dnn_hidden': c.size_dnn_hidden,
             			'num_conv_layers': c.num_conv_layers,
-                        'size_kernel': c.size_kernel,
-                        'size_pool': c.size_pool,
-                        'size_filter': c.size_filter,
+                        'size_kernel': json.dumps(c.size_kernel.tolist()),
+                        'size_pool': json.dumps(c.size_pool.tolist()),
+                        'size_filter': json.dumps(c.size_filter.tolist()),
             			'info': c.info,
                         'l1_coef': c.l1_coef,
                         'l2_coef': c.l2_coef,
@@ -71,97 +88,171 @@ def GetGeneration():
         return jsonify(dic)
     return '0'
 
+@app.route('/Stats')
+def Stats():
+    # Aggregates per generation, computed in the database; ?first= and ?last=
+    # bound the generations, ?run_name= picks one run
+    if request.method == 'GET':
+        criteria = []
+        if 'first' in request.args:
+            criteria.append(Chromosome.generationID >= request.args.get('first', 0, type=int))
+        if 'last' in request.args:
+            criteria.append(Chromosome.generationID <= request.args.get('last', 0, type=int))
+        if 'run_name' in request.args:
+            criteria.append(Chromosome.run_name == request.args.get('run_name'))
+        return jsonify({'CurrentGen': storage.get_variable("CurrentGen"),
+                        'generations': storage.generation_stats(*criteria)})
+    return '0'
+
 def obj2dict(obj, default=0):
     ret = {}
     for col in obj.__table__.columns:
-        if(getattr(obj, col.name) == None):
-            ret[col.name] = default
-        else:
-            ret[col.name] = getattr(obj, col.name)
+        ret[col.name] = plain_value(getattr(obj, col.name), default)
     return ret
 
+def database_query(filters):
+    '''Columns, criteria and page of a /GetDatabase request, or an error
+        message. `filters` maps query arguments to column criteria.'''
+    columns = Chromosome.__table__.columns.keys()
+    fields = request.args.get('fields')
+    fields = columns if(fields is None) else fields.split(',')
+    unknown = [field for field in fields if field not in columns]
+    if(len(unknown) > 0):
+        return None, 'Unknown fields: {}'.format(', '.join(unknown))
+    if(request.args.get('format', 'json') not in MIMETYPES):
+        return None, 'format must be one of {}'.format(', '.join(MIMETYPES.keys()))
+    limit = request.args.get('limit', None, type=int)
+    if(limit is not None and limit < 1):
+        return None, 'limit must be at least 1'
+
+    try:
+        criteria = [filters[name](request.args.get(name)) for name in filters.keys() if name in request.args]
+    except (KeyError, ValueError):
+        return None, 'Bad value for a filter ({})'.format(', '.join(filters.keys()))
+    return dict(columns=fields, criteria=criteria, after=request.args.get('after', 0, type=int), limit=limit,
+                fmt=request.args.get('format', 'json'), gzip='gzip' in request.accept_encodings), None
+
+# Filters of /GetDatabase
+DATABASE_FILTERS = {'run_name': lambda value: Chromosome.run_name == value,
+                    'generationID': lambda value: Chromosome.generationID == int(value),
+                    'isTrained': lambda value: Chromosome.isTrained == int(value)}
+
 @app.route('/GetDatabase')
 def GetDatabase():
+    # Streamed in batches; see database_query for the paging, projection and filter arguments
     if request.method == 'GET':
-        chroms = db.session.query(Chromosome).all()
-        resp = []
-        for c in chroms:
-            resp.append(obj2dict(c))
-        return jsonify(resp)
+        query, error = database_query(DATABASE_FILTERS)
+        if(query == None):
+            return error, 400
+        return export_response(storage, **query)
     return '0'
 
 @app.route('/GetUnTrainedChrom')
 def GetUnTrainedChrom():
     if request.method == 'GET':
-        c = db.session.query(Chromosome).filter(Chromosome.isTrained == 0).first()
-        if(c == None):
-            c = db.session.query(Chromosome).filter(Chromosome.isTrained == 1).order_by(db.func.rand()).first()
+        c = storage.claim_chromosome(request.args.get('worker', ''))
         if(c == None):
             return "0"
-        c.isTrained = 1
-        db.session.commit()
         return jsonify(obj2dict(c))
     return '0'
 
 @app.route('/GetIsDone')
 def GetIsDone():
     if request.method == 'GET':
-        isDone = db.session.query(Variables).filter(Variables.name == "isDone").first()
+        isDone = storage.get_variable("isDone")
         if isDone == None:
             return "0"
-        return isDone.value
+        return str(isDone)
 
-@app.route('/Visuals')
-def Visuals():
+@app.route('/ClaimChromosomes')
+def ClaimChromosomes():
+    if request.method == 'GET':
+        n = max(request.args.get('n', 1, type=int), 1)
+        # With `wait`, hold the request open (up to a minute) until work shows up
+        wait = min(request.args.get('wait', 0, type=float), 60)
+        if(wait > 0):
+            chroms = storage.wait_for_work(n, request.args.get('worker', ''), timeout=wait)
+        else:
+            chroms = storage.claim_chromosomes(n, request.args.get('worker', ''))
+        return jsonify([obj2dict(c) for c in chroms])
+    return '0'
+
+@app.route('/Heartbeat')
+def Heartbeat():
+    # "1" while the worker still holds the lease on its claim, "0" once it
+    # has expired and the chromosome may have been handed to someone else,
+    # or once another copy of the chromosome was trained first: stop training
     if request.method == 'GET':
-        resp = {}
-        chroms = db.session.query(Chromosome).order_by(Chromosome.generationID, Chromosome.chromosomeID).all()
-        population = chroms[0].population_size
+        # Workers send the id of the row they train; without one the whole claim is renewed
+        id = result_id(request.args) if('id' in request.args) else None
+        if('id' in request.args and id is None):
+            return '0'
+        renewed = storage.renew_lease(request.args.get('claim_id', ''), id)
+        return "1" if renewed > 0 else "0"
+    return '0'
 
-        def get_index(generationID, chromosomeID):
-            return generationID*population + chromosomeID
+def result_id(result):
+    # Row id of a submitted result as an int, None when it has no usable one
+    try:
+        return int(result['id'])
+    except (KeyError, TypeError, ValueError):
+        return None
 
-        nodes = []
+@app.route('/Results', methods=['POST'])
+def Results():
+    # JSON body: one result or a list of them, each carrying the row `id` and
+    # `claim_id`; a result without a numeric id or a claim_id is ignored
+    results = request.get_json(force=True, silent=True)
+    if isinstance(results, dict):
+        results = [results]
+    if(not isinstance(results, list) or not all(isinstance(result, dict) for result in results)):
+        return 'Expected a result object or a list of them', 400
+    applied = storage.record_results([dict(result, id=result_id(result)) for result in results
+                                      if result_id(result) is not None])
+    ignored = [result.get('id') for result in results if result_id(result) not in applied]
+    return jsonify({'applied': applied, 'ignored': ignored})
 
-        min_val = db.session.query(func.min(Chromosome.fitness)).filter(Chromosome.fitness > 0).first()[0]
-        max_val = db.session.query(func.max(Chromosome.fitness)).filter(Chromosome.fitness > 0).first()[0]
+visuals = VisualsCache(storage)
 
-        for c in chroms:
-            fitness = c.fitness
-            if(fitness < min_val):
-                fitness = min_val + np.random.uniform(-1, 1)
-
-            fitness = ((1/fitness) - (1/max_val))/((1/min_val) - (1/max_val))
-            fitness = np.sqrt(np.sqrt(fitness))
-            fitness = 0 if np.isnan(fitness) else fitness
-            nodes.append({"generation": c.generationID,
-                            "name": c.chromosomeID,
-                            "fitness": fitness,
-                            "size": c.num_conv_layers,
-                            "height": c.num_dnn_layers})
-        links = []
-        for c in chroms:
-            if c.fitness > 0:
-                bold = 0 if ("Mutated" in c.info) else 1
-                if("Descendant" in c.info):
-                    parentID = int(c.info.split(" ")[2])
-                    links.append({"source": get_index(c.generationID -1, parentID),
-                                    "target": get_index(c.generationID, c.chromosomeID),
-                                    "op": bold})
-                elif("Child" in c.info):
-                    parentID1 = int(c.info.split(" ")[2])
-                    parentID2 = int(c.info.split(" ")[4])
-                    links.append({"source": get_index(c.generationID -1, parentID1),
-                                    "target": get_index(c.generationID, c.chromosomeID),
-                                    "op": bold})
-                    links.append({"source": get_index(c.generationID -1, parentID2),
-                                    "target": get_index(c.generationID, c.chromosomeID),
-                                    "op": bold})
-
-
-        resp["nodes"] = nodes
-        resp["links"] = links
-        resp["population"] = population
-        resp["max"] = max_val
-        resp["min"] = min_val
-        return jsonify(resp)
\ No newline at end of file
+@app.route('/Visuals')
+def Visuals():
+    # Served from the cache; a refresh whose If-None-Match still matches gets a 304
+    if request.method == 'GET':
+        etag, body = visuals.get()
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+@app.route('/Pareto')
+def Pareto():
+    # The chromosomes no other beats on both fitness and training time, per
+    # generation and over the whole database; ?run_name= picks one run
+    if request.method == 'GET':
+        criteria = []
+        if 'run_name' in request.args:
+            criteria.append(Chromosome.run_name == request.args.get('run_name'))
+        return jsonify(pareto_fronts(storage, *criteria))
+    return '0'
+
+@app.route('/Lineage')
+def GetLineage():
+    # Parent edges of a run: ?generationID= for one generation, plus
+    # &chromosomeID=&direction=ancestors|descendants (&depth=) to follow one chromosome
+    if request.method == 'GET':
+        run_name = request.args.get('run_name', 'dummy')
+        generationID = request.args.get('generationID', None, type=int)
+        chromosomeID = request.args.get('chromosomeID', None, type=int)
+        direction = request.args.get('direction', 'ancestors')
+        if(generationID == None):
+            return 'generationID is required', 400
+        if(chromosomeID == None):
+            edges = storage.get_edges(Lineage.generationID == generationID, Lineage.run_name == run_name)
+        elif(direction == 'ancestors'):
+            edges = storage.get_ancestors(run_name, generationID, chromosomeID, request.args.get('depth', None, type=int))
+        elif(direction == 'descendants'):
+            edges = storage.get_descendants(run_name, generationID, chromosomeID, request.args.get('depth', None, type=int))
+        else:
+            return 'direction must be ancestors or descendants', 400
+        return jsonify([obj2dict(edge) for edge in edges])
+    return '0'
@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+from numpy import random
+
+from database import split_arrays
+
+def pad_arrays(arrays):
+    # (len(arrays), longest) matrix of variable length genes, padded with zeros
+    lengths = np.array([len(array) for array in arrays], dtype=int)
+    values = np.concatenate(arrays) if len(arrays) > 0 else np.array([], dtype=int)
+    matrix = np.zeros((len(arrays), lengths.max(initial=0)), dtype=values.dtype)
+    matrix[np.arange(matrix.shape[1]) < lengths[:, None]] = values
+    return matrix
+
+class Population(object):
+    '''A generation held as typed NumPy arrays, one per column, so the GA
+        breeds whole populations with array operations.
+
+    Array genes are padded (population, width) matrices. `layers` maps
+    each layer count column to the array genes it sizes (e.g.
+    num_conv_layers -> size_kernel, size_pool, size_filter); the count is
+    the length of those genes in every row and the padding is zero.
+    DataFrames, as train_generation and the loaders use them, are only
+    built at the database boundary with from_frame/to_frame.'''
+
+    def __init__(self, columns, layers):
+        self.columns = columns
+        self.layers = layers
+
+    @classmethod
+    def from_frame(cls, frame, layers):
+        genes = [gene for group in layers.values() for gene in group]
+        columns = {}
+        for name in frame.columns:
+            if(name in genes):
+                columns[name] = pad_arrays([np.asarray(array) for array in frame[name]])
+            else:
+                columns[name] = frame[name].to_numpy().copy()
+        return cls(columns, layers)
+
+    def to_frame(self):
+        frame = pd.DataFrame()
+        for name, values in self.columns.items():
+            if(values.ndim == 2):
+                values = split_arrays(values, self.columns[self.length_column(name)])
+            frame[name] = values
+        return frame
+
+    def __len__(self):
+        return len(self.columns['chromosomeID'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __setitem__(self, name, values):
+        self.columns[name] = values
+
+    def take(self, rows):
+        # The Population of `rows`, in that order
+        return Population({name: values[rows] for name, values in self.columns.items()}, self.layers)
+
+    def put(self, rows, other):
+        # Overwrite `rows` with the rows of the Population `other`
+        for name, values in other.columns.items():
+            if(values.ndim == 2):
+                self.widen(self.length_column(name), values.shape[1])
+                self.columns[name][rows] = 0
+                self.columns[name][rows, :values.shape[1]] = values
+            else:
+                self.columns[name][rows] = values
+
+    def genes(self):
+        # Names of the array genes
+        return [gene for group in self.layers.values() for gene in group]
+
+    def length_column(self, gene):
+        return [name for name, group in self.layers.items() if gene in group][0]
+
+    def widen(self, length_column, width):
+        # Pad the genes sized by `length_column` to at least `width` columns
+        for gene in self.layers[length_column]:
+            matrix = self.columns[gene]
+            if(matrix.shape[1] < width):
+                self.columns[gene] = np.pad(matrix, ((0, 0), (0, width - matrix.shape[1])))
+
+def genome_codes(populations, genes):
+    '''One integer per row of each of `populations`, the same for rows
+        with equal `genes`. Array genes compare over their layers only,
+        floats to 9 decimals.'''
+    widths = {gene: max(population[gene].shape[1] for population in populations)
+              for gene in genes if populations[0][gene].ndim == 2}
+    blocks = []
+    for population in populations:
+        columns = []
+        for gene in genes:
+            values = np.asarray(population[gene], dtype=float)
+            if(values.ndim == 2):
+                lengths = population[population.length_column(gene)]
+                values = np.pad(values, ((0, 0), (0, widths[gene] - values.shape[1])))
+                columns.append(np.where(np.arange(widths[gene]) < lengths[:, None], values, 0))
+            else:
+                columns.append(values[:, None])
+        blocks.append(np.round(np.hstack(columns), 9))
+    codes = np.unique(np.vstack(blocks), axis=0, return_inverse=True)[1].ravel()
+    return np.split(codes, np.cumsum([len(block) for block in blocks])[:-1])
+
+def find_duplicates(children, pool, genes):
+    '''For each row of `children`: the first row of `pool` with the same
+        `genes` (-1 for none), and whether it repeats an earlier child that
+        has no such row'''
+    codes, pool_codes = genome_codes([children, pool], genes)
+    lookup = np.full(max(codes.max(initial=-1), pool_codes.max(initial=-1)) + 1, -1)
+    lookup[pool_codes[::-1]] = np.arange(len(pool_codes))[::-1]
+    match = lookup[codes]
+    unmatched = np.flatnonzero(match < 0)
+    repeat = np.zeros(len(codes), dtype=bool)
+    repeat[unmatched] = True
+    repeat[unmatched[np.unique(codes[unmatched], return_index=True)[1]]] = False
+    return match, repeat
+
+def cross_over(new_generation, generation, parent1, parent2, param_choices, cross_prob, params_copy):
+    '''Fill the children of `new_generation` from the rows `parent1` and
+        `parent2` of `generation`. With probability `cross_prob` a child
+        takes each gene of `param_choices` from either parent, and each
+        layer of its array genes from either parent; otherwise it is a copy
+        of parent1's `param_choices` and `params_copy` columns. Returns the
+        mask of crossed over children.'''
+    crossed = random.random(len(parent1)) <= cross_prob
+    genes = new_generation.genes()
+
+    rows, p1, p2 = np.flatnonzero(crossed), parent1[crossed], parent2[crossed]
+    for param in param_choices:
+        if(param in genes):
+            continue
+        from_p1 = random.random(len(rows)) < 0.5
+        new_generation[param][rows] = np.where(from_p1, generation[param][p1], generation[param][p2])
+
+    # Layer i comes from a random parent, or from the one that has it
+    for length_column, group in new_generation.layers.items():
+        lengths = new_generation[length_column][rows]
+        width = lengths.max(initial=0)
+        new_generation.widen(length_column, width)
+        generation.widen(length_column, width)
+        position = np.arange(width)
+        from_p1 = (position < generation[length_column][p1][:, None]) &\
+                  ((position >= generation[length_column][p2][:, None]) | (random.random((len(rows), width)) < 0.5))
+        inside = position < lengths[:, None]
+        for gene in group:
+            merged = np.where(from_p1, generation[gene][p1, :width], generation[gene][p2, :width])
+            new_generation[gene][rows] = 0
+            new_generation[gene][rows, :width] = np.where(inside, merged, 0)
+
+    rows, p1 = np.flatnonzero(~crossed), parent1[~crossed]
+    for name in list(param_choices) + list(params_copy):
+        if(name in genes):
+            width = generation[name].shape[1]
+            new_generation.widen(new_generation.length_column(name), width)
+            new_generation[name][rows] = 0
+            new_generation[name][rows, :width] = generation[name][p1]
+        else:
+            new_generation[name][rows] = generation[name][p1]
+
+    ids1, ids2 = generation['chromosomeID'][parent1], generation['chromosomeID'][parent2]
+    new_generation['parent1'][:] = ids1
+    new_generation['parent2'][:] = np.where(crossed, ids2, -1)
+    # Parents are usually all from one generation, but late results join the pool from older ones
+    new_generation['parent1_generation'][:] = generation['generationID'][parent1]
+    new_generation['parent2_generation'][:] = np.where(crossed, generation['generationID'][parent2], -1)
+    new_generation['operation'][:] = np.where(crossed, 'crossover', 'copy')
+    new_generation['info'][:] = ['Child of {} and {}'.format(a, b) if c else 'Descendant of {}'.format(a)
+                                 for a, b, c in zip(ids1, ids2, crossed)]
+    return crossed
+
+def mutation_rows(population, prob):
+    # Rows that mutate a gene, each with probability `prob`
+    return np.flatnonzero(random.random(len(population)) <= prob)
+
+def mutate_values(population, param, rows, range_change, min_val):
+    # Step a scalar gene by up to +-`range_change`, no lower than `min_val`
+    values = population[param][rows] + random.uniform(-range_change, range_change, len(rows))
+    population[param][rows] = np.maximum(values, min_val)
+
+def mutate_layers(population, length_column, rows, fill):
+    '''Add or remove a layer in `rows`: a quarter of them drop a random
+        layer of every gene sized by `length_column`, a quarter duplicate
+        one at the end (or append `fill` when they had no layers).'''
+    change = np.round(random.uniform(-1, 1, len(rows))).astype(int)
+    lengths = population[length_column]
+    group = population.layers[length_column]
+
+    remove = rows[(change == -1) & (lengths[rows] > 0)]
+    index = (random.random(len(remove))*lengths[remove]).astype(int)
+    for gene in group:
+        matrix = population[gene]
+        shifted = np.zeros_like(matrix[remove])
+        shifted[:, :-1] = matrix[remove, 1:]
+        matrix[remove] = np.where(np.arange(matrix.shape[1]) >= index[:, None], shifted, matrix[remove])
+    lengths[remove] -= 1
+
+    add = rows[change == 1]
+    population.widen(length_column, lengths[add].max(initial=0) + 1)
+    index = (random.random(len(add))*lengths[add]).astype(int)
+    for gene in group:
+        matrix = population[gene]
+        matrix[add, lengths[add]] = np.where(lengths[add] > 0, matrix[add, index], fill)
+    lengths[add] += 1
+
+def mutate_elements(population, gene, rows, range_change, min_val, rounded=False):
+    # Step one random layer of an array gene by up to +-`range_change`
+    lengths = population[population.length_column(gene)][rows]
+    rows, lengths = rows[lengths > 0], lengths[lengths > 0]
+    index = (random.random(len(rows))*lengths).astype(int)
+    values = population[gene][rows, index] + random.uniform(-range_change, range_change, len(rows))
+    values = np.maximum(values, min_val)
+    population[gene][rows, index] = np.round(values) if rounded else values
+
+def mark_mutated(population, mutated):
+    population['mutated'][mutated] = 1
+    population['info'][mutated] = [info + " [Mutated]" for info in population['info'][mutated]]
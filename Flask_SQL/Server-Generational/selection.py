@@ -0,0 +1,106 @@
+import bisect
+
+import numpy as np
+import pandas as pd
+from numpy import random
+
+# Parent selection for every child of a breed at once: the weights are
+# computed once per population and all the draws share one searchsorted
+
+def roulette_weights(fitness, maximize=True):
+    # Fitness rescaled to [1, 6], 6 for the best row
+    fitness = np.asarray(fitness, dtype=float)
+    min_val, max_val = fitness.min(), fitness.max()
+    if(max_val == min_val):
+        return np.ones(len(fitness))
+    scaled = (fitness - min_val)/(max_val - min_val)
+    return (scaled if maximize else 1 - scaled)*5 + 1
+
+def rank_weights(fitness, maximize=True):
+    # Rank of each row, 1 for the worst; tied rows share their average rank
+    return pd.Series(np.asarray(fitness, dtype=float)).rank(ascending=maximize).to_numpy()
+
+def draw(weights, shape):
+    '''Row indices drawn with probability proportional to `weights`. A row
+        is picked when the running total of the weights first reaches the
+        random threshold, as a walk down the population would.'''
+    cumulative = np.cumsum(weights)
+    picks = random.random(shape)*cumulative[-1]
+    return np.minimum(np.searchsorted(cumulative, picks), len(cumulative) - 1)
+
+def tournament(fitness, shape, maximize=True, size=2):
+    # Winners of tournaments among `size` rows drawn uniformly with replacement
+    fitness = np.asarray(fitness, dtype=float)
+    entrants = random.randint(0, len(fitness), tuple(shape) + (size,))
+    scores = fitness[entrants] if maximize else -fitness[entrants]
+    return np.take_along_axis(entrants, scores.argmax(axis=-1)[..., None], axis=-1)[..., 0]
+
+def pareto_ranks(objectives):
+    '''Non-dominated front of each row of the (rows, 2) array `objectives`,
+        both minimized: 0 for the rows no other row dominates, 1 for the
+        rows only front 0 dominates, and so on. Distinct points are taken in
+        order of the first objective and each joins the first front whose
+        lowest second objective is above its own.'''
+    points, inverse = np.unique(np.asarray(objectives, dtype=float), axis=0, return_inverse=True)
+    lowest, ranks = [], np.zeros(len(points), dtype=int)
+    for i, value in enumerate(points[:, 1]):
+        front = bisect.bisect_right(lowest, value)
+        if(front == len(lowest)):
+            lowest.append(value)
+        else:
+            lowest[front] = value
+        ranks[i] = front
+    return ranks[inverse.ravel()]
+
+def crowding_distances(objectives, ranks):
+    '''Crowding distance of each row within its front: the gaps between its
+        neighbours summed over the objectives, each scaled by its range.
+        The ends of a front are infinitely far.'''
+    objectives = np.asarray(objectives, dtype=float)
+    distances = np.zeros(len(objectives))
+    for values in objectives.T:
+        order = np.lexsort((values, ranks))
+        values, fronts = values[order], ranks[order]
+        span = max(values.max(initial=0) - values.min(initial=0), 1e-12)
+        gaps = np.full(len(order), np.inf)
+        inner = (fronts[:-2] == fronts[1:-1]) & (fronts[2:] == fronts[1:-1])
+        gaps[1:-1] = np.where(inner, (values[2:] - values[:-2])/span, np.inf)
+        distances[order] += gaps
+    return distances
+
+def nsga2_order(fitness, cost, maximize=True):
+    '''Rows from best to worst for NSGA-II, which trades `fitness` against
+        `cost` (lower is better): by front, then the most isolated first'''
+    fitness = np.asarray(fitness, dtype=float)
+    objectives = np.column_stack([-fitness if maximize else fitness, np.asarray(cost, dtype=float)])
+    ranks = pareto_ranks(objectives)
+    return np.lexsort((-crowding_distances(objectives, ranks), ranks))
+
+METHODS = ['roulette', 'rank', 'tournament', 'nsga2']
+
+def select_parents(fitness, n, method='roulette', maximize=True, tournament_size=2, cost=None):
+    '''Row indices (parent1, parent2) of `n` pairs of parents, chosen by
+        `method` from the rows' `fitness`. With `maximize` False the
+        lowest fitness is the best.
+
+        roulette: weights are the fitness rescaled to [1, 6]
+        rank: weights are the fitness ranks
+        tournament: the best of `tournament_size` random rows
+        nsga2: tournaments won by the row nsga2_order puts first, which
+            also weighs the rows' `cost`'''
+    if(method == 'roulette'):
+        parents = draw(roulette_weights(fitness, maximize), (2, n))
+    elif(method == 'rank'):
+        parents = draw(rank_weights(fitness, maximize), (2, n))
+    elif(method == 'tournament'):
+        parents = tournament(fitness, (2, n), maximize, tournament_size)
+    elif(method == 'nsga2'):
+        if(cost is None):
+            raise ValueError('nsga2 needs the cost of every row')
+        order = nsga2_order(fitness, cost, maximize)
+        position = np.empty(len(order))
+        position[order] = np.arange(len(order))
+        parents = tournament(position, (2, n), False, tournament_size)
+    else:
+        raise ValueError('method must be one of {}'.format(', '.join(METHODS)))
+    return parents[0], parents[1]
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from population import Population
+
+class Surrogate(object):
+    '''Random forest predicting the fitness of a genome from the genomes
+        trained so far in the run, so that the GA can breed more children
+        than it trains and send workers only the most promising ones.
+
+    A child's score is its predicted fitness plus `kappa` times the spread
+    of the trees' predictions, so uncertain children also get their turn.
+    Unchanged copies are scored by the fitness they already have. The
+    model is only used once `min_rows` genomes have been trained.'''
+
+    def __init__(self, genes, layers, min_rows=50, kappa=1.0):
+        self.genes = genes
+        self.layers = layers
+        self.min_rows = min_rows
+        self.kappa = kappa
+        self.frames = []
+        self.model = None
+        self.predicted = None
+        self.screened_out = 0
+
+    def add(self, frame):
+        # Record the rows of `frame` that were trained
+        columns = list(dict.fromkeys(self.genes + list(self.layers.keys()))) + ['fitness']
+        self.frames.append(frame.loc[(frame['isTrained'] == 2) & (frame['fitness'] > 0), columns])
+
+    def features(self, population):
+        # One row per chromosome: the scalar genes, and the total, largest and mean layer of each array gene
+        columns = []
+        for gene in self.genes:
+            values = np.asarray(population[gene], dtype=float)
+            if(values.ndim == 2):
+                total = values.sum(axis=1)
+                lengths = np.asarray(population[population.length_column(gene)], dtype=float)
+                columns += [total, values.max(axis=1, initial=0), total/np.maximum(lengths, 1)]
+            else:
+                columns.append(values)
+        return np.column_stack(columns)
+
+    def history(self):
+        # Every genome recorded so far, with its fitness
+        return pd.concat(self.frames, ignore_index=True) if len(self.frames) > 0 else pd.DataFrame()
+
+    def fit(self):
+        '''Refit on every genome recorded so far; returns whether there were
+            enough of them for the model to be used'''
+        history = self.history()
+        if(len(history) < self.min_rows):
+            self.model = None
+            return False
+        population = Population.from_frame(history, self.layers)
+        self.model = RandomForestRegressor(n_estimators=100, min_samples_leaf=2)
+        self.model.fit(self.features(population), history['fitness'].to_numpy())
+        return True
+
+    def predict(self, population):
+        # (mean, spread) of the trees' predicted fitness
+        trees = np.array([tree.predict(self.features(population)) for tree in self.model.estimators_])
+        return trees.mean(axis=0), trees.std(axis=0)
+
+    def screen(self, population, copies, n):
+        '''Rows of the `n` best scored children of `population`; `copies`
+            masks the unchanged copies, which need no training. The
+            predictions of the kept children are compared with their
+            results by `report`.'''
+        mean, spread = self.predict(population)
+        score = np.where(copies, population['fitness'], mean + self.kappa*spread)
+        keep = np.sort(np.argsort(-score, kind='stable')[:n])
+        self.predicted = np.where(copies, np.nan, mean)[keep]
+        self.screened_out = (~copies).sum() - (~copies[keep]).sum()
+        return keep
+
+    def report(self, generation):
+        '''How well the last screen predicted: the R^2 and mean absolute
+            error over the kept children that were trained, and the training
+            time of the children screened out, estimated from theirs'''
+        trained = ~np.isnan(self.predicted) & (generation['isTrained'] == 2).to_numpy()
+        actual, predicted = generation['fitness'].to_numpy()[trained], self.predicted[trained]
+        if(trained.sum() < 2):
+            return 'Surrogate: too few children trained to score the predictions'
+        r2 = 1 - ((actual - predicted)**2).sum()/max(((actual - actual.mean())**2).sum(), 1e-12)
+        saved = self.screened_out*generation['run_time'].to_numpy()[trained].mean()
+        return ('Surrogate: R^2 {:.2f}, mean absolute error {:.3g} of the predicted fitness of {} children; '
+                '{} children screened out, about {:.0f} s of training saved').format(
+                    r2, np.abs(actual - predicted).mean(), trained.sum(), self.screened_out, saved)
@@ -0,0 +1,134 @@
+import json
+import threading
+
+import numpy as np
+
+from database import Chromosome, Lineage
+from selection import pareto_ranks
+
+# Columns the dashboard draws from
+COLUMNS = ['run_name', 'generationID', 'chromosomeID', 'isTrained', 'fitness', 'num_conv_layers',
+           'num_dnn_layers', 'population_size', 'info']
+# Columns of the chromosomes on a Pareto front
+FRONT_COLUMNS = ['run_name', 'generationID', 'chromosomeID', 'fitness', 'run_time', 'num_conv_layers', 'num_dnn_layers']
+
+def parse_lineage(generationID, info):
+    # ((parent generationID, chromosomeID) pairs, bold) from the `info` of rows bred before the Lineage table
+    bold = 0 if ("Mutated" in info) else 1
+    words = info.split(" ")
+    if("Descendant" in info):
+        return ((generationID - 1, int(words[2])),), bold
+    elif("Child" in info):
+        return ((generationID - 1, int(words[2])), (generationID - 1, int(words[4]))), bold
+    return (), bold
+
+def pareto_front(rows):
+    # The rows no other row beats on both fitness and run_time, fastest first
+    if(len(rows) == 0):
+        return []
+    ranks = pareto_ranks([[-row['fitness'], row['run_time']] for row in rows])
+    front = [{name: row[name] for name in FRONT_COLUMNS} for row, rank in zip(rows, ranks) if rank == 0]
+    return sorted(front, key=lambda row: (row['run_time'], -row['fitness']))
+
+def pareto_fronts(storage, *criteria):
+    '''Pareto fronts of fitness against training time among the trained
+        rows matching `criteria`: one per generation, and one over every row
+        a worker trained. Unchanged copies are members of their generation
+        but left out of the overall front, where they would repeat their
+        parents.'''
+    rows = [row for batch in storage.iter_rows(FRONT_COLUMNS + ['claim_id'], Chromosome.isTrained == 2, *criteria)
+            for row in batch]
+    generations = {}
+    for row in rows:
+        generations.setdefault(row['generationID'], []).append(row)
+    return {'generations': [{'generationID': generationID, 'front': pareto_front(members)}
+                            for generationID, members in sorted(generations.items())],
+            'overall': pareto_front([row for row in rows if row['claim_id'] != ''])}
+
+class VisualsCache(object):
+    '''The /Visuals payload, rebuilt only when the WorkVersion or
+        ResultVersion counters move; those counters are also its ETag.
+
+    A rebuild re-reads only the generations from the first one that still
+    had rows waiting for a result; generations whose rows were all trained
+    (or failed) are kept from earlier reads. Parents come from the Lineage
+    table along with those rows, and the fitness range is taken from the
+    cached rows, so there are no min/max queries.'''
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.lock = threading.Lock()
+        self.versions = None
+        self.rows = {}
+        self.frontier = 0
+        self.etag = None
+        self.body = None
+
+    def get(self):
+        '''(etag, JSON body) of the current payload'''
+        with self.lock:
+            versions = self.storage.get_variables(['WorkVersion', 'ResultVersion'], default=0)
+            if(versions == self.versions):
+                return self.etag, self.body
+            if(self.versions is None or any(versions[name] < self.versions[name] for name in versions)):
+                # Counters went backwards: the database was cleared
+                self.rows = {}
+                self.frontier = 0
+            self.update()
+            self.versions = versions
+            self.etag = '{WorkVersion}-{ResultVersion}'.format(**versions)
+            self.body = json.dumps(self.render())
+            return self.etag, self.body
+
+    def update(self):
+        for id in [id for id, row in self.rows.items() if row['generationID'] >= self.frontier]:
+            del self.rows[id]
+        parents = {}
+        for edge in self.storage.get_edges(Lineage.generationID >= self.frontier):
+            key = (edge.run_name, edge.generationID, edge.chromosomeID)
+            parent = (edge.parent_generationID, edge.parent_chromosomeID)
+            parents[key] = (parents.get(key, ((), 1))[0] + (parent,), 0 if edge.mutated else 1)
+        for batch in self.storage.iter_rows(COLUMNS, Chromosome.generationID >= self.frontier):
+            for row in batch:
+                key = (row['run_name'], row['generationID'], row['chromosomeID'])
+                row['parents'], row['bold'] = parents[key] if key in parents else parse_lineage(row['generationID'], row['info'])
+                self.rows[row['id']] = row
+        # Failed rows (isTrained 3) will not change any more either
+        untrained = [row['generationID'] for row in self.rows.values() if row['isTrained'] in [0, 1]]
+        generations = [row['generationID'] for row in self.rows.values()]
+        self.frontier = min(untrained) if len(untrained) > 0 else max(generations, default=-1) + 1
+
+    def render(self):
+        rows = sorted(self.rows.values(), key=lambda row: (row['generationID'], row['chromosomeID']))
+        if(len(rows) == 0):
+            return {"nodes": [], "links": [], "population": 0, "max": None, "min": None}
+        population = rows[0]['population_size']
+
+        def get_index(generationID, chromosomeID):
+            return generationID*population + chromosomeID
+
+        fitness = np.array([row['fitness'] for row in rows], dtype=float)
+        trained = fitness[fitness > 0]
+        min_val, max_val = (trained.min(), trained.max()) if len(trained) > 0 else (None, None)
+        if(min_val is None):
+            scaled = np.zeros(len(rows))
+        else:
+            fitness = np.where(fitness < min_val, min_val + np.random.uniform(-1, 1, len(rows)), fitness)
+            with np.errstate(all='ignore'):
+                scaled = ((1/fitness) - (1/max_val))/((1/min_val) - (1/max_val))
+                scaled = np.sqrt(np.sqrt(scaled))
+            scaled[~np.isfinite(scaled)] = 0
+
+        nodes = [{"generation": row['generationID'],
+                  "name": row['chromosomeID'],
+                  "fitness": value,
+                  "size": row['num_conv_layers'],
+                  "height": row['num_dnn_layers']} for row, value in zip(rows, scaled.tolist())]
+        # Parents that migrated from another island (generation -1) have no node here
+        links = [{"source": get_index(*parent),
+                  "target": get_index(row['generationID'], row['chromosomeID']),
+                  "op": row['bold']} for row in rows if row['fitness'] > 0 for parent in row['parents']
+                 if parent[0] >= 0]
+        return {"nodes": nodes, "links": links, "population": population,
+                "max": None if max_val is None else float(max_val),
+                "min": None if min_val is None else float(min_val)}
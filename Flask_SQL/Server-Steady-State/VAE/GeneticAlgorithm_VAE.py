@@ -1,12 +1,14 @@
 import sys, os.path
 sys.path.append(os.path.abspath('../'))
 
-from database import db, Chromosome
+from database import Chromosome, pack_array, split_arrays, unpack_arrays
+from storage import storage
+from sqlalchemy import or_
+from selection import select_parents
 import numpy as np
 import pandas as pd
 from numpy import random
 import time
-from flask import json
 import os
 
 def debug_message(message, end = '\n'):
@@ -59,16 +61,35 @@ def create_blank_dataframe(clargs):
 
     return generation
 
+# Bookkeeping of the workers' claims, which the GA has no use for
+CLAIM_COLUMNS = ['claim_id', 'worker', 'lease_expires']
+
 def load_generation_from_sql(array_genes_sizes):
-    generation = pd.read_sql(Chromosome.query.statement, db.session.bind)
+    generation = storage.read_frame().drop(columns=CLAIM_COLUMNS)
     for param in list(array_genes_sizes.keys()):
-        generation[param] = generation[param].apply(json.loads).apply(np.array)
+        matrix, lengths = unpack_arrays(generation[param])
+        generation[param] = split_arrays(matrix, lengths)
     return generation
 
+def update_generation_from_sql(generation, array_genes_sizes):
+    '''`generation` brought up to date in one query: the rows stored after
+        its largest id, and its rows that were not trained yet. A trained
+        row does not change again, so the cost is that of the new rows and
+        results, not of the whole table.'''
+    pending = generation['id'][generation['date_trained'] <= 0].tolist()
+    rows = storage.read_frame(or_(Chromosome.id > int(generation['id'].max()), Chromosome.id.in_(pending))).drop(columns=CLAIM_COLUMNS)
+    if(len(rows) == 0):
+        return generation
+    for param in list(array_genes_sizes.keys()):
+        matrix, lengths = unpack_arrays(rows[param])
+        rows[param] = split_arrays(matrix, lengths)
+    generation = pd.concat([generation[~generation['id'].isin(rows['id'])], rows], ignore_index=True)
+    return generation.sort_values('id', ignore_index=True)
+
 def add_generation_to_sql(generation, array_genes_sizes):
     for param in list(array_genes_sizes.keys()):
-        generation[param] = generation[param].apply(np.ndarray.tolist).apply(json.dumps)
-    generation.to_sql('Chromosome', db.engine, if_exists='append', index=False)
+        generation[param] = generation[param].apply(pack_array)
+    storage.append_frame(generation)
 
 def generate_random_chromosomes(clargs, array_genes_sizes):
 
@@ -125,39 +146,34 @@ def generate_random_chromosomes(clargs, array_genes_sizes):
 def loguniform(low=0, high=1, size=None, dtype=int):
     return np.exp(np.random.uniform(np.log(low+1), np.log(high+1), size)).astype(dtype) -1
 
-def train_generation(array_genes_sizes, sleep_time=30):
-    while True:
+def train_generation(array_genes_sizes, sleep_time=30, generation=None, remaining=0):
+    '''Wait until no more than `remaining` Chromosomes are left untrained;
+        wakes as soon as the result that gets there is reported,
+        `sleep_time` only paces the progress messages'''
+    while not storage.wait_for_results(Chromosome.date_trained <= 0, timeout=sleep_time, remaining=remaining):
         print("Waiting for Chromosomes to be Trained...")
-        time.sleep(sleep_time)
-        db.session.close()
-        c = Chromosome.query.filter(Chromosome.date_trained <= 0).first()
-        if c == None:
-            print("All Chromosomes have been Trained")
-            break
+    if(remaining == 0):
+        print("All Chromosomes have been Trained")
 
+    # A population already held is brought up to date instead of read again
+    if(generation is not None):
+        return update_generation_from_sql(generation, array_genes_sizes)
     generation = load_generation_from_sql(array_genes_sizes)
     return generation
 
-def select_parents(generation):
-    rank_fit = generation["fitness"].rank(ascending=False)
-    rank_sum = rank_fit.sum()
+def queue_size(chroms_per_loop):
+    # Untrained Chromosomes to keep queued: as many as asked, or one per active worker
+    return chroms_per_loop if(chroms_per_loop > 0) else max(storage.count_workers(), 1)
 
-    p1_num = np.random.uniform(0, rank_sum)
-    p2_num = np.random.uniform(0, rank_sum)
-    parent1 = None
-    parent2 = None
+def num_children(generation, queue_size):
+    '''Children to breed so that `queue_size` Chromosomes of `generation`
+        wait for training; none when as many are waiting already'''
+    return max(queue_size - int((generation['date_trained'] <= 0).sum()), 0)
 
-    count = 0
-    for index, rank in rank_fit.items():
-        count += rank
-        if(parent1 is None and count >= p1_num):
-            parent1 = generation.iloc[index]
-        if(parent2 is None and count >= p2_num):
-            parent2 = generation.iloc[index]
-        if(parent1 is not None and parent2 is not None):
-            break
-
-    return parent1, parent2
+def genome_key(chromosome, genes, array_genes_sizes):
+    # Hashable genes of a chromosome (a row or dict); array genes over their layers, floats to 9 decimals
+    return tuple(tuple(int(value) for value in chromosome[gene]) if(gene in array_genes_sizes)
+                 else round(float(chromosome[gene]), 9) for gene in genes)
 
 def cross_over(parent1, parent2, cross_prob, param_choices, array_genes_sizes):
     if random.random() <= cross_prob:
@@ -190,7 +206,10 @@ def cross_over(parent1, parent2, cross_prob, param_choices, array_genes_sizes):
         child['info'] = 'Child of {} and {}'.format(parent1["id"], parent2["id"])
         return pd.Series(child)
 
-    child = random.choice([parent1, parent2]).to_dict()
+    child = (parent1 if random.random() < 0.5 else parent2).to_dict()
+    # The child gets its own array genes; the parent's stay in the population
+    for param in list(array_genes_sizes.keys()):
+        child[param] = np.array(child[param], copy=True)
     child['info'] = 'Descendant of {}'.format(child["id"])
     child["date_created"] = int(time.time())
     del child["id"]
@@ -252,6 +271,7 @@ def mutate(child, mutate_prob, param_choices, array_genes_sizes):
                     current_p = child[param][change_index] + change_p
                     current_p = np.max([current_p, int(min_val)])
                     current_p = type(min_val)(current_p)
+                    child[param] = np.array(child[param], copy=True)
                     child[param][change_index] = current_p
 
     if(mutation_happened):
@@ -3,13 +3,16 @@ import os.path
 sys.path.append(os.path.abspath('../'))
 
 import numpy as np
+import pandas as pd
 import socket
 from time import time
-from tqdm import tqdm
 import argparse
-from database import Variables, Chromosome, db
+from database import Chromosome
+from storage import storage
+from islands import emigrate, immigrate
+from snapshot import save_snapshot, load_snapshot
 
-from GeneticAlgorithm_VAE import generate_random_chromosomes, train_generation, create_blank_dataframe, select_parents, cross_over, mutate, load_generation_from_sql, add_generation_to_sql
+from GeneticAlgorithm_VAE import generate_random_chromosomes, train_generation, create_blank_dataframe, select_parents, cross_over, mutate, load_generation_from_sql, update_generation_from_sql, add_generation_to_sql, genome_key, queue_size, num_children
 
 
 def debuge_message(message): print('[DEBUG] {}'.format(message))
@@ -22,16 +25,41 @@ if __name__ == '__main__':
                         help='Probability of crossover between generations')
     parser.add_argument('--mutate_prob', type=float, default=0.01,
                         help='Probability of mutation for each member')
+    parser.add_argument('--selection', type=str, default='rank',
+                        choices=['roulette', 'rank', 'tournament', 'nsga2'],
+                        help='How parents are chosen by fitness; nsga2 trades fitness against training time')
+    parser.add_argument('--tournament_size', type=int, default=2,
+                        help='Chromosomes per tournament with --selection tournament or nsga2')
     parser.add_argument('--population_size', type=int, default=100,
                         help='size of the population to evolve; preferably divisible by 2')
     parser.add_argument('--batch_size', type=int, default=128,
                         help='batch size')
     parser.add_argument('--num_epochs', type=int, default=100,
                         help='number of epochs')
-    parser.add_argument('--chroms_per_loop', type=float, default=10,
-                        help='Number of Chromosomes to create at a time per loop')
+    parser.add_argument('--chroms_per_loop', type=int, default=0,
+                        help='Untrained Chromosomes kept queued for the workers, a child being bred as '
+                        'soon as each result comes in (default: one per active worker)')
     parser.add_argument('--sleep_time', type=float, default=30,
-                        help='Interval time between training checks')
+                        help='Seconds between progress messages while waiting for results')
+    parser.add_argument('--serve_port', type=int, default=0,
+                        help='Serve the Flask app from this process on this port (needed with GA_STORAGE=memory)')
+    parser.add_argument('--island_dir', type=str, default='',
+                        help='Directory shared by the islands of an island-model GA, each a RunGA '
+                        'with its own server and database (default: a single population)')
+    parser.add_argument('--island', type=str, default='',
+                        help='Name of this island (default: host name and process id)')
+    parser.add_argument('--migration_interval', type=int, default=50,
+                        help='Chromosomes added to the population between migrations to and from the other islands')
+    parser.add_argument('--num_migrants', type=int, default=2,
+                        help='Fittest chromosomes sent to the other islands per migration')
+    parser.add_argument('--resample_duplicates', type=int, default=3,
+                        help='Times a child with the same genes as a chromosome of the population '
+                        'is bred again from new parents before it is dropped')
+    parser.add_argument('--snapshot', type=str, default='snapshot.npz',
+                        help='File the state of the GA is written to after every loop')
+    parser.add_argument('--resume', action='store_true',
+                        help='Carry on from the --snapshot of a stopped GA, with its island name and '
+                        'RNG state, reading only the rows stored since from the database')
 
     parser.add_argument('--max_dnn_layers', type=int, default=3,
                         help='Maximum number of VAE hidden layers')
@@ -70,6 +98,10 @@ if __name__ == '__main__':
 
     clargs = parser.parse_args()
 
+    if clargs.serve_port:
+        from flask_app import serve_in_background
+        serve_in_background(clargs.serve_port)
+
     param_choices = {'num_cnn_encoder': (1, 1),
                      'size_kernel_encoder': (1, 0),
                      'size_pool_encoder': (1, 0),
@@ -97,26 +129,95 @@ if __name__ == '__main__':
                 #   "size_dnn_decoder": 'num_dnn_decoder',
                    "size_dnn_encoder": 'num_dnn_encoder'}
 
-    generation = Chromosome.query.all()
-    if(len(generation) < clargs.population_size):
-        generate_random_chromosomes(clargs, array_genes_sizes)
+    if(clargs.resume):
+        frames, state = load_snapshot(clargs.snapshot)
+        print("Resumed {} Chromosomes from {}".format(len(frames['population']), clargs.snapshot))
+        # Rows stored after the snapshot can only be the children it holds
+        if(len(frames['children']) > 0 and storage.count_chromosomes(Chromosome.id > int(frames['population']['id'].max())) == 0):
+            add_generation_to_sql(frames['children'], array_genes_sizes)
+            print("Added {} Chromosomes bred before the stop".format(len(frames['children'])))
+        generation = frames['population']
     else:
-        print("Loading Generation From DB")
+        if(storage.count_chromosomes() < clargs.population_size):
+            generate_random_chromosomes(clargs, array_genes_sizes)
+        else:
+            print("Loading Generation From DB")
 
-    generation = train_generation(array_genes_sizes, sleep_time=clargs.sleep_time)
+        generation = train_generation(array_genes_sizes, sleep_time=clargs.sleep_time)
 
+    # Last epoch taken from each of the other islands
+    island = clargs.island if(clargs.island != '') else '{}-{}'.format(socket.gethostname(), os.getpid())
+    seen = {}
+    loop, migrated = 0, len(generation)
+    if(clargs.resume):
+        island = clargs.island if(clargs.island != '') else state['island']
+        seen, loop, migrated = state['seen'], state['loop'], state.get('migrated', 0)
+    if(clargs.island_dir != ''):
+        os.makedirs(clargs.island_dir, exist_ok=True)
+    # Genes of the chromosomes of the population, added to as new rows come in
+    genes = list(param_choices.keys())
+    genomes, known_id = set(), 0
     while True:
-        for _ in tqdm(range(clargs.chroms_per_loop)):
-            parent1, parent2 = select_parents(generation)
-            child = cross_over(parent1, parent2,
-                               clargs.cross_prob,
-                               list(param_choices.keys()), array_genes_sizes)
-
-            child = mutate(child,
-                           clargs.mutate_prob,
-                           param_choices, array_genes_sizes)
-
-            add_generation_to_sql(child, array_genes_sizes)
-
-        print("Added {} Chromosomes".format(clargs.chroms_per_loop))
-        generation = train_generation(array_genes_sizes, sleep_time=clargs.sleep_time)
+        # A child is bred for every result that leaves fewer than `queue_size` rows untrained
+        queued = queue_size(clargs.chroms_per_loop)
+        # Only the rows stored or trained since the last loop are read
+        generation = train_generation(array_genes_sizes, sleep_time=clargs.sleep_time, generation=generation,
+                                      remaining=queued - 1)
+        children_needed = num_children(generation, queued)
+
+        new = generation.loc[generation['id'] > known_id, genes]
+        genomes.update(genome_key(row, genes, array_genes_sizes) for row in new.to_dict('records'))
+        known_id = generation['id'].max()
+
+        # Parents of the whole loop in one draw, from the trained rows; the lowest fitness is the best
+        # NSGA-II weighs the training time, from the claim to the result
+        trained = generation[generation['date_trained'] > 0].reset_index(drop=True)
+        cost = trained['date_trained'] - trained['date_taken']
+        parents1, parents2 = select_parents(trained['fitness'], children_needed, clargs.selection,
+                                            maximize=False, tournament_size=clargs.tournament_size, cost=cost)
+        # A child with the same genes as a chromosome of the population, or another child of
+        # this loop, is bred again from new parents; one that keeps repeating is dropped
+        children, dropped = [], 0
+        for index1, index2 in zip(parents1, parents2):
+            for attempt in range(clargs.resample_duplicates + 1):
+                if(attempt > 0):
+                    index1, index2 = [parents[0] for parents in select_parents(
+                        trained['fitness'], 1, clargs.selection, maximize=False, tournament_size=clargs.tournament_size, cost=cost)]
+                parent1, parent2 = trained.iloc[index1], trained.iloc[index2]
+                child = cross_over(parent1, parent2,
+                                   clargs.cross_prob,
+                                   list(param_choices.keys()), array_genes_sizes)
+
+                child = mutate(child,
+                               clargs.mutate_prob,
+                               param_choices, array_genes_sizes)
+                key = genome_key(child, genes, array_genes_sizes)
+                if(key not in genomes):
+                    break
+            if(key in genomes):
+                dropped += 1
+                continue
+            genomes.add(key)
+            children.append(child)
+
+        # The parents' ids and claims stay with the parents
+        children = pd.DataFrame(children).drop(columns=['id', 'claim_id', 'worker', 'lease_expires'], errors='ignore')
+        loop = loop + 1
+        # Taken before the children are stored; a --resume stores them if they never were
+        save_snapshot(clargs.snapshot, {'population': generation, 'children': children},
+                      dict(loop=loop, island=island, seen=seen, migrated=migrated, config=vars(clargs)))
+        if(len(children) > 0):
+            add_generation_to_sql(children, array_genes_sizes)
+        print("Added {} Chromosomes, dropped {} with the genes of another".format(len(children), dropped))
+
+        if(clargs.island_dir != '' and len(generation) >= migrated + clargs.migration_interval):
+            migrated = len(generation)
+            # The population only grows, so its size numbers the migrations even across restarts
+            emigrate(clargs.island_dir, island, len(generation), generation, clargs.num_migrants, maximize=False)
+            migrants = immigrate(clargs.island_dir, island, seen)
+            if(len(migrants) > 0):
+                # Stored trained, as they were on their island
+                columns = [name for name in generation.columns if name not in ['id', 'claim_id', 'worker', 'lease_expires']]
+                add_generation_to_sql(migrants[columns].copy(), array_genes_sizes)
+                print("Added {} Migrants from other islands".format(len(migrants)))
+                generation = update_generation_from_sql(generation, array_genes_sizes)
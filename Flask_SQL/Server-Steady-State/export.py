@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+import zlib
+
+import numpy as np
+import pandas as pd
+from flask import Response
+
+# Formats of /GetDatabase: a JSON document, one JSON object per line, or a
+# table for offline analysis
+MIMETYPES = {'json': 'application/json',
+             'ndjson': 'application/x-ndjson',
+             'csv': 'text/csv',
+             'parquet': 'application/vnd.apache.parquet'}
+
+def plain_value(value, default=0):
+    # A column value as it goes out over the wire; array genes as JSON text
+    if(value is None):
+        return default
+    if(isinstance(value, np.ndarray)):
+        return json.dumps(value.tolist())
+    return value
+
+def encode_rows(batches, columns, fmt, head='[', tail=']'):
+    '''Text chunks of `fmt` for batches of row dicts, one chunk per batch'''
+    first = True
+    if(fmt == 'json'):
+        yield head
+    elif(fmt == 'csv'):
+        yield ','.join(columns) + '\r\n'
+    for batch in batches:
+        rows = [{column: plain_value(row[column]) for column in columns} for row in batch]
+        if(fmt == 'json'):
+            chunk = ', '.join(json.dumps(row, sort_keys=True) for row in rows)
+            yield chunk if first else ', ' + chunk
+        elif(fmt == 'ndjson'):
+            yield ''.join(json.dumps(row, sort_keys=True) + '\n' for row in rows)
+        else:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows([row[column] for column in columns] for row in rows)
+            yield buffer.getvalue()
+        first = False
+    if(fmt == 'json'):
+        yield tail
+
+def gzipped(chunks):
+    # Compress a stream chunk by chunk
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if(len(data) > 0):
+            yield data
+    yield compressor.flush()
+
+def to_parquet(batches, columns):
+    rows = [{column: plain_value(row[column]) for column in columns} for batch in batches for row in batch]
+    buffer = io.BytesIO()
+    pd.DataFrame(rows, columns=columns).to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+def export_response(storage, columns, criteria, after=0, limit=None, fmt='json', gzip=False,
+                    head='[', tail=']'):
+    '''Stream the matching rows as `fmt`, gzip compressed when the client
+        accepts it. With a `limit`, the X-Next-Cursor header holds the
+        `after` of the next page.'''
+    headers = {}
+    cursor = storage.next_cursor(*criteria, after=after, limit=limit)
+    if(cursor is not None):
+        headers['X-Next-Cursor'] = str(cursor)
+    batches = storage.iter_rows(columns, *criteria, after=after, limit=limit)
+
+    if(fmt == 'parquet'):
+        try:
+            body = to_parquet(batches, columns)
+        except ImportError:
+            return Response('Parquet export needs pyarrow or fastparquet installed on the server',
+                            status=501, mimetype='text/plain')
+        return Response(body, mimetype=MIMETYPES[fmt], headers=headers)
+
+    if(fmt == 'csv'):
+        headers['Content-Disposition'] = 'attachment; filename=chromosomes.csv'
+    chunks = encode_rows(batches, columns, fmt, head, tail)
+    if(gzip):
+        headers['Content-Encoding'] = 'gzip'
+        chunks = gzipped(chunks)
+    return Response(chunks, mimetype=MIMETYPES[fmt], headers=headers)
@@ -2,10 +2,19 @@
 # A very simple Flask Hello World app for you to get started with...
 
 from flask import request, jsonify, render_template
-from database import Chromosome, db, app
-from sqlalchemy import func
+from database import Chromosome, app
+from storage import storage
+from export import MIMETYPES, export_response, plain_value
+from sqlalchemy import and_
 import numpy as np
-import time
+import threading
+
+def serve_in_background(port):
+    # Lets a GA driver host the endpoints itself (required with GA_STORAGE=memory)
+    server = threading.Thread(target=app.run, kwargs={'host': '0.0.0.0', 'port': port, 'threaded': True})
+    server.daemon = True
+    server.start()
+    return server
 
 @app.route('/')
 def index():
@@ -15,65 +24,142 @@ def index():
 def AddChrom():
     if request.method == 'GET':
 
-        c = db.session.query(Chromosome).filter(Chromosome.id == request.args.get('id'),
-                                                Chromosome.date_created == request.args.get('date_created')).first()
+        # By primary key or claim id; older workers send no claim id, and are matched on the
+        # id and creation date of their row
+        claim_id = request.args.get('claim_id') or None
+        legacy = 'id' in request.args and claim_id is None
+        if('id' in request.args):
+            if(result_id(request.args) is None):
+                return 'id must be an integer', 400
+            criteria = [Chromosome.date_created == request.args.get('date_created')] if(legacy) else []
+            c = storage.get_chromosome(Chromosome.id == result_id(request.args), *criteria)
+        else:
+            # A row still held under the claim; a batch claim covers several rows
+            held = storage.get_chromosomes(Chromosome.claim_id == claim_id, storage.held()) if(claim_id is not None) else []
+            if(len(held) > 1):
+                return 'claim_id {} holds {} chromosomes; send the id of the one trained'.format(claim_id, len(held)), 400
+            c = held[0] if(len(held) == 1) else None
         if(c == None):
             return '1'
 
-        for key in request.args.keys():
-            setattr(c, key, request.args.get(key))
-
-        db.session.commit()
+        # Through the same claim check as /Results, so a late result cannot overwrite a row
+        # that was reissued or trained by someone else; only an older worker, which does not
+        # know its claim, may report for whichever claim holds the row
+        storage.record_results([dict(request.args.to_dict(), id=c.id, claim_id=claim_id)], any_claim=legacy)
         return "1"
     return '0'
 
 def obj2dict(obj, default=0):
     ret = {}
     for col in obj.__table__.columns:
-        if(getattr(obj, col.name) == None):
-            ret[col.name] = default
-        else:
-            ret[col.name] = getattr(obj, col.name)
+        ret[col.name] = plain_value(getattr(obj, col.name), default)
     return ret
 
+def database_query(filters):
+    '''Columns, criteria and page of a /GetDatabase request, or an error
+        message. `filters` maps query arguments to column criteria.'''
+    columns = Chromosome.__table__.columns.keys()
+    fields = request.args.get('fields')
+    fields = columns if(fields is None) else fields.split(',')
+    unknown = [field for field in fields if field not in columns]
+    if(len(unknown) > 0):
+        return None, 'Unknown fields: {}'.format(', '.join(unknown))
+    if(request.args.get('format', 'json') not in MIMETYPES):
+        return None, 'format must be one of {}'.format(', '.join(MIMETYPES.keys()))
+    limit = request.args.get('limit', None, type=int)
+    if(limit is not None and limit < 1):
+        return None, 'limit must be at least 1'
+
+    try:
+        criteria = [filters[name](request.args.get(name)) for name in filters.keys() if name in request.args]
+    except (KeyError, ValueError):
+        return None, 'Bad value for a filter ({})'.format(', '.join(filters.keys()))
+    return dict(columns=fields, criteria=criteria, after=request.args.get('after', 0, type=int), limit=limit,
+                fmt=request.args.get('format', 'json'), gzip='gzip' in request.accept_encodings), None
+
+# Training states, as counted by /GetDatabase
+STATES = {'trained': Chromosome.date_trained > 0,
+          'taken': and_(Chromosome.date_trained <= 0, Chromosome.date_taken > 0),
+          'not_taken': and_(Chromosome.date_trained <= 0, Chromosome.date_taken <= 0)}
+
+# Filters of /GetDatabase
+DATABASE_FILTERS = {'state': lambda value: STATES[value]}
+
 @app.route('/GetDatabase')
 def GetDatabase():
+    # Streamed in batches; see database_query for the paging, projection and filter arguments
     if request.method == 'GET':
-        chroms = db.session.query(Chromosome).all()
-        trained = 0
-        taken = 0
-        not_taken = 0
-        resp = []
-        for c in chroms:
-            resp.append(obj2dict(c))
-            if(c.date_trained > 0):
-                trained += 1
-            elif(c.date_taken > 0):
-                taken += 1
-            else:
-                not_taken += 1
-
-        return jsonify({"4-Chroms": resp, "2-Taken": taken, "1-Trained": trained, "3-Not Taken": not_taken})
+        query, error = database_query(DATABASE_FILTERS)
+        if(query == None):
+            return error, 400
+
+        counts = {state: storage.count_chromosomes(criterion, *query['criteria']) for state, criterion in STATES.items()}
+        head = '{{"1-Trained": {}, "2-Taken": {}, "3-Not Taken": {}, "4-Chroms": ['.format(
+            counts['trained'], counts['taken'], counts['not_taken'])
+        return export_response(storage, head=head, tail=']}', **query)
     return '0'
 
 @app.route('/GetUnTrainedChrom')
 def GetUnTrainedChrom():
     if request.method == 'GET':
-        c = db.session.query(Chromosome).filter(Chromosome.date_taken <= 0).first()
-        if(c == None):
-            c = db.session.query(Chromosome).filter(Chromosome.date_trained <= 0).order_by(db.func.rand()).first()
+        c = storage.claim_chromosome(request.args.get('worker', ''))
         if(c == None):
             return "0"
-        c.date_taken = int(time.time())
-        db.session.commit()
         return jsonify(obj2dict(c))
     return '0'
 
+@app.route('/ClaimChromosomes')
+def ClaimChromosomes():
+    if request.method == 'GET':
+        n = max(request.args.get('n', 1, type=int), 1)
+        # With `wait`, hold the request open (up to a minute) until work shows up
+        wait = min(request.args.get('wait', 0, type=float), 60)
+        if(wait > 0):
+            chroms = storage.wait_for_work(n, request.args.get('worker', ''), timeout=wait)
+        else:
+            chroms = storage.claim_chromosomes(n, request.args.get('worker', ''))
+        return jsonify([obj2dict(c) for c in chroms])
+    return '0'
+
+@app.route('/Heartbeat')
+def Heartbeat():
+    # "1" while the worker still holds the lease on its claim, "0" once it
+    # has expired and the chromosome may have been handed to someone else
+    if request.method == 'GET':
+        # Workers send the id of the row they train; without one the whole claim is renewed
+        id = result_id(request.args) if('id' in request.args) else None
+        if('id' in request.args and id is None):
+            return '0'
+        renewed = storage.renew_lease(request.args.get('claim_id', ''), id)
+        return "1" if renewed > 0 else "0"
+    return '0'
+
+def result_id(result):
+    # Row id of a submitted result as an int, None when it has no usable one
+    try:
+        return int(result['id'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+@app.route('/Results', methods=['POST'])
+def Results():
+    # JSON body: one result or a list of them, each carrying the row `id` and
+    # `claim_id`; a result without a numeric id or a claim_id is ignored
+    results = request.get_json(force=True, silent=True)
+    if isinstance(results, dict):
+        results = [results]
+    if(not isinstance(results, list) or not all(isinstance(result, dict) for result in results)):
+        return 'Expected a result object or a list of them', 400
+    applied = storage.record_results([dict(result, id=result_id(result)) for result in results
+                                      if result_id(result) is not None])
+    ignored = [result.get('id') for result in results if result_id(result) not in applied]
+    return jsonify({'applied': applied, 'ignored': ignored})
+
 @app.route('/Visuals')
 def Visuals():
     if request.method == 'GET':
         resp = {}
-        chroms = db.session.query(Chromosome).order_by(Chromosome.generationID, Chromosome.chromosomeID).all()
+        chroms = storage.get_chromosomes(order_by=[Chromosome.generationID, Chromosome.chromosomeID])
         population = chroms[0].population_size
 
         def get_index(generationID, chromosomeID):
@@ -81,8 +167,7 @@ def Visuals():
 
         nodes = []
 
-        min_val = db.session.query(func.min(Chromosome.fitness)).filter(Chromosome.fitness > 0).first()[0]
-        max_val = db.session.query(func.max(Chromosome.fitness)).filter(Chromosome.fitness > 0).first()[0]
+        min_val, max_val = storage.fitness_range()
 
         for c in chroms:
             fitness = c.fitness
@@ -0,0 +1,58 @@
+import json
+import os
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+# Island model: several GA drivers, each with its own database and Flask app
+# (GA_DATABASE_URI) and its own workers, evolve apart and trade their fittest
+# chromosomes through a directory they all see. Each island keeps one file
+# there, rewritten with its latest migrants, and reads the others' files.
+
+def migrants_path(directory, island):
+    return os.path.join(directory, '{}.json'.format(island))
+
+def emigrate(directory, island, epoch, frame, k, maximize=True):
+    '''Publish the `k` fittest trained rows of `frame` as the migrants of
+        `island` at `epoch`, in place of its earlier ones. `epoch` only
+        grows: the generation, or the size of a steady-state population.
+        The file is swapped in whole, so other islands never read it half
+        written.'''
+    # Untrained and failed rows have fitness -1
+    trained = frame[frame['fitness'] > 0]
+    best = trained.sort_values('fitness', ascending=not maximize).head(k)
+    rows = best.to_dict('records')
+    path = migrants_path(directory, island)
+    with open(path + '.tmp', 'w') as f:
+        # Array genes travel as JSON lists
+        json.dump({'island': island, 'epoch': int(epoch), 'rows': rows}, f, default=lambda array: array.tolist())
+    os.replace(path + '.tmp', path)
+    return len(rows)
+
+def immigrate(directory, island, seen):
+    '''Migrants the other islands published since they were last taken, as
+        one frame (empty when there are none); their `info` names the island
+        they came from. `seen` maps each island to the epoch last taken from
+        it and is updated.'''
+    frames = []
+    for path in sorted(glob(os.path.join(directory, '*.json'))):
+        try:
+            with open(path) as f:
+                published = json.load(f)
+        except (OSError, ValueError):
+            continue
+        name = published['island']
+        if(name == island or published['epoch'] <= seen.get(name, -1)):
+            continue
+        seen[name] = published['epoch']
+        frame = pd.DataFrame(published['rows'])
+        frame['info'] = 'Migrant from {}'.format(name)
+        frames.append(frame)
+    if(len(frames) == 0):
+        return pd.DataFrame()
+    migrants = pd.concat(frames, ignore_index=True)
+    for name in migrants.columns:
+        if(migrants[name].map(lambda value: isinstance(value, list)).any()):
+            migrants[name] = [np.asarray(value) for value in migrants[name]]
+    return migrants
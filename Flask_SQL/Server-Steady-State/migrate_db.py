@@ -0,0 +1,5 @@
+from storage import storage
+
+# Run after pulling schema changes; SQLite databases are migrated on startup
+storage.migrate()
+print("Database schema is up to date")
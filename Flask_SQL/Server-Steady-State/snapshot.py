@@ -0,0 +1,48 @@
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from numpy import random
+
+# Local snapshots of a GA driver, so that a restarted driver picks up where it
+# stopped without reading the whole run back from the database. A snapshot is
+# one .npz file: a column per array of each frame, and the driver's state and
+# the NumPy RNG state as JSON. Text and array-gene columns are stored as object
+# arrays, so the file is only to be read by the driver that wrote it.
+
+def save_snapshot(path, frames, state):
+    '''Write the DataFrames `frames` (name -> frame), the JSON-able dict
+        `state` and the RNG state to `path`. The file is swapped in whole,
+        so a crash while writing leaves the previous snapshot.'''
+    arrays = {}
+    for name, frame in frames.items():
+        for column in frame.columns:
+            arrays['{}/{}'.format(name, column)] = frame[column].to_numpy()
+    rng, keys, position, has_gauss, cached_gaussian = random.get_state()
+    arrays['rng_keys'] = keys
+    state = dict(state, frames=list(frames.keys()),
+                 rng=[rng, int(position), int(has_gauss), float(cached_gaussian)])
+    # NumPy scalars (fitnesses, ids) are written as plain numbers
+    arrays['state'] = np.array(json.dumps(state, default=lambda value: value.tolist()))
+
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(buffer.getvalue())
+    os.replace(path + '.tmp', path)
+
+def load_snapshot(path):
+    '''(frames, state) of the snapshot at `path`; the RNG is put back in the
+        state it was in when the snapshot was taken'''
+    with np.load(path, allow_pickle=True) as arrays:
+        state = json.loads(str(arrays['state']))
+        frames = {name: pd.DataFrame() for name in state.pop('frames')}
+        for key in arrays.files:
+            if('/' in key):
+                name, column = key.split('/', 1)
+                frames[name][column] = arrays[key]
+        rng, position, has_gauss, cached_gaussian = state.pop('rng')
+        random.set_state((rng, arrays['rng_keys'], position, has_gauss, cached_gaussian))
+    return frames, state
@@ -0,0 +1,479 @@
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+from sqlalchemy import and_, bindparam, event, func, inspect, literal, or_, select, text, type_coerce
+from sqlalchemy.exc import IntegrityError
+
+from database import app, db, Chromosome, PackedArray, Variables, pack_array, unpack_arrays
+
+
+class Notifier(object):
+    '''Lets threads block until one of the counters kept in the `Variables`
+        table moves. Writes made through this process wake the waiters at
+        once; writes made by other processes are noticed by a single watcher
+        thread that reads the counters every `poll_interval` seconds, and only
+        while somebody is waiting.'''
+
+    def __init__(self, storage, poll_interval=0.25):
+        self.storage = storage
+        self.poll_interval = poll_interval
+        self.condition = threading.Condition()
+        self.versions = {}
+        self.seen = {}
+        self.waiters = 0
+        self.watcher = None
+
+    def changed(self, name):
+        with self.condition:
+            self.versions[name] = self.versions.get(name, 0) + 1
+            self.condition.notify_all()
+
+    def watch(self):
+        while True:
+            with self.condition:
+                while self.waiters == 0:
+                    self.condition.wait()
+            time.sleep(self.poll_interval)
+            for name in list(self.seen.keys()):
+                value = self.storage.get_variable(name, 0)
+                if self.seen[name] != value:
+                    self.seen[name] = value
+                    self.changed(name)
+
+    def wait(self, name, predicate, timeout):
+        '''Call `predicate` now and again after each change of counter `name`
+            until it returns something truthy or `timeout` seconds pass;
+            returns its last result.'''
+        deadline = time.time() + timeout
+        with self.condition:
+            self.versions.setdefault(name, 0)
+            if name not in self.seen:
+                self.seen[name] = self.storage.get_variable(name, 0)
+            if self.watcher is None:
+                self.watcher = threading.Thread(target=self.watch)
+                self.watcher.daemon = True
+                self.watcher.start()
+
+        while True:
+            with self.condition:
+                version = self.versions[name]
+            result = predicate()
+            remaining = deadline - time.time()
+            if result or remaining <= 0:
+                return result
+
+            with self.condition:
+                self.waiters += 1
+                self.condition.notify_all()
+                try:
+                    while self.versions[name] == version and remaining > 0:
+                        self.condition.wait(remaining)
+                        remaining = deadline - time.time()
+                finally:
+                    self.waiters -= 1
+
+
+class Storage(object):
+    '''Every read and write of the GA tables goes through one of these methods,
+        so that the Flask app and the GA drivers do not depend on the backend
+        selected in `database.py`. Each call is its own short transaction;
+        rows are returned detached and are updated by primary key.'''
+
+    # Serialize transactions inside this process (needed when every thread
+    # shares a single connection)
+    serialize = False
+
+    def __init__(self, db, lease_time=600, poll_interval=0.25):
+        self.db = db
+        self.lease_time = lease_time
+        self.lock = threading.RLock() if self.serialize else None
+        self.notifier = Notifier(self, poll_interval)
+
+    @property
+    def session(self):
+        return self.db.session
+
+    @contextmanager
+    def transaction(self):
+        if self.lock is not None:
+            self.lock.acquire()
+        try:
+            yield self.db.session
+            self.db.session.commit()
+        except:
+            self.db.session.rollback()
+            raise
+        finally:
+            self.db.session.close()
+            if self.lock is not None:
+                self.lock.release()
+
+    def create_all(self):
+        self.db.create_all()
+
+    def migrate(self):
+        '''Bring an existing database up to the models: create missing tables
+            and add the columns and indexes declared since it was created.
+            Processes starting together on one database take turns (see
+            `lock_schema`), each seeing the schema the one before left.'''
+        engine = self.db.engine
+        preparer = engine.dialect.identifier_preparer
+        with engine.begin() as connection:
+            self.lock_schema(connection)
+            self.db.metadata.create_all(bind=connection)
+            inspector = inspect(connection)
+            for table in self.db.metadata.sorted_tables:
+                reflected = {column['name']: column for column in inspector.get_columns(table.name)}
+                columns = list(reflected.keys())
+                for column in table.columns:
+                    if column.name in columns:
+                        continue
+                    ddl = 'ALTER TABLE {} ADD COLUMN {} {}'.format(preparer.format_table(table),
+                                                                   preparer.format_column(column),
+                                                                   column.type.compile(dialect=engine.dialect))
+                    if column.default is not None and column.default.is_scalar:
+                        default = literal(column.default.arg, column.type)
+                        ddl += ' DEFAULT {}'.format(default.compile(dialect=engine.dialect,
+                                                                    compile_kwargs={'literal_binds': True}))
+                    connection.execute(text(ddl))
+
+                indexes = [index['name'] for index in inspector.get_indexes(table.name)]
+                for index in table.indexes:
+                    if index.name in indexes:
+                        continue
+                    try:
+                        index.create(bind=connection)
+                    except IntegrityError as e:
+                        # A unique key over rows that already repeat it; fix the data and migrate again
+                        print('[WARNING] Could not create {}: {}'.format(index.name, e.orig))
+
+                for column in table.columns:
+                    if isinstance(column.type, PackedArray) and column.name in columns:
+                        self.pack_json_arrays(connection, table, column, reflected[column.name]['type'])
+
+    def lock_schema(self, connection):
+        # MySQL commits every DDL statement on its own; nothing to hold
+        pass
+
+    def pack_json_arrays(self, connection, table, column, reflected_type):
+        # Array genes used to be JSON text in String columns; repack those values in place
+        if connection.dialect.name == 'sqlite':
+            legacy = func.typeof(column) == 'text'
+        elif not isinstance(reflected_type, db.LargeBinary):
+            connection.execute(text('ALTER TABLE {} MODIFY {} {}'.format(
+                connection.dialect.identifier_preparer.format_table(table),
+                connection.dialect.identifier_preparer.format_column(column),
+                column.type.compile(dialect=connection.dialect))))
+            legacy = literal(True)
+        else:
+            return
+        rows = connection.execute(select(table.c.id, type_coerce(column, db.Text)).where(legacy)).fetchall()
+        if len(rows) == 0:
+            return
+        print('[INFO] Packing {} JSON values of {}'.format(len(rows), column.name))
+        statement = table.update().where(table.c.id == bindparam('_id')).values({column.name: bindparam('_packed')})
+        connection.execute(statement, [{'_id': id, '_packed': pack_array(json.loads(value or '[]'))} for id, value in rows])
+
+    def drop_all(self):
+        with self.transaction() as session:
+            session.query(Chromosome).delete()
+        self.db.drop_all()
+        self.db.create_all()
+
+    def get_variable(self, name, default=None):
+        with self.transaction() as session:
+            var = session.query(Variables).filter(Variables.name == name).first()
+        if var is None:
+            return default
+        return var.value
+
+    def get_variables(self, names, default=None):
+        # Several variables in one query, as {name: value}
+        with self.transaction() as session:
+            found = dict(session.query(Variables.name, Variables.value).filter(Variables.name.in_(names)))
+        return {name: found.get(name, default) for name in names}
+
+    def set_variable(self, name, value):
+        with self.transaction() as session:
+            var = session.query(Variables).filter(Variables.name == name).first()
+            if var is None:
+                session.add(Variables(name=name, value=value))
+            else:
+                var.value = value
+
+    def bump(self, session, name):
+        # Advance counter `name`; callers wake the local waiters after commit
+        updated = session.query(Variables).filter(Variables.name == name)\
+            .update({'value': Variables.value + 1}, synchronize_session=False)
+        if updated == 0:
+            session.add(Variables(name=name, value=1))
+
+    def get_chromosome(self, *criteria, order_by=()):
+        with self.transaction() as session:
+            return session.query(Chromosome).filter(*criteria).order_by(*order_by).first()
+
+    def get_chromosomes(self, *criteria, order_by=()):
+        with self.transaction() as session:
+            return session.query(Chromosome).filter(*criteria).order_by(*order_by).all()
+
+    def count_chromosomes(self, *criteria):
+        with self.transaction() as session:
+            return session.query(func.count(Chromosome.id)).filter(*criteria).scalar()
+
+    def count_workers(self):
+        '''Workers holding a live lease, or that reported a result within the
+            last `lease_time` seconds and are presumably waiting for work'''
+        now = time.time()
+        with self.transaction() as session:
+            return session.query(func.count(func.distinct(Chromosome.worker)))\
+                .filter(or_(and_(self.held(), Chromosome.lease_expires >= now),
+                            Chromosome.date_trained > now - self.lease_time), Chromosome.worker != '').scalar()
+
+    def fitness_range(self):
+        with self.transaction() as session:
+            return session.query(func.min(Chromosome.fitness), func.max(Chromosome.fitness)).filter(Chromosome.fitness > 0).first()
+
+    def add_chromosome(self, values):
+        with self.transaction() as session:
+            chrom = Chromosome(**values)
+            session.add(chrom)
+            self.bump(session, 'WorkVersion')
+        self.notifier.changed('WorkVersion')
+        return chrom
+
+    def update_chromosome(self, id, values):
+        with self.transaction() as session:
+            updated = session.query(Chromosome).filter(Chromosome.id == id).update(values, synchronize_session=False)
+            self.bump(session, 'WorkVersion')
+        self.notifier.changed('WorkVersion')
+        return updated
+
+    def claimable(self):
+        # Rows nobody has been handed yet
+        return Chromosome.date_taken <= 0
+
+    def held(self):
+        # Rows a worker is training
+        return and_(Chromosome.date_trained <= 0, Chromosome.date_taken > 0)
+
+    def reclaimable(self, now):
+        # Held rows whose worker stopped renewing its lease
+        return and_(self.held(), Chromosome.lease_expires < now)
+
+    def claim_order(self):
+        # Oldest first, led by the range-filtered column so the claim walks its index
+        # (date_taken, then date_trained) instead of scanning the table in id order
+        return [Chromosome.date_taken, Chromosome.id]
+
+    def reclaim_order(self):
+        return [Chromosome.date_trained, Chromosome.lease_expires]
+
+    def claim_values(self, now):
+        return {'date_taken': int(now)}
+
+    def claim_chromosomes(self, n=1, worker=''):
+        '''Atomically hand out up to `n` chromosomes to `worker`: unclaimed ones
+            first, then ones whose lease has expired (oldest first). Each row is
+            re-checked by the conditional UPDATE, so however many workers race
+            for the same rows every row is claimed exactly once.'''
+        claim_id = uuid.uuid4().hex
+        now = time.time()
+        values = dict(self.claim_values(now), claim_id=claim_id, worker=worker,
+                      lease_expires=now + self.lease_time)
+        with self.transaction() as session:
+            claimed = 0
+            for criterion, order_by in [(self.claimable(), self.claim_order()),
+                                        (self.reclaimable(now), self.reclaim_order())]:
+                ids = self.lock_claimable(session, criterion, order_by, n - claimed)
+                claimed += session.query(Chromosome).filter(Chromosome.id.in_(ids), criterion)\
+                    .update(values, synchronize_session=False)
+                if claimed >= n:
+                    break
+            return session.query(Chromosome).filter(Chromosome.claim_id == claim_id).order_by(Chromosome.id).all()
+
+    def claim_chromosome(self, worker=''):
+        chroms = self.claim_chromosomes(1, worker)
+        return chroms[0] if len(chroms) > 0 else None
+
+    def lock_claimable(self, session, criterion, order_by, n):
+        # Ids to claim; the subquery keeps each pass of the claim in a single UPDATE
+        candidates = session.query(Chromosome.id).filter(criterion).order_by(*order_by).limit(n).subquery()
+        return select(candidates.c.id)
+
+    def renew_lease(self, claim_id, id=None):
+        '''Push back the expiry of row `id` if it is still held under
+            `claim_id`, or of every row still held under it when no `id` is
+            given. Returns the number of rows renewed: 0 means the lease was
+            lost.'''
+        if not claim_id:
+            return 0
+        criteria = [Chromosome.claim_id == claim_id, self.held()] + ([Chromosome.id == id] if id is not None else [])
+        now = time.time()
+        with self.transaction() as session:
+            return session.query(Chromosome).filter(*criteria)\
+                .update({'lease_expires': now + self.lease_time}, synchronize_session=False)
+
+    def record_results(self, results, any_claim=False):
+        '''Apply a batch of worker results, each a dict holding the row `id`,
+            the `claim_id` it was handed out under and the columns to set.
+            Only rows still held under that claim are updated, so a result
+            that is re-sent, or comes from a worker whose lease was
+            reclaimed, is ignored. A result without a `claim_id` is ignored
+            as well, unless `any_claim` is set for the older workers that do
+            not know their claim: then it goes to whichever claim holds the
+            row. Returns the ids that were applied.'''
+        columns = [column for column in Chromosome.__table__.columns.keys()
+                   if column not in ['id', 'claim_id', 'worker', 'lease_expires']]
+        by_id, claims = {}, {}
+        for result in results:
+            by_id[int(result['id'])] = {key: value for key, value in result.items() if key in columns}
+            claims[int(result['id'])] = result.get('claim_id') or None
+        if len(by_id) == 0:
+            return []
+
+        table = Chromosome.__table__
+        with self.transaction() as session:
+            claim_ids = dict(session.query(Chromosome.id, Chromosome.claim_id)
+                             .filter(Chromosome.id.in_(list(by_id.keys())), self.held()))
+            applied = [id for id in sorted(claim_ids)
+                       if(claims[id] == claim_ids[id] if claims[id] is not None else any_claim)]
+            # One executemany per distinct set of reported columns (normally just one)
+            batches = {}
+            for id in applied:
+                values = by_id[id]
+                batches.setdefault(tuple(sorted(values.keys())), []).append(dict(values, _id=id,
+                                                                                 _claim_id=claim_ids[id]))
+            for keys, params in batches.items():
+                statement = table.update().where(and_(table.c.id == bindparam('_id'),
+                                                      table.c.claim_id == bindparam('_claim_id'),
+                                                      self.held()))\
+                    .values({key: bindparam(key) for key in keys})
+                session.execute(statement, params)
+            self.bump(session, 'ResultVersion')
+        self.notifier.changed('ResultVersion')
+        return applied
+
+    def read_frame(self, *criteria):
+        '''Matching rows as a DataFrame; array genes are left packed, decode
+            them with database.unpack_arrays.'''
+        columns = [type_coerce(column, db.LargeBinary).label(column.name) if isinstance(column.type, PackedArray)
+                   else column for column in Chromosome.__table__.columns]
+        with self.transaction() as session:
+            statement = select(*columns).where(*criteria)
+            return pd.read_sql(statement, session.connection())
+
+    def iter_rows(self, columns, *criteria, after=0, limit=None, batch_size=1000):
+        '''Yield the matching rows with id > `after` in id order, as lists of
+            {column: value} dicts (always including id), one list per batch.
+            Each batch is its own short transaction resuming after the last
+            id seen, so an export never holds the database for its whole
+            length.'''
+        table = Chromosome.__table__
+        names = ['id'] + [name for name in columns if name != 'id']
+        selected = [table.c[name] for name in names]
+        while limit is None or limit > 0:
+            n = batch_size if limit is None else min(batch_size, limit)
+            with self.transaction() as session:
+                statement = select(*selected).where(table.c.id > after, *criteria).order_by(table.c.id).limit(n)
+                rows = session.execute(statement).fetchall()
+            if len(rows) == 0:
+                return
+            yield [dict(zip(names, row)) for row in rows]
+            after = rows[-1].id
+            limit = None if limit is None else limit - len(rows)
+            if len(rows) < n:
+                return
+
+    def next_cursor(self, *criteria, after=0, limit=None):
+        # `after` of the page following this one, or None when this page is the last
+        if limit is None:
+            return None
+        with self.transaction() as session:
+            ids = session.query(Chromosome.id).filter(Chromosome.id > after, *criteria)\
+                .order_by(Chromosome.id).offset(limit - 1).limit(2).all()
+        return ids[0].id if len(ids) == 2 else None
+
+    def read_arrays(self, names, *criteria, order_by=()):
+        '''Array genes `names` of the matching rows, each decoded in one pass
+            into a padded matrix: {name: (matrix, lengths)}'''
+        table = Chromosome.__table__
+        with self.transaction() as session:
+            statement = select(*[type_coerce(table.c[name], db.LargeBinary) for name in names])\
+                .where(*criteria).order_by(*order_by)
+            rows = session.execute(statement).fetchall()
+        return {name: unpack_arrays([row[k] for row in rows]) for k, name in enumerate(names)}
+
+    def append_frame(self, generation):
+        with self.transaction() as session:
+            generation.to_sql(Chromosome.__tablename__, session.connection(), if_exists='append', index=False)
+            self.bump(session, 'WorkVersion')
+        self.notifier.changed('WorkVersion')
+
+    def wait_for_work(self, n=1, worker='', timeout=30):
+        # Long-poll flavour of `claim_chromosomes`
+        return self.notifier.wait('WorkVersion', lambda: self.claim_chromosomes(n, worker), timeout)
+
+    def wait_for_results(self, *criteria, timeout=30, remaining=0):
+        '''Block until at most `remaining` chromosomes match `criteria`
+            (typically: not trained yet) or `timeout` passes; True once no
+            more than that are left.'''
+        if(remaining == 0):
+            return self.notifier.wait('ResultVersion', lambda: self.get_chromosome(*criteria) is None, timeout)
+        return self.notifier.wait('ResultVersion', lambda: self.count_chromosomes(*criteria) <= remaining, timeout)
+
+
+class MySQLStorage(Storage):
+    '''The shared MySQL server every worker talks to.'''
+
+    def lock_claimable(self, session, criterion, order_by, n):
+        # MySQL refuses LIMIT inside an IN subquery, so lock the candidate
+        # rows instead; SKIP LOCKED (MySQL 8 / MariaDB 10.6) lets concurrent
+        # claims pass each other instead of queueing on the same rows.
+        dialect = session.connection().dialect
+        if getattr(dialect, 'is_mariadb', False):
+            skip_locked = dialect.server_version_info >= (10, 6)
+        else:
+            skip_locked = dialect.server_version_info >= (8, 0, 1)
+        query = session.query(Chromosome.id).filter(criterion).order_by(*order_by).limit(n)
+        return [row.id for row in query.with_for_update(skip_locked=skip_locked)]
+
+
+class SQLiteStorage(Storage):
+    '''Local database file in WAL mode: readers never block the writer.'''
+
+    journal_mode = 'WAL'
+
+    def __init__(self, db, lease_time=600, poll_interval=0.25):
+        super(SQLiteStorage, self).__init__(db, lease_time, poll_interval)
+        event.listen(db.engine, 'connect', self.configure_connection)
+        self.migrate()
+
+    def lock_schema(self, connection):
+        # Take the write lock before looking at the schema, so that a second
+        # process does not create the tables the first is creating
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+    def configure_connection(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode={}'.format(self.journal_mode))
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+
+class MemoryStorage(SQLiteStorage):
+    '''Database held in memory for single-host runs and tests; the GA driver
+        has to serve the Flask app itself (see `--serve_port`).'''
+
+    journal_mode = 'MEMORY'
+    serialize = True
+
+
+STORAGES = {'mysql': MySQLStorage,
+            'sqlite': SQLiteStorage,
+            'memory': MemoryStorage}
+
+storage = STORAGES[app.config['STORAGE_BACKEND']](db, app.config['LEASE_TIME'], app.config['POLL_INTERVAL'])
@@ -0,0 +1,90 @@
+'''Time to breed a whole generation of each Generational GA the way its
+    RunGA loop does: Population.from_frame, select_parents, cross_over,
+    mutate (and refactor_weights for the VAE), then back to a DataFrame.
+    The GA modules import paramiko, so it has to be installed.
+
+    python benchmarks/breeding.py [--population_size 10000] [--repeat 5]'''
+import argparse
+import importlib
+import os
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+
+from common import FLASK_SQL, load_server
+
+# Mutation ranges and minimums of each RunGA script
+VARIANTS = {'VAE': ('GeneticAlgorithm_VAE',
+                    {'num_vae_layers': (1, 1), 'num_dnn_layers': (1, 1), 'size_vae_latent': (10, 1),
+                     'size_vae_hidden': (100, 1), 'size_dnn_hidden': (100, 1), 'num_conv_layers': (1, 1),
+                     'size_kernel': (1, 0), 'size_pool': (1, 0), 'size_filter': (10, 1),
+                     'l1_coef': (0.1, 0.0), 'l2_coef': (0.1, 0.0), 'dropout_rate': (0.1, 0.20)}),
+            'Regressor': ('GeneticAlgorithm_Reg',
+                          {'num_dnn_layers': (1, 1), 'size_dnn_hidden': (50, 1), 'num_conv_layers': (1, 1),
+                           'size_kernel': (1, 0), 'size_pool': (1, 0), 'size_filter': (10, 1)}),
+            'Regressor+Regularization': ('GeneticAlgorithm_Reg',
+                                         {'num_dnn_layers': (1, 1), 'size_dnn_hidden': (0.5, 0.1),
+                                          'num_conv_layers': (1, 1), 'size_kernel': (1, 0), 'size_pool': (1, 0),
+                                          'size_filter': (10, 1), 'lookback': (100, 100), 'delay': (10, 1),
+                                          'l1_coef': (0.1, 0.0), 'l2_coef': (0.1, 0.0),
+                                          'dropout_rate': (0.1, 0.25)})}
+
+# The generation weights generate_random_chromosomes takes from the command line
+CLARGS = types.SimpleNamespace(dnn_kl_weight=1.0, dnn_weight=1.0, vae_kl_weight=1.0, vae_weight=1.0)
+
+def load_ga(variant, module):
+    # GeneticAlgorithm module of a Generational variant, with the server's storage already loaded
+    directory = os.path.join(FLASK_SQL, 'Server-Generational', variant)
+    sys.path.insert(0, directory)
+    sys.modules.pop(module, None)
+    try:
+        return importlib.import_module(module)
+    finally:
+        sys.path.remove(directory)
+
+def breed(ga, population, generation, param_choices, cross_prob, mutate_prob):
+    # The breeding pass of RunGA, without the duplicate resampling and the surrogate
+    generation = population.Population.from_frame(generation, ga.LAYERS)
+    new_generation = population.Population.from_frame(ga.create_blank_dataframe(1, len(generation)), ga.LAYERS)
+    parent1, parent2 = ga.select_parents(generation['fitness'], len(generation), 'roulette')
+    ga.cross_over(new_generation, generation, parent1, parent2, list(param_choices.keys()), cross_prob)
+    ga.mutate(new_generation, mutate_prob, param_choices)
+    if(hasattr(ga, 'refactor_weights')):
+        ga.refactor_weights(new_generation, generation)
+    return new_generation.to_frame()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--population_size', type=int, default=10000,
+                        help='Chromosomes in the parent generation and in the bred one')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Generations bred per variant')
+    parser.add_argument('--cross_prob', type=float, default=0.7,
+                        help='Probability of crossover')
+    parser.add_argument('--mutate_prob', type=float, default=0.01,
+                        help='Probability of mutation for each gene')
+    clargs = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database, storage = load_server('Server-Generational', os.path.join(tmp, 'chromosomes.sqlite'))
+        population = importlib.import_module('population')
+        print('Breeding {} Chromosomes, seconds per generation (DataFrame conversion included)'.format(
+            clargs.population_size))
+        for variant, (module, param_choices) in VARIANTS.items():
+            ga = load_ga(variant, module)
+            np.random.seed(0)
+            generation = ga.generate_random_chromosomes(population_size=clargs.population_size, clargs=CLARGS)
+            # Trained parents, with every loss reported for refactor_weights
+            for name in ['fitness'] + [name for name in ga.RESULT_COLUMNS if name.startswith('val_')]:
+                generation[name] = np.random.random_sample(len(generation))
+            generation['isTrained'] = 2
+            times = []
+            for i in range(clargs.repeat):
+                start = time.perf_counter()
+                breed(ga, population, generation, param_choices, clargs.cross_prob, clargs.mutate_prob)
+                times.append(time.perf_counter() - start)
+            print('  {:<26}mean {:.3f}  min {:.3f}'.format(variant, np.mean(times), np.min(times)))
+        storage.db.engine.dispose()
@@ -0,0 +1,29 @@
+import importlib
+import os
+import sys
+import time
+
+FLASK_SQL = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVERS = ['Server-Generational', 'Server-Steady-State']
+# Modules of the same name in both servers, imported afresh for each
+MODULES = ['database', 'storage', 'population', 'selection', 'GeneticAlgorithm_VAE', 'GeneticAlgorithm_Reg']
+
+def load_server(name, path):
+    '''database module and storage of the GA server `name`, bound to the
+        SQLite file `path` (created and migrated on import)'''
+    os.environ['GA_STORAGE'] = 'sqlite'
+    os.environ['GA_DATABASE_URI'] = 'sqlite:///' + path
+    for server in SERVERS:
+        while os.path.join(FLASK_SQL, server) in sys.path:
+            sys.path.remove(os.path.join(FLASK_SQL, server))
+    sys.path.insert(0, os.path.join(FLASK_SQL, name))
+    for module in MODULES:
+        sys.modules.pop(module, None)
+    return importlib.import_module('database'), importlib.import_module('storage').storage
+
+def mean_ms(work, repeat):
+    # Mean wall time of `work(i)` for i in range(repeat), in milliseconds
+    start = time.perf_counter()
+    for i in range(repeat):
+        work(i)
+    return 1000*(time.perf_counter() - start)/repeat
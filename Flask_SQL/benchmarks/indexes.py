@@ -0,0 +1,114 @@
+'''Query times on a large Chromosome table with only its primary key, then
+    with the indexes of the current schema (recreated by Storage.migrate).
+    Every query runs through Storage, as the Flask app and the GA run it.
+
+    python benchmarks/indexes.py [--generations 500] [--population 200]'''
+import argparse
+import os
+import tempfile
+import time
+import uuid
+
+from sqlalchemy import inspect, text
+
+from common import load_server, mean_ms
+
+def drop_indexes(database, storage):
+    # Every secondary index of the Chromosome table, as the tables were before they had any
+    with storage.db.engine.begin() as connection:
+        for index in inspect(connection).get_indexes('Chromosome'):
+            connection.execute(text('DROP INDEX "{}"'.format(index['name'])))
+
+def generational_rows(generations, population, now):
+    # Every generation trained but the last, which waits for the workers
+    rows = []
+    for g in range(generations):
+        last = g == generations - 1
+        for c in range(population):
+            rows.append(dict(generationID=g, chromosomeID=c, run_name='bench', isTrained=0 if last else 2,
+                             claim_id='' if last else uuid.uuid4().hex, worker='' if last else 'worker',
+                             lease_expires=0 if last else now - 3600, fitness=-1 if last else c/population,
+                             num_vae_layers=c % 3 + 1, num_dnn_layers=c % 2 + 1, size_vae_latent=c % 7 + 1,
+                             size_vae_hidden=c % 5 + 1, num_conv_layers=c % 3 + 1, size_kernel=[c % 4]*(c % 3 + 1),
+                             size_pool=[c % 2]*(c % 3 + 1), size_filter=[c % 9]*(c % 3 + 1), size_dnn_hidden=c % 11))
+    return rows
+
+def steady_state_rows(generations, population, now):
+    # Every row trained but the last `population`, which wait for the workers
+    count = generations*population
+    return [dict(date_created=i, date_taken=0 if i >= count - population else i,
+                 date_trained=0 if i >= count - population else i, claim_id=uuid.uuid4().hex, worker='worker',
+                 lease_expires=now - 3600, fitness=i/count, num_cnn_encoder=i % 3 + 1,
+                 size_kernel_encoder=[i % 4]*(i % 3 + 1), size_pool_encoder=[i % 2]*(i % 3 + 1),
+                 size_filter_encoder=[i % 9]*(i % 3 + 1), num_dnn_encoder=i % 2 + 1,
+                 size_dnn_encoder=[i % 7]*(i % 2 + 1), size_latent=i % 7 + 1) for i in range(count)]
+
+def generational_queries(database, storage, rows, generations):
+    Chromosome = database.Chromosome
+    last = generations - 1
+    trained = [row for row in rows if row['generationID'] < last]
+    ids = dict(((c.generationID, c.chromosomeID), c.id)
+               for c in storage.get_chromosomes(Chromosome.generationID == 0))
+    pick = lambda i: trained[(i*7919) % len(trained)]
+    # The old AddChrom lookup, on ten gene columns
+    genes = ['chromosomeID', 'generationID', 'num_vae_layers', 'num_dnn_layers', 'size_vae_latent',
+             'size_vae_hidden', 'size_dnn_hidden', 'size_kernel', 'size_pool', 'size_filter']
+    return [('AddChrom gene equality (old)',
+             lambda i: storage.get_chromosome(*[getattr(Chromosome, gene) == pick(i)[gene] for gene in genes])),
+            ('AddChrom by claim_id',
+             lambda i: storage.get_chromosome(Chromosome.claim_id == pick(i)['claim_id'], Chromosome.claim_id != '')),
+            ('AddChrom by id', lambda i: storage.get_chromosome(Chromosome.id == ids[(0, i % len(ids))])),
+            ('(generationID, chromosomeID) get',
+             lambda i: storage.get_chromosome(Chromosome.generationID == pick(i)['generationID'],
+                                              Chromosome.chromosomeID == pick(i)['chromosomeID'])),
+            ('GetGeneration ({} rows)'.format(len(ids)),
+             lambda i: storage.get_chromosomes(Chromosome.generationID == (i*37) % generations)),
+            ('wait_for_results count',
+             lambda i: storage.count_chromosomes(Chromosome.run_name == 'bench', Chromosome.generationID == last,
+                                                 Chromosome.isTrained.in_([0, 1]))),
+            ('claim_chromosomes(1)', lambda i: storage.claim_chromosomes(1, 'bench')),
+            ('reclaim scan', lambda i: storage.get_chromosome(storage.reclaimable(time.time()),
+                                                              order_by=storage.reclaim_order()))]
+
+def steady_state_queries(database, storage, rows, generations):
+    Chromosome = database.Chromosome
+    return [('claim_chromosomes(1)', lambda i: storage.claim_chromosomes(1, 'bench')),
+            ('wait_for_results count', lambda i: storage.count_chromosomes(Chromosome.date_trained <= 0)),
+            ('reclaim scan', lambda i: storage.get_chromosome(storage.reclaimable(time.time()),
+                                                              order_by=storage.reclaim_order()))]
+
+SERVERS = {'Server-Generational': (generational_rows, generational_queries),
+           'Server-Steady-State': (steady_state_rows, steady_state_queries)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--generations', type=int, default=500,
+                        help='Generations of the Generational table; the Steady-State one has as many rows')
+    parser.add_argument('--population', type=int, default=200,
+                        help='Chromosomes per generation, and untrained rows of the Steady-State table')
+    parser.add_argument('--repeat', type=int, default=50,
+                        help='Calls timed per query; each claim takes a row, so keep it under --population/2')
+    parser.add_argument('--server', type=str, default='', choices=[''] + list(SERVERS.keys()),
+                        help='Benchmark one server only (default: both)')
+    clargs = parser.parse_args()
+
+    for name, (make_rows, make_queries) in SERVERS.items():
+        if(clargs.server not in ['', name]):
+            continue
+        with tempfile.TemporaryDirectory() as tmp:
+            database, storage = load_server(name, os.path.join(tmp, 'chromosomes.sqlite'))
+            rows = make_rows(clargs.generations, clargs.population, time.time())
+            with storage.transaction() as session:
+                session.execute(database.Chromosome.__table__.insert(), rows)
+            queries = make_queries(database, storage, rows, clargs.generations)
+
+            drop_indexes(database, storage)
+            without = [mean_ms(work, clargs.repeat) for label, work in queries]
+            storage.migrate()
+            with_indexes = [mean_ms(work, clargs.repeat) for label, work in queries]
+
+            print('{}, SQLite (WAL), {} rows: mean ms per call, without -> with the indexes'.format(
+                name, storage.count_chromosomes()))
+            for (label, work), before, after in zip(queries, without, with_indexes):
+                print('  {:<36}{:>7.1f} -> {:.1f}'.format(label, before, after))
+            storage.db.engine.dispose()
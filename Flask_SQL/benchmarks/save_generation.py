@@ -0,0 +1,87 @@
+'''Statements and time to write a generation of the Generational server:
+    Storage.save_generation (one bulk upsert) against the per-chromosome
+    lookup and add or update train_generation ran before. Each is run on
+    a new generation, then on the same generation trained.
+
+    python benchmarks/save_generation.py [--sizes 200 10000] [--per_row_max 1000]'''
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import event
+
+from common import load_server
+
+# Run settings train_generation writes on every row
+CONSTANTS = dict(run_name='bench', predictor_type='classification', batch_size=128, optimizer='adam',
+                 num_epochs=200, prediction_log_var_prior=0.0, patience=10, kl_anneal=0, w_kl_anneal=0,
+                 dnn_log_var_prior=0.0, log_dir='data/logs', model_dir='data/models', table_dir='data/tables',
+                 train_file='exoplanet', cross_prob=0.7, mutate_prob=0.01, population_size=200,
+                 num_generations=100, hostname='127.0.0.1')
+
+def generation(generationID, n, isTrained):
+    # The per-chromosome columns train_generation takes from a VAE generation
+    rng = np.random.RandomState(generationID)
+    layers = rng.randint(1, 4, size=n)
+    return [dict(chromosomeID=i, generationID=generationID, isTrained=isTrained,
+                 fitness=float(rng.random_sample()) if isTrained else -1.0, dnn_weight=1.0, vae_weight=1.0,
+                 vae_kl_weight=1.0, dnn_kl_weight=1.0, start_time=float(i), end_time=2.0*i, run_time=float(i),
+                 val_vae_reconstruction_loss=1.0, val_vae_latent_args_loss=1.0, val_dnn_latent_args_loss=1.0,
+                 val_dnn_predictor_layer_loss=1.0, num_vae_layers=int(layers[i]), num_dnn_layers=int(layers[i]),
+                 size_vae_latent=int(rng.randint(2, 250)), size_vae_hidden=int(rng.randint(100, 2000)),
+                 size_dnn_hidden=int(rng.randint(100, 2000)), num_conv_layers=int(layers[i]),
+                 size_kernel=rng.randint(0, 6, size=layers[i]), size_pool=rng.randint(0, 4, size=layers[i]),
+                 size_filter=rng.randint(1, 128, size=layers[i]), info='', l1_coef=0.01, l2_coef=0.01,
+                 dropout_rate=0.5) for i in range(n)]
+
+def save_per_row(database, storage, rows, constants):
+    # The loop train_generation ran before: one lookup and one add or update per chromosome
+    Chromosome = database.Chromosome
+    for row in rows:
+        values = dict(constants, **row)
+        c = storage.get_chromosome(Chromosome.chromosomeID == row['chromosomeID'],
+                                   Chromosome.generationID == row['generationID'])
+        if(c == None):
+            storage.add_chromosome(values)
+        else:
+            storage.update_chromosome(c.id, values)
+
+def measure(database, work):
+    # Statements executed by `work()` and its wall time in seconds
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(database.db.engine, 'before_cursor_execute', listener)
+    try:
+        start = time.perf_counter()
+        work()
+        return len(statements), time.perf_counter() - start
+    finally:
+        event.remove(database.db.engine, 'before_cursor_execute', listener)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[200, 10000],
+                        help='Chromosomes per generation')
+    parser.add_argument('--per_row_max', type=int, default=1000,
+                        help='Largest generation written per row as well; that path is linear in the rows')
+    clargs = parser.parse_args()
+
+    print('Server-Generational, SQLite (WAL): statements and seconds per save')
+    for n in clargs.sizes:
+        paths = [('save_generation', lambda database, storage, rows: storage.save_generation(rows, CONSTANTS))]
+        if(n <= clargs.per_row_max):
+            paths.append(('per row', lambda database, storage, rows: save_per_row(database, storage, rows, CONSTANTS)))
+        for label, save in paths:
+            with tempfile.TemporaryDirectory() as tmp:
+                database, storage = load_server('Server-Generational', os.path.join(tmp, 'chromosomes.sqlite'))
+                # A first save creates the version counter
+                storage.save_generation(generation(9999, 1, 0), CONSTANTS)
+                results = []
+                for isTrained in [0, 2]:
+                    rows = generation(0, n, isTrained)
+                    results += measure(database, lambda: save(database, storage, rows))
+                print('  {:>6} rows {:<16}new: {:>6} statements {:>8.3f} s   trained: {:>6} statements {:>8.3f} s'
+                      .format(n, label, *results))
+                storage.db.engine.dispose()
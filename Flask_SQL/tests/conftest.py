@@ -0,0 +1,79 @@
+import importlib
+import importlib.util
+import os
+import sys
+import types
+
+import pytest
+
+FLASK_SQL = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVERS = ['Server-Generational', 'Server-Steady-State']
+# Modules of the same name in both servers; every test imports them afresh
+# from the server it runs against
+MODULES = ['database', 'storage', 'export', 'visuals', 'flask_app', 'selection',
+           'population', 'surrogate', 'islands', 'snapshot', 'GeneticAlgorithm_VAE']
+
+def load_module(server, module):
+    '''Module `module` of GA server `server` on its own, for the modules
+        with no local imports (selection, islands, snapshot)'''
+    path = os.path.join(FLASK_SQL, server, module + '.py')
+    spec = importlib.util.spec_from_file_location('{}_{}'.format(module, server.replace('-', '_')), path)
+    loaded = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(loaded)
+    return loaded
+
+def load_server(name, tmp_path, monkeypatch):
+    '''The modules of the GA server `name` bound to a new SQLite file in
+        `tmp_path`, as server.database, server.storage, ...'''
+    monkeypatch.setenv('GA_STORAGE', 'sqlite')
+    monkeypatch.setenv('GA_DATABASE_URI', 'sqlite:///' + str(tmp_path / 'chromosomes.sqlite'))
+    monkeypatch.syspath_prepend(os.path.join(FLASK_SQL, name))
+    for module in MODULES:
+        monkeypatch.delitem(sys.modules, module, raising=False)
+    database = importlib.import_module('database')
+    storage = importlib.import_module('storage')
+    return types.SimpleNamespace(name=name, database=database, storage=storage.storage,
+                                 Chromosome=database.Chromosome)
+
+@pytest.fixture(params=SERVERS)
+def server(request, tmp_path, monkeypatch):
+    server = load_server(request.param, tmp_path, monkeypatch)
+    yield server
+    server.database.db.session.remove()
+    server.database.db.engine.dispose()
+
+@pytest.fixture
+def client(server):
+    # Test client of the server's Flask app
+    return importlib.import_module('flask_app').app.test_client()
+
+@pytest.fixture
+def generational(tmp_path, monkeypatch):
+    server = load_server('Server-Generational', tmp_path, monkeypatch)
+    yield server
+    server.database.db.session.remove()
+    server.database.db.engine.dispose()
+
+@pytest.fixture
+def steady_state(tmp_path, monkeypatch):
+    server = load_server('Server-Steady-State', tmp_path, monkeypatch)
+    yield server
+    server.database.db.session.remove()
+    server.database.db.engine.dispose()
+
+def load_vae_ga(server, monkeypatch):
+    # GeneticAlgorithm_VAE of the server's VAE driver, bound to its storage
+    monkeypatch.syspath_prepend(os.path.join(FLASK_SQL, server.name, 'VAE'))
+    return importlib.import_module('GeneticAlgorithm_VAE')
+
+def add_chromosomes(server, n, start=0, **values):
+    '''Insert `n` untrained rows (chromosomeIDs `start`... where the server
+        has them) and return their ids'''
+    table = server.Chromosome.__table__
+    rows = [dict(values) for i in range(n)]
+    if('chromosomeID' in table.columns):
+        for i, row in enumerate(rows):
+            row['chromosomeID'] = start + i
+    with server.storage.transaction() as session:
+        session.execute(table.insert(), rows)
+    return [chrom.id for chrom in server.storage.get_chromosomes(order_by=[server.Chromosome.id])][-n:]
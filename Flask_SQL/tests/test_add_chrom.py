@@ -0,0 +1,60 @@
+import importlib
+
+from conftest import add_chromosomes
+
+def trained(server, fitness):
+    # Columns a worker sets when it reports a result
+    if('isTrained' in server.Chromosome.__table__.columns):
+        return {'isTrained': 2, 'fitness': fitness}
+    return {'date_trained': 1, 'fitness': fitness}
+
+def fitness(server, id):
+    return server.storage.get_chromosome(server.Chromosome.id == id).fitness
+
+def test_claim_id_of_a_batch_needs_the_row_id(server, client):
+    ids = add_chromosomes(server, 3)
+    claim_id = server.storage.claim_chromosomes(3, 'worker')[0].claim_id
+    client.post('/Results', json=dict(trained(server, 0.5), id=ids[0], claim_id=claim_id))
+
+    # Rows 2 and 3 are still held under the claim: which one is meant?
+    response = client.get('/AddChrom', query_string=dict(trained(server, 0.3), claim_id=claim_id))
+    assert response.status_code == 400
+    assert [fitness(server, id) for id in ids] == [0.5, -1, -1]
+
+    client.post('/Results', json=dict(trained(server, 0.4), id=ids[1], claim_id=claim_id))
+    response = client.get('/AddChrom', query_string=dict(trained(server, 0.3), claim_id=claim_id))
+    assert response.status_code == 200
+    assert [fitness(server, id) for id in ids] == [0.5, 0.4, 0.3]
+
+def test_late_result_leaves_a_reissued_or_trained_row(server, client):
+    [id] = add_chromosomes(server, 1)
+    # The first worker's lease runs out at once and the row goes to a second worker
+    server.storage.lease_time, lease_time = -1, server.storage.lease_time
+    late = server.storage.claim_chromosomes(1, 'slow')[0].claim_id
+    server.storage.lease_time = lease_time
+    claim_id = server.storage.claim_chromosomes(1, 'fast')[0].claim_id
+
+    assert client.get('/AddChrom', query_string=dict(trained(server, 0.3), id=id, claim_id=late)).status_code == 200
+    assert fitness(server, id) == -1
+    client.post('/Results', json=dict(trained(server, 0.5), id=id, claim_id=claim_id))
+    client.get('/AddChrom', query_string=dict(trained(server, 0.3), id=id, claim_id=late))
+    client.get('/AddChrom', query_string=dict(trained(server, 0.3), id=id))
+    assert fitness(server, id) == 0.5
+
+def test_id_must_be_an_integer(server, client):
+    add_chromosomes(server, 1)
+    server.storage.claim_chromosomes(1, 'worker')
+    assert client.get('/AddChrom', query_string=dict(trained(server, 0.3), id='first')).status_code == 400
+
+def test_legacy_result_leaves_a_failed_row(generational):
+    client = importlib.import_module('flask_app').app.test_client()
+    Chromosome = generational.Chromosome
+    ids = add_chromosomes(generational, 2, generationID=0, run_name='dummy')
+    generational.storage.claim_chromosomes(2, 'worker')
+    # The GA closed the generation on quorum without the first row
+    generational.storage.fail_chromosomes(Chromosome.id == ids[0])
+
+    for chromosomeID, value in enumerate([0.3, 0.4]):
+        client.get('/AddChrom', query_string=dict(generationID=0, chromosomeID=chromosomeID, isTrained=2, fitness=value))
+    assert [(c.isTrained, c.fitness) for c in generational.storage.get_chromosomes(order_by=[Chromosome.id])] \
+        == [(3, -1), (2, 0.4)]
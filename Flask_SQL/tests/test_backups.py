@@ -0,0 +1,28 @@
+import time
+
+from conftest import add_chromosomes
+
+def straggler(generational):
+    '''A row claimed by worker "slow" 100 s ago, in a run whose chromosomes
+        usually train in 10 s; returns its id'''
+    add_chromosomes(generational, 5, run_name='run', isTrained=2, run_time=10, claim_id='done')
+    [id] = add_chromosomes(generational, 1, start=5, run_name='run')
+    generational.storage.claim_chromosomes(1, 'slow')
+    with generational.storage.transaction() as session:
+        session.query(generational.Chromosome).filter(generational.Chromosome.id == id)\
+            .update({'claimed_at': time.time() - 100})
+    return id
+
+def test_backups_go_only_to_named_workers_without_fresh_work(generational):
+    id = straggler(generational)
+    [fresh] = add_chromosomes(generational, 1, start=10, run_name='run')
+
+    # Fresh work fills the claim as far as it goes; the straggler is not backed up alongside
+    assert [c.id for c in generational.storage.claim_chromosomes(2, 'fast')] == [fresh]
+    # Neither an unnamed worker nor the holder itself gets a backup
+    assert generational.storage.claim_chromosomes(2, '') == []
+    assert generational.storage.claim_chromosomes(2, 'slow') == []
+
+    [backup] = generational.storage.claim_chromosomes(2, 'fast')
+    assert backup.id == id and backup.worker == 'fast'
+    assert generational.storage.get_chromosome(generational.Chromosome.id == id).backup_claim_id == backup.claim_id
@@ -0,0 +1,56 @@
+import random
+import threading
+
+from conftest import add_chromosomes
+
+WORKERS = 32
+ROWS = 600
+
+def run_workers(target):
+    threads = [threading.Thread(target=target, args=('worker{}'.format(k),)) for k in range(WORKERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def assert_claimed_once(server, ids, claims):
+    # Every row handed out exactly once, and held in the database under the claim that got it
+    claimed = sorted(chrom.id for chroms in claims for chrom in chroms)
+    assert claimed == sorted(ids)
+    held = {chrom.id: chrom.claim_id for chrom in server.storage.get_chromosomes(server.storage.held())}
+    assert held == {chrom.id: chrom.claim_id for chroms in claims for chrom in chroms}
+
+def test_concurrent_claims_hand_out_each_row_once(server):
+    ids = add_chromosomes(server, ROWS)
+    claims = []
+
+    def worker(name):
+        while True:
+            chroms = server.storage.claim_chromosomes(random.randint(1, 5), name)
+            if(len(chroms) == 0):
+                return
+            claims.append(chroms)
+
+    run_workers(worker)
+    assert_claimed_once(server, ids, claims)
+
+def test_long_polls_hand_out_rows_added_while_waiting_once(server):
+    claims, done = [], threading.Event()
+    ids = []
+
+    def worker(name):
+        while not done.is_set() or server.storage.get_chromosome(server.storage.claimable()) is not None:
+            chroms = server.storage.wait_for_work(random.randint(1, 5), name, timeout=0.5)
+            if(len(chroms) > 0):
+                claims.append(chroms)
+
+    def producer():
+        for start in range(0, ROWS, 50):
+            ids.extend(add_chromosomes(server, 50, start=start))
+        done.set()
+
+    adding = threading.Thread(target=producer)
+    adding.start()
+    run_workers(worker)
+    adding.join()
+    assert_claimed_once(server, ids, claims)
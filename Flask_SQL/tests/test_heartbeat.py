@@ -0,0 +1,35 @@
+import time
+
+from conftest import add_chromosomes
+from test_add_chrom import trained
+
+def beat(client, claim_id, **args):
+    return client.get('/Heartbeat', query_string=dict(args, claim_id=claim_id)).get_data(as_text=True)
+
+def test_heartbeat_of_a_batch_claim_is_per_row(server, client):
+    ids = add_chromosomes(server, 3)
+    claim_id = server.storage.claim_chromosomes(3, 'worker')[0].claim_id
+    # The first row's lease runs out and it goes to another worker; the second is trained
+    with server.storage.transaction() as session:
+        session.query(server.Chromosome).filter(server.Chromosome.id == ids[0]).update({'lease_expires': 0})
+    assert [c.id for c in server.storage.claim_chromosomes(1, 'other')] == [ids[0]]
+    client.post('/Results', json=dict(trained(server, 0.5), id=ids[1], claim_id=claim_id))
+
+    assert [beat(client, claim_id, id=id) for id in ids] == ['0', '0', '1']
+    assert beat(client, claim_id) == '1'
+    assert beat(client, claim_id, id='first') == '0'
+
+def test_count_workers_counts_live_leases_and_recent_results(steady_state):
+    storage, Chromosome = steady_state.storage, steady_state.Chromosome
+    ids = add_chromosomes(steady_state, 7)
+    for worker, n in [('live', 2), ('expired', 1), ('reported', 1), ('idle', 1), ('', 1)]:
+        storage.claim_chromosomes(n, worker)
+    assert storage.count_workers() == 4
+    # A lease run out, a result just in, and one older than a lease
+    with storage.transaction() as session:
+        session.query(Chromosome).filter(Chromosome.worker == 'expired').update({'lease_expires': 0})
+        session.query(Chromosome).filter(Chromosome.worker == 'reported').update({'date_trained': time.time()})
+        session.query(Chromosome).filter(Chromosome.worker == 'idle')\
+            .update({'date_trained': time.time() - 2*storage.lease_time})
+    assert storage.count_workers() == 2
+    assert storage.count_chromosomes(Chromosome.id.in_(ids)) == 7
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import SERVERS, load_module
+
+@pytest.fixture(params=SERVERS)
+def islands(request):
+    return load_module(request.param, 'islands')
+
+def population(fitness):
+    # Trained rows (fitness -1: not trained) with an array gene
+    return pd.DataFrame({'id': np.arange(len(fitness)), 'fitness': fitness, 'info': '',
+                         'size_kernel': [np.arange(i % 3 + 1) for i in range(len(fitness))]})
+
+def test_migrants_are_taken_once_and_never_home(islands, tmp_path):
+    seen_a, seen_b = {}, {}
+    assert islands.emigrate(str(tmp_path), 'a', 1, population([0.3, -1, 0.1, 0.2]), 2, maximize=False) == 2
+
+    # An island does not take its own migrants
+    assert len(islands.immigrate(str(tmp_path), 'a', seen_a)) == 0
+    migrants = islands.immigrate(str(tmp_path), 'b', seen_b)
+    assert migrants['fitness'].tolist() == [0.1, 0.2]
+    assert (migrants['info'] == 'Migrant from a').all()
+    assert [gene.tolist() for gene in migrants['size_kernel']] == [[0, 1, 2], [0]]
+    assert seen_b == {'a': 1}
+
+    # Nothing new until the next epoch, even when the same epoch is published again
+    assert len(islands.immigrate(str(tmp_path), 'b', seen_b)) == 0
+    islands.emigrate(str(tmp_path), 'a', 1, population([0.05]), 2, maximize=False)
+    assert len(islands.immigrate(str(tmp_path), 'b', seen_b)) == 0
+    islands.emigrate(str(tmp_path), 'a', 2, population([0.05]), 2, maximize=False)
+    assert islands.immigrate(str(tmp_path), 'b', seen_b)['fitness'].tolist() == [0.05]
+    assert seen_b == {'a': 2}
+
+    # Island a sees b's migrants only, and only once
+    islands.emigrate(str(tmp_path), 'b', 1, population([0.4, 0.5]), 1)
+    assert islands.immigrate(str(tmp_path), 'a', seen_a)['fitness'].tolist() == [0.5]
+    assert seen_a == {'b': 1}
+    assert len(islands.immigrate(str(tmp_path), 'a', seen_a)) == 0
@@ -0,0 +1,45 @@
+import importlib
+
+from conftest import add_chromosomes
+
+def test_malformed_bodies_are_rejected(client):
+    for body in ['not json', '5', '[1, 2]', '["a"]']:
+        response = client.post('/Results', data=body, content_type='application/json')
+        assert response.status_code == 400
+
+def test_results_without_a_numeric_id_are_ignored(server, client):
+    ids = add_chromosomes(server, 2)
+    chroms = server.storage.claim_chromosomes(2, 'worker')
+    results = [{'claim_id': chroms[0].claim_id, 'fitness': 0.5},
+               {'id': 'five', 'claim_id': chroms[0].claim_id, 'fitness': 0.5},
+               {'id': None, 'fitness': 0.5},
+               {'id': ids[1], 'claim_id': chroms[1].claim_id, 'fitness': 0.5}]
+    answer = client.post('/Results', json=results).get_json()
+    assert answer == {'applied': [ids[1]], 'ignored': [None, 'five', None]}
+
+def test_string_ids_are_applied_and_not_ignored(server, client):
+    ids = add_chromosomes(server, 1)
+    chrom = server.storage.claim_chromosome('worker')
+    answer = client.post('/Results', json={'id': str(ids[0]), 'claim_id': chrom.claim_id, 'fitness': 0.3}).get_json()
+    assert answer == {'applied': [ids[0]], 'ignored': []}
+    assert server.storage.get_chromosome(server.Chromosome.id == ids[0]).fitness == 0.3
+
+def test_results_without_a_claim_id_are_ignored(server, client):
+    ids = add_chromosomes(server, 1)
+    chrom = server.storage.claim_chromosome('worker')
+    for result in [{'id': ids[0], 'fitness': 0.5}, {'id': ids[0], 'claim_id': '', 'fitness': 0.5}]:
+        assert client.post('/Results', json=result).get_json() == {'applied': [], 'ignored': [ids[0]]}
+    client.get('/AddChrom', query_string={'id': ids[0], 'fitness': 0.5})
+    assert server.storage.get_chromosome(server.Chromosome.id == ids[0]).fitness == -1
+
+    answer = client.post('/Results', json={'id': ids[0], 'claim_id': chrom.claim_id, 'fitness': 0.3}).get_json()
+    assert answer == {'applied': [ids[0]], 'ignored': []}
+
+def test_steady_state_legacy_result_needs_the_creation_date(steady_state):
+    client = importlib.import_module('flask_app').app.test_client()
+    [id] = add_chromosomes(steady_state, 1, date_created=7)
+    steady_state.storage.claim_chromosome('worker')
+    client.get('/AddChrom', query_string={'id': id, 'date_created': 6, 'date_trained': 1, 'fitness': 0.5})
+    assert steady_state.storage.get_chromosome(steady_state.Chromosome.id == id).fitness == -1
+    client.get('/AddChrom', query_string={'id': id, 'date_created': 7, 'date_trained': 1, 'fitness': 0.5})
+    assert steady_state.storage.get_chromosome(steady_state.Chromosome.id == id).fitness == 0.5
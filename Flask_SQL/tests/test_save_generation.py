@@ -0,0 +1,74 @@
+import json
+
+from sqlalchemy import event
+
+RUN = dict(run_name='run', predictor_type='regression', batch_size=32, optimizer='adam',
+           num_epochs=10, patience=3, hostname='server')
+
+def generation(generationID, n, fitness):
+    # Rows as train_generation builds them from a generation frame
+    return [dict(chromosomeID=i, generationID=generationID, fitness=fitness + i, start_time=i,
+                 end_time=2*i, run_time=i, num_dnn_layers=i % 3 + 1, size_dnn_hidden=json.dumps([8]*(i % 3 + 1)),
+                 info='gen{} chrom{}'.format(generationID, i)) for i in range(n)]
+
+def save_per_row(server, rows, constants):
+    # The loop train_generation ran before: one lookup and one add or update per chromosome
+    Chromosome = server.Chromosome
+    for row in rows:
+        values = dict(constants, **row)
+        c = server.storage.get_chromosome(Chromosome.chromosomeID == row['chromosomeID'],
+                                          Chromosome.generationID == row['generationID'])
+        if(c == None):
+            server.storage.add_chromosome(values)
+        else:
+            server.storage.update_chromosome(c.id, values)
+
+def table(server):
+    # Every column but the id, in key order, packed arrays as lists
+    columns = [column for column in server.Chromosome.__table__.columns if column.name != 'id']
+    with server.storage.transaction() as session:
+        return [tuple(value.tolist() if hasattr(value, 'tolist') else value for value in row)
+                for row in session.query(*columns).order_by(server.Chromosome.generationID,
+                                                            server.Chromosome.chromosomeID)]
+
+def clear(server):
+    with server.storage.transaction() as session:
+        session.query(server.Chromosome).delete()
+
+def count_statements(server, work):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(server.database.db.engine, 'before_cursor_execute', listener)
+    try:
+        work()
+    finally:
+        event.remove(server.database.db.engine, 'before_cursor_execute', listener)
+    return len(statements)
+
+# A new generation, the same generation trained, then its rows again next to a new one
+BATCHES = [generation(0, 20, 0.0), generation(0, 20, 0.5), generation(0, 20, 0.7) + generation(1, 20, 0.1)]
+
+def test_bulk_upsert_leaves_the_table_the_per_row_path_did(generational):
+    per_row, bulk = [], []
+    for rows in BATCHES:
+        save_per_row(generational, rows, RUN)
+        per_row.append(table(generational))
+    clear(generational)
+    for rows in BATCHES:
+        assert generational.storage.save_generation(rows, RUN) == len(rows)
+        bulk.append(table(generational))
+    assert bulk == per_row
+    assert len(per_row[-1]) == 40
+
+def test_bulk_upsert_runs_the_same_statements_for_any_size(generational):
+    # One key lookup, one executemany each for updates and inserts, and the version bump;
+    # the first save also creates the version counter
+    generational.storage.save_generation(generation(9, 1, 0.0), RUN)
+    small = count_statements(generational, lambda: generational.storage.save_generation(generation(0, 5, 0.0), RUN))
+    large = count_statements(generational, lambda: generational.storage.save_generation(generation(1, 500, 0.0), RUN))
+    assert small == large
+    updates = count_statements(generational, lambda: generational.storage.save_generation(
+        generation(0, 5, 0.5) + generation(2, 5, 0.0), RUN))
+    assert updates == small + 1
+    per_row = count_statements(generational, lambda: save_per_row(generational, generation(3, 50, 0.0), RUN))
+    assert per_row >= 3*50
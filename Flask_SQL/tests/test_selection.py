@@ -0,0 +1,90 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import SERVERS, load_module
+
+DRAWS = 20000
+# 30 rows, two of them tied
+FITNESS = np.append(np.linspace(0.1, 0.9, 29), 0.5)
+
+@pytest.fixture(params=SERVERS)
+def selection(request):
+    return load_module(request.param, 'selection')
+
+def assert_drawn_with(parents, probabilities):
+    '''Chi-square test of the drawn row counts against `probabilities`, at
+        the 0.1% level. The critical value is the Wilson-Hilferty
+        approximation, close enough at 29 degrees of freedom.'''
+    expected = DRAWS*np.asarray(probabilities)
+    observed = np.bincount(parents, minlength=len(expected))
+    chi2 = ((observed - expected)**2/expected).sum()
+    df = len(expected) - 1
+    critical = df*(1 - 2/(9*df) + 3.09*np.sqrt(2/(9*df)))**3
+    assert chi2 < critical
+
+def expected_weights(method, maximize):
+    # Weights as the per-child loops computed them: fitness rescaled to [1, 6], or ranks
+    if(method == 'roulette'):
+        scaled = (FITNESS - FITNESS.min())/(FITNESS.max() - FITNESS.min())
+        return (scaled if maximize else 1 - scaled)*5 + 1
+    return pd.Series(FITNESS).rank(ascending=maximize).to_numpy()
+
+def tournament_probabilities(scores, size):
+    # Chance that each row wins a tournament of `size` rows drawn with replacement, highest score first
+    rank = pd.Series(scores).rank(method='first').to_numpy()
+    return (rank**size - (rank - 1)**size)/len(scores)**size
+
+@pytest.mark.parametrize('method', ['roulette', 'rank'])
+@pytest.mark.parametrize('maximize', [True, False])
+def test_weighted_draws_follow_the_weights(selection, method, maximize):
+    weights = expected_weights(method, maximize)
+    np.random.seed(0)
+    for parents in selection.select_parents(FITNESS, DRAWS, method, maximize=maximize):
+        assert_drawn_with(parents, weights/weights.sum())
+
+@pytest.mark.parametrize('maximize', [True, False])
+def test_tournaments_follow_the_closed_form(selection, maximize):
+    fitness = np.linspace(0.1, 0.9, 30)
+    np.random.seed(0)
+    for parents in selection.select_parents(fitness, DRAWS, 'tournament', maximize=maximize, tournament_size=3):
+        assert_drawn_with(parents, tournament_probabilities(fitness if maximize else -fitness, 3))
+
+def test_nsga2_tournaments_follow_the_order(selection):
+    np.random.seed(1)
+    fitness, cost = np.random.random(30), np.random.random(30)
+    order = selection.nsga2_order(fitness, cost)
+    position = np.empty(30)
+    position[order] = np.arange(30)
+    np.random.seed(0)
+    for parents in selection.select_parents(fitness, DRAWS, 'nsga2', tournament_size=2, cost=cost):
+        assert_drawn_with(parents, tournament_probabilities(-position, 2))
+
+@pytest.mark.parametrize('maximize', [True, False])
+def test_weights_match_the_old_loops(selection, maximize):
+    assert np.allclose(selection.roulette_weights(FITNESS, maximize), expected_weights('roulette', maximize))
+    assert np.allclose(selection.rank_weights(FITNESS, maximize), expected_weights('rank', maximize))
+    assert np.allclose(selection.roulette_weights(np.ones(5), maximize), 1)
+
+def test_draw_picks_the_row_the_old_walk_did(selection):
+    # Given the same random thresholds, the row where the running total of the weights first reaches each
+    weights = selection.rank_weights(FITNESS, maximize=False)
+    np.random.seed(0)
+    drawn = selection.draw(weights, (2, 1000))
+    np.random.seed(0)
+    thresholds = np.random.random((2, 1000))*weights.sum()
+    walked = np.array([[next(i for i, total in enumerate(np.cumsum(weights)) if total >= threshold)
+                        for threshold in row] for row in thresholds])
+    assert np.array_equal(drawn, walked)
+
+@pytest.mark.parametrize('method', ['roulette', 'rank', 'tournament', 'nsga2'])
+def test_a_large_breed_is_drawn_at_once(selection, method):
+    # 100k pairs from 1000 rows take tens of milliseconds; the per-child loops took seconds for 2000
+    np.random.seed(0)
+    fitness, cost = np.random.random(1000), np.random.random(1000)
+    start = time.time()
+    parent1, parent2 = selection.select_parents(fitness, 100000, method, cost=cost)
+    assert time.time() - start < 1
+    assert parent1.shape == parent2.shape == (100000,)
@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import SERVERS, load_module
+
+@pytest.fixture(params=SERVERS)
+def snapshot(request):
+    return load_module(request.param, 'snapshot')
+
+def population():
+    # Numbers, text and array genes of several lengths, as the GA frames hold them
+    return pd.DataFrame({'id': np.arange(1, 4), 'fitness': [0.5, -1.0, 0.25], 'info': ['', 'Child of 1 and 2', 'x'],
+                         'size_kernel': [np.array([3, 4]), np.array([5, 6, 7]), np.array([], dtype=int)]})
+
+def test_round_trip_keeps_frames_state_and_rng(snapshot, tmp_path):
+    path = str(tmp_path / 'snapshot.npz')
+    state = dict(loop=np.int64(3), best=np.float64(0.25), island='a', seen={'b': 2}, config={'selection': 'rank'})
+    np.random.seed(0)
+    # Leaves a cached Gaussian in the RNG state
+    np.random.normal()
+    snapshot.save_snapshot(path, {'population': population(), 'children': pd.DataFrame()}, state)
+    expected = np.random.random(5), np.random.normal(size=3)
+
+    np.random.seed(1)
+    frames, loaded = snapshot.load_snapshot(path)
+    assert np.array_equal(np.random.random(5), expected[0])
+    assert np.array_equal(np.random.normal(size=3), expected[1])
+
+    assert loaded == dict(loop=3, best=0.25, island='a', seen={'b': 2}, config={'selection': 'rank'})
+    assert sorted(frames.keys()) == ['children', 'population']
+    assert len(frames['children']) == 0
+    restored = frames['population']
+    assert restored.columns.tolist() == population().columns.tolist()
+    assert restored['id'].tolist() == [1, 2, 3] and restored['fitness'].tolist() == [0.5, -1.0, 0.25]
+    assert restored['info'].tolist() == ['', 'Child of 1 and 2', 'x']
+    assert [gene.tolist() for gene in restored['size_kernel']] == [[3, 4], [5, 6, 7], []]
+    assert not os.path.exists(path + '.tmp')
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import load_vae_ga
+
+PARAM_CHOICES = {'num_cnn_encoder': (1, 1), 'size_kernel_encoder': (1, 0), 'size_pool_encoder': (1, 0),
+                 'size_filter_encoder': (10, 1), 'num_dnn_encoder': (1, 1), 'size_dnn_encoder': (10, 1),
+                 'size_latent': (10, 1)}
+ARRAY_GENES_SIZES = {'size_kernel_encoder': 'num_cnn_encoder', 'size_pool_encoder': 'num_cnn_encoder',
+                     'size_filter_encoder': 'num_cnn_encoder', 'size_dnn_encoder': 'num_dnn_encoder'}
+
+@pytest.fixture
+def ga(steady_state, monkeypatch):
+    return load_vae_ga(steady_state, monkeypatch)
+
+def population(n):
+    # Trained rows with array genes of 1 to 3 layers
+    rng = np.random.RandomState(0)
+    layers = rng.randint(1, 4, size=n)
+    generation = pd.DataFrame({'id': np.arange(1, n + 1), 'date_created': 1, 'date_trained': 2, 'date_taken': 1,
+                               'fitness': rng.random_sample(n), 'val_fitness': rng.random_sample(n), 'info': '',
+                               'num_cnn_encoder': layers, 'num_dnn_encoder': layers, 'size_latent': rng.randint(1, 9, n)})
+    for param in ARRAY_GENES_SIZES:
+        generation[param] = [rng.randint(1, 9, size=size) for size in layers]
+    return generation
+
+def genes(generation):
+    return [[row[param].tolist() if param in ARRAY_GENES_SIZES else row[param] for param in PARAM_CHOICES]
+            for row in generation.to_dict('records')]
+
+@pytest.mark.parametrize('cross_prob', [0, 1])
+def test_breeding_leaves_the_parents_unchanged(ga, cross_prob):
+    generation = population(10)
+    before = genes(generation)
+    trained = generation[generation['date_trained'] > 0].reset_index(drop=True)
+    np.random.seed(0)
+    for i in range(50):
+        parent1, parent2 = trained.iloc[i % 10], trained.iloc[(i + 3) % 10]
+        child = ga.cross_over(parent1, parent2, cross_prob, list(PARAM_CHOICES.keys()), ARRAY_GENES_SIZES)
+        ga.mutate(child, 1, PARAM_CHOICES, ARRAY_GENES_SIZES)
+    assert genes(generation) == before
+    assert genes(trained) == before
+
+def untrained(generation):
+    return int((generation['date_trained'] <= 0).sum())
+
+def test_breeding_refills_the_queue_without_overshooting(ga, steady_state):
+    storage = steady_state.storage
+    ga.add_generation_to_sql(population(6).drop(columns=['id']), ARRAY_GENES_SIZES)
+    generation = ga.train_generation(ARRAY_GENES_SIZES, sleep_time=1)
+    queued = 4
+    for results in [0, 1, 3]:
+        # Workers report `results` of the queued rows; the first pass fills the queue
+        claims = storage.claim_chromosomes(results, 'worker')
+        storage.record_results([dict(id=c.id, claim_id=c.claim_id, date_trained=3, fitness=0.5) for c in claims])
+        generation = ga.train_generation(ARRAY_GENES_SIZES, sleep_time=1, generation=generation, remaining=queued - 1)
+        children = generation.iloc[:ga.num_children(generation, queued)].drop(columns=['id'])
+        ga.add_generation_to_sql(children.assign(date_trained=-1, date_taken=-1), ARRAY_GENES_SIZES)
+        generation = ga.update_generation_from_sql(generation, ARRAY_GENES_SIZES)
+        assert untrained(generation) == queued
+        assert ga.num_children(generation, queued) == 0
+    # Fewer workers than rows already waiting: nothing is bred
+    assert ga.num_children(generation, 2) == 0
+    assert len(generation) == 6 + 4 + 1 + 3
+    assert len(storage.get_chromosomes()) == len(generation)
+
+def test_update_reads_only_new_and_pending_rows(ga, steady_state):
+    storage, Chromosome = steady_state.storage, steady_state.Chromosome
+    stored = population(6).drop(columns=['id'])
+    stored.loc[4:, ['date_trained', 'date_taken']] = -1
+    ga.add_generation_to_sql(stored, ARRAY_GENES_SIZES)
+    generation = ga.load_generation_from_sql(ARRAY_GENES_SIZES)
+    ids = generation['id'].tolist()
+
+    # A trained row edited behind the GA's back is not read again
+    with storage.transaction() as session:
+        session.query(Chromosome).filter(Chromosome.id == ids[0]).update({'fitness': 99.0})
+    claim = storage.claim_chromosome('worker')
+    storage.record_results([dict(id=claim.id, claim_id=claim.claim_id, date_trained=3, fitness=0.25)])
+    ga.add_generation_to_sql(population(2).drop(columns=['id']).assign(date_trained=-1, date_taken=-1),
+                             ARRAY_GENES_SIZES)
+    updated = ga.update_generation_from_sql(generation, ARRAY_GENES_SIZES)
+
+    assert len(updated) == 8 and updated['id'].is_monotonic_increasing
+    assert updated['fitness'].iloc[0] == generation['fitness'].iloc[0]
+    assert updated.set_index('id').loc[claim.id, ['date_trained', 'fitness']].tolist() == [3, 0.25]
+    assert (updated['date_trained'] <= 0).sum() == 3
+    assert genes(updated.iloc[:6]) == genes(ga.load_generation_from_sql(ARRAY_GENES_SIZES).iloc[:6])
+    assert ga.update_generation_from_sql(updated, ARRAY_GENES_SIZES)['fitness'].iloc[0] != 99.0
+
+    # Children bred from the updated rows leave them, and the rows they were read with, unchanged
+    before = genes(updated)
+    trained = updated[updated['date_trained'] > 0].reset_index(drop=True)
+    np.random.seed(0)
+    for cross_prob in [0, 1]:
+        for i in range(len(trained)):
+            child = ga.cross_over(trained.iloc[i], trained.iloc[-1 - i], cross_prob, list(PARAM_CHOICES.keys()),
+                                  ARRAY_GENES_SIZES)
+            ga.mutate(child, 1, PARAM_CHOICES, ARRAY_GENES_SIZES)
+    assert genes(updated) == before
@@ -0,0 +1,58 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+GENES = ['num_conv_layers', 'size_kernel', 'dropout_rate']
+LAYERS = {'num_conv_layers': ['size_kernel']}
+
+@pytest.fixture
+def surrogate(generational):
+    return importlib.import_module('surrogate')
+
+def genomes(n, isTrained=2, seed=0):
+    '''`n` genomes whose fitness is their dropout_rate, and an array gene
+        that has nothing to do with it'''
+    rng = np.random.RandomState(seed)
+    layers = rng.randint(1, 4, size=n)
+    dropout_rate = rng.uniform(0.1, 0.9, size=n)
+    return pd.DataFrame({'chromosomeID': np.arange(n), 'isTrained': isTrained, 'fitness': dropout_rate,
+                         'num_conv_layers': layers, 'dropout_rate': dropout_rate,
+                         'size_kernel': [rng.randint(1, 6, size=size) for size in layers]})
+
+def test_too_few_trained_rows_leave_the_model_unused(surrogate):
+    model = surrogate.Surrogate(GENES, LAYERS, min_rows=20)
+    assert not model.fit()
+    model.add(genomes(15))
+    # Rows still out or failed are not recorded
+    failed = genomes(10, seed=1).assign(fitness=-1.0, isTrained=3)
+    model.add(pd.concat([genomes(10, isTrained=1, seed=2), failed], ignore_index=True))
+    assert len(model.history()) == 15
+    assert not model.fit() and model.model is None
+    model.add(genomes(5, seed=3))
+    assert model.fit()
+
+def test_screen_keeps_the_best_predicted_children(surrogate):
+    np.random.seed(0)
+    model = surrogate.Surrogate(GENES, LAYERS, min_rows=50, kappa=0)
+    model.add(genomes(200))
+    assert model.fit()
+
+    children = genomes(40, isTrained=0, seed=4).assign(fitness=-1.0)
+    population = surrogate.Population.from_frame(children, LAYERS)
+    copies = np.zeros(40, dtype=bool)
+    # An unchanged copy is scored by its own fitness, above any prediction
+    copies[7] = True
+    population['fitness'][7] = 2.0
+    keep = model.screen(population, copies, 10)
+
+    mean, spread = model.predict(population)
+    score = np.where(copies, 2.0, mean)
+    assert keep.tolist() == sorted(np.argsort(-score)[:10].tolist())
+    assert 7 in keep
+    # The forest ranks the children by the gene their fitness follows
+    best = np.argsort(-children['dropout_rate'].to_numpy())[:9]
+    assert len(set(best) & set(keep)) >= 8
+    assert np.isnan(model.predicted[keep.tolist().index(7)])
+    assert model.screened_out == 30
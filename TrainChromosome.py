@@ -2,13 +2,14 @@ import argparse
 import json
 import numpy as np
 import os
-import requests
 import socket
 
 from vaelstmpredictor.Chromosome import Chromosome
+from vaelstmpredictor.utils.ga_client import WorkQueue, Heartbeat, submit_results, pick_server
 
-from time import time, sleep
+from time import time
 from keras import backend as K
+from keras.callbacks import Callback
 
 
 def debug_message(message):
@@ -23,11 +24,32 @@ def info_message(message):
     print('[INFO] {}'.format(message))
 
 
+class StopWhenLost(Callback):
+    """Ends training at the next batch once the heartbeat finds the lease
+        lost, e.g. because a backup copy of the chromosome finished first."""
+
+    def __init__(self, heartbeat):
+        super(StopWhenLost, self).__init__()
+        self.heartbeat = heartbeat
+
+    def on_batch_end(self, batch, logs=None):
+        if self.heartbeat.lost:
+            self.model.stop_training = True
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--sql_server',
                         default='laudeepgenerativegenetics.pythonanywhere.com',
-                        help='The URL or IP of the SQL server')
+                        help='The URL or IP of the SQL server; several, comma '
+                        'separated, for the islands of an island-model GA')
+    parser.add_argument('--island', type=int, default=-1,
+                        help='Which of the --sql_server islands to train for '
+                        '(default: chosen from the hostname)')
+    parser.add_argument('--prefetch', type=int, default=1,
+                        help='Number of chromosomes to claim per request to the server')
+    parser.add_argument('--heartbeat', type=float, default=60,
+                        help='Seconds between lease renewals while training')
     clargs = parser.parse_args()
 
     for key, val in clargs.__dict__.items():
@@ -35,32 +57,23 @@ if __name__ == '__main__':
             if not os.path.exists(val):
                 os.mkdir(val)
 
-    base_url = clargs.sql_server
-    print(base_url)
-
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     s.connect(("8.8.8.8", 80))
     hostname = s.getsockname()[0]
     s.close()
 
+    base_url = pick_server(clargs.sql_server, hostname, clargs.island)
+    print(base_url)
+
+    work_queue = WorkQueue(base_url, worker=hostname, prefetch=clargs.prefetch)
+
     while True:
-        try:
-            info_message('Grabbing Untrained Chromosome')
-            chromosome = requests.get(
-                url="http://{}/GetUnTrainedChrom".format(base_url))
-        except:
-            chromosome = None
-
-        if(chromosome != None and chromosome.text == "0"):
-            info_message("No more Chromosomes to train")
-            sleep(30)
-        elif(chromosome != None):
-            try:
-                info_message('Accessing Params from Untrained Chromosome')
-                params = chromosome.json()
-            except:
-                continue
+        info_message('Grabbing Untrained Chromosome')
+        params = work_queue.get()
 
+        if(params == None):
+            info_message("No more Chromosomes to train")
+        else:
             clargs.batch_size = params["batch_size"]
             clargs.chromosomeID = params["chromosomeID"]
             clargs.cross_prob = params["cross_prob"]
@@ -176,9 +189,18 @@ if __name__ == '__main__':
                 if clargs.verbose:
                     info_message('Start Training: {}'.format(start_time))
 
-                chromosome.train()
+                heartbeat = Heartbeat(base_url, params['claim_id'], params['id'], interval=clargs.heartbeat)
+                heartbeat.start()
+                try:
+                    chromosome.train(callbacks=[StopWhenLost(heartbeat)])
+                finally:
+                    heartbeat.stop()
                 K.clear_session()
 
+                if heartbeat.lost:
+                    info_message('Stopped: the chromosome was trained elsewhere first')
+                    continue
+
                 end_time = time()
                 run_time = end_time - start_time
 
@@ -216,13 +238,5 @@ if __name__ == '__main__':
             params["end_time"] = end_time
             params["run_time"] = run_time
 
-            sent = False
-            while(not sent):
-                try:
-                    resp = requests.get(
-                        url="http://{}/AddChrom".format(base_url),
-                        params=params)
-                    info_message("Response: " + resp.text)
-                    sent = (resp.text == "1")
-                except:
-                    sent = False
\ No newline at end of file
+            resp = submit_results(base_url, [params])
+            info_message("Response: " + json.dumps(resp))
\ No newline at end of file
@@ -2,13 +2,14 @@ import argparse
 import json
 import numpy as np
 import os
-import requests
 import socket
 
 from vaelstmpredictor.Chromosome_Regressor import Chromosome
+from vaelstmpredictor.utils.ga_client import WorkQueue, Heartbeat, submit_results
 
-from time import time, sleep
+from time import time
 from keras import backend as K
+from keras.callbacks import Callback
 
 
 def debug_message(message):
@@ -23,11 +24,28 @@ def info_message(message):
     print('[INFO] {}'.format(message))
 
 
+class StopWhenLost(Callback):
+    """Ends training at the next batch once the heartbeat finds the lease
+        lost, e.g. because a backup copy of the chromosome finished first."""
+
+    def __init__(self, heartbeat):
+        super(StopWhenLost, self).__init__()
+        self.heartbeat = heartbeat
+
+    def on_batch_end(self, batch, logs=None):
+        if self.heartbeat.lost:
+            self.model.stop_training = True
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--sql_server',
                         default='LAUDeepGenerativeGenetics.pythonanywhere.com',
                         help='The URL or IP of the SQL server')
+    parser.add_argument('--prefetch', type=int, default=1,
+                        help='Number of chromosomes to claim per request to the server')
+    parser.add_argument('--heartbeat', type=float, default=60,
+                        help='Seconds between lease renewals while training')
     clargs = parser.parse_args()
 
     for key, val in clargs.__dict__.items():
@@ -42,24 +60,15 @@ if __name__ == '__main__':
     hostname = s.getsockname()[0]
     s.close()
 
+    work_queue = WorkQueue(base_url, worker=hostname, prefetch=clargs.prefetch)
+
     while True:
-        try:
-            info_message('Grabbing Untrained Chromosome')
-            chromosome = requests.get(
-                url="http://{}/GetUnTrainedChrom".format(base_url))
-        except:
-            chromosome = None
-
-        if(chromosome != None and chromosome.text == "0"):
-            info_message("No more Chromosomes to train")
-            sleep(30)
-        elif(chromosome != None):
-            try:
-                info_message('Accessing Params from Untrained Chromosome')
-                params = chromosome.json()
-            except:
-                continue
+        info_message('Grabbing Untrained Chromosome')
+        params = work_queue.get()
 
+        if(params == None):
+            info_message("No more Chromosomes to train")
+        else:
             clargs.batch_size = params["batch_size"]
             clargs.chromosomeID = params["chromosomeID"]
             clargs.cross_prob = params["cross_prob"]
@@ -154,9 +163,18 @@ if __name__ == '__main__':
             if clargs.verbose:
                 info_message('Start Training: {}'.format(start_time))
 
-            chromosome.train()
+            heartbeat = Heartbeat(base_url, params['claim_id'], params['id'], interval=clargs.heartbeat)
+            heartbeat.start()
+            try:
+                chromosome.train(callbacks=[StopWhenLost(heartbeat)])
+            finally:
+                heartbeat.stop()
             K.clear_session()
 
+            if heartbeat.lost:
+                info_message('Stopped: the chromosome was trained elsewhere first')
+                continue
+
             end_time = time()
             run_time = end_time - start_time
 
@@ -184,13 +202,5 @@ if __name__ == '__main__':
             params["end_time"] = end_time
             params["run_time"] = run_time
 
-            sent = False
-            while(not sent):
-                try:
-                    resp = requests.get(
-                        url="http://{}/AddChrom".format(base_url),
-                        params=params)
-                    info_message("Response: " + resp.text)
-                    sent = (resp.text == "1")
-                except:
-                    sent = False
+            resp = submit_results(base_url, [params])
+            info_message("Response: " + json.dumps(resp))
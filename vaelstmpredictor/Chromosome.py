@@ -259,8 +259,8 @@ class Chromosome(object):
         # instantiate encoder model
         return (z_dnn, outputs_dnn)
 
-    def train(self, verbose=False):
-        callbacks = [TerminateOnNaN()]
+    def train(self, verbose=False, callbacks=[]):
+        callbacks = [TerminateOnNaN()] + list(callbacks)
         callbacks.append(EarlyStopping(patience=10))
         callbacks.append(History())
 
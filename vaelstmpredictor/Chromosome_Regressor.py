@@ -137,8 +137,8 @@ class Chromosome(object):
         self.model = Model(inputs_dnn, outputs_dnn, name='dnn')
         self.model.summary()
 
-    def train(self, verbose=False):
-        callbacks = [TerminateOnNaN()]
+    def train(self, verbose=False, callbacks=[]):
+        callbacks = [TerminateOnNaN()] + list(callbacks)
         if(self.save_model):
         	callbacks.append(ModelCheckpoint(filepath='conv_dnn_only_weights.hdf5', verbose=self.verbose, save_best_only=True))
         callbacks.append(TensorBoard(log_dir=self.log_dir, histogram_freq=0, batch_size=32, write_graph=True, 
@@ -0,0 +1,138 @@
+"""
+Worker side of the GA server protocol (see Flask_SQL/*/flask_app.py)
+"""
+import json
+import random
+import requests
+import threading
+import zlib
+
+from collections import deque
+from time import sleep
+
+def info_message(message, end='\n'):
+    print('[INFO] {}'.format(message), end=end)
+
+def warning_message(message, end='\n'):
+    print('[WARNING] {}'.format(message), end=end)
+
+def pick_server(sql_server, worker, island=-1):
+    """The server a worker trains for. `sql_server` may list the servers of
+        several GA islands, comma separated; the worker takes the `island`-th
+        one, or by default one picked from its name, which spreads a fleet
+        of workers evenly over the islands."""
+    servers = [server.strip() for server in sql_server.split(',') if server.strip() != '']
+    if island < 0:
+        island = zlib.crc32(worker.encode('utf-8'))
+    return servers[island % len(servers)]
+
+class WorkQueue(object):
+    """Chromosomes claimed from the GA server and not yet trained.
+
+    Up to `prefetch` chromosomes are claimed in one `/ClaimChromosomes`
+    request, so a worker only goes back to the server once its local queue
+    is empty. The request long-polls: the server holds it for up to `wait`
+    seconds and answers as soon as new chromosomes are added.
+    """
+
+    def __init__(self, base_url, worker='', prefetch=1, wait=30, timeout=30):
+        self.base_url = base_url
+        self.worker = worker
+        self.prefetch = prefetch
+        self.wait = wait
+        self.timeout = timeout
+        self.queue = deque()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def refill(self):
+        try:
+            resp = requests.get(url="http://{}/ClaimChromosomes".format(self.base_url),
+                                params={'n': self.prefetch, 'worker': self.worker, 'wait': self.wait},
+                                timeout=self.wait + self.timeout)
+            chroms = resp.json()
+        except Exception as e:
+            warning_message('Could not claim chromosomes: {}'.format(e))
+            sleep(self.timeout)
+            return 0
+
+        self.queue.extend(chroms)
+        if len(chroms) > 0:
+            info_message('Claimed {} Chromosomes'.format(len(chroms)))
+        return len(chroms)
+
+    def get(self):
+        """Next claimed chromosome as a dict of its columns, or None when
+            the server has nothing left to hand out."""
+        if len(self.queue) == 0:
+            self.refill()
+        if len(self.queue) == 0:
+            return None
+        return self.queue.popleft()
+
+class Heartbeat(threading.Thread):
+    """Renews the server-side lease on chromosome `id` of a claim every
+        `interval` seconds while it trains. Once the server reports the
+        lease as lost (it expired, or a backup copy of the chromosome was
+        trained first), `lost` is set and the heartbeat stops. Without an
+        `id` the lease on every row of the claim is renewed."""
+
+    def __init__(self, base_url, claim_id, id=None, interval=60, timeout=30):
+        super(Heartbeat, self).__init__()
+        self.daemon = True
+        self.base_url = base_url
+        self.claim_id = claim_id
+        self.id = id
+        self.interval = interval
+        self.timeout = timeout
+        self.lost = False
+        self.stopped = threading.Event()
+
+    def beat(self):
+        try:
+            resp = requests.get(url="http://{}/Heartbeat".format(self.base_url),
+                                params={'claim_id': self.claim_id, 'id': self.id},
+                                timeout=self.timeout)
+        except Exception as e:
+            warning_message('Heartbeat failed: {}'.format(e))
+            return True
+        return resp.text == "1"
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if not self.beat():
+                warning_message('Lease on chromosome {} of claim {} was lost'.format(self.id, self.claim_id))
+                self.lost = True
+                break
+
+    def stop(self):
+        self.stopped.set()
+
+def submit_results(base_url, results, base_delay=1, max_delay=300, timeout=30):
+    """POST a list of results (dicts of column values holding the row `id`)
+        to `/Results`, retrying until the server answers. Retries back off
+        exponentially with full jitter so that workers do not hammer a
+        recovering server in lockstep. Resending is safe: the server only
+        applies a result to a row that is still claimed. Returns the
+        server's answer, or None when it rejects the body as malformed."""
+    attempt = 0
+    while True:
+        try:
+            resp = requests.post(url="http://{}/Results".format(base_url),
+                                 data=json.dumps(results, default=float),
+                                 headers={'Content-Type': 'application/json'},
+                                 timeout=timeout)
+            if resp.status_code == 200:
+                return resp.json()
+            if resp.status_code == 400:
+                # Sending the same body again would not help
+                warning_message('Server rejected the results: {}'.format(resp.text))
+                return None
+            warning_message('Server answered {} to results'.format(resp.status_code))
+        except Exception as e:
+            warning_message('Could not send results: {}'.format(e))
+        delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+        info_message('Retrying in {:.1f} seconds'.format(delay))
+        sleep(delay)
+        attempt = attempt + 1